@@ -0,0 +1,239 @@
+"""Measures how generation, rendering, diffing and the .env handling scale with the number of services.
+
+Run from the repository root with ``python -m benchmarks.bench_scaling``. Every operation is measured on synthetic
+setups with 5, 50, 500 and 2000 dev environments. Wall time is the median of a few runs, peak memory is measured in
+a separate run with tracemalloc, which would distort the timing otherwise.
+
+Store a baseline with ``--save-baseline FILE`` and check for regressions with ``--compare FILE``. The comparison
+exits with 1 if an operation got slower or needs more memory than the threshold allows.
+"""
+import argparse
+import contextlib
+import functools
+import gc
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from src.ComposeManager import ComposeManager
+from src.EnvManager import EnvManager
+from src.Services import OdooComposeService, ProxyComposeService, PostgresComposeService, \
+    KwkhtmltopdfComposeService
+from src.commands.generate_command import generate
+from src.helper import display_diff
+
+SIZES = [5, 50, 500, 2000]
+RUNS = 5
+DEFAULT_THRESHOLD = 1.25
+# Time differences below this are noise of fast operations, not regressions
+NOISE_SECONDS = 0.005
+DOMAIN = 'example.com'
+VERSION = '17.0'
+# The character level diff is quadratic, larger setups would run for minutes
+DISPLAY_DIFF_MAX_SIZE = 50
+
+
+def build_services(size: int) -> list:
+    services = [
+        ProxyComposeService('proxy', DOMAIN),
+        OdooComposeService('live', DOMAIN, '${LIVE_DB_PASSWORD}', 'admin', VERSION, basic_auth=False),
+        OdooComposeService('pre', f'pre.{DOMAIN}', '${PRE_DB_PASSWORD}', 'admin', VERSION),
+        PostgresComposeService('db'),
+        KwkhtmltopdfComposeService('kwkhtmltopdf'),
+    ]
+    services += [OdooComposeService(f'odoo_dev_pr{number}', f'pr{number}.{DOMAIN}',
+                                    f'${{ODOO_DEV_PR{number}_DB_PASSWORD}}', 'admin', VERSION)
+                 for number in range(size)]
+    return services
+
+
+def write_setup(directory: str, size: int):
+    """Writes a docker-compose.yml and .env with the given number of dev environments."""
+    compose_manager = ComposeManager(os.path.join(directory, 'docker-compose.yml'))
+    for service in build_services(size):
+        compose_manager.add_service(service)
+    compose_manager.save()
+
+    env_manager = EnvManager(os.path.join(directory, '.env'))
+    for key, value in [('DOMAIN', DOMAIN), ('VERSION', VERSION), ('DEV', '0'), ('MODULE_MODE', 'included'),
+                       ('MASTER_DB_PASSWORD', 'secret'),
+                       ('LIVE_DB_PASSWORD', 'secret'), ('PRE_DB_PASSWORD', 'secret')]:
+        env_manager.add_value(key, value)
+    for number in range(size):
+        env_manager.add_value(f'ODOO_DEV_PR{number}_DB_PASSWORD', 'secret')
+    env_manager.save()
+
+
+def change_one_service(compose_manager: ComposeManager):
+    service = OdooComposeService('pre', f'pre.{DOMAIN}', '${PRE_DB_PASSWORD}', 'changed', VERSION)
+    compose_manager.update_service(service)
+
+
+def prepare_compose_load(directory: str):
+    return lambda: ComposeManager(os.path.join(directory, 'docker-compose.yml'))
+
+
+def prepare_compose_save(directory: str):
+    compose_manager = ComposeManager(os.path.join(directory, 'docker-compose.yml'))
+    change_one_service(compose_manager)
+    output_path = os.path.join(directory, 'docker-compose.saved.yml')
+    compose_manager.conf_path = output_path
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    return compose_manager.save
+
+
+def prepare_render(directory: str):
+    return ComposeManager(os.path.join(directory, 'docker-compose.yml')).render
+
+
+def prepare_print_diff(directory: str):
+    compose_manager = ComposeManager(os.path.join(directory, 'docker-compose.yml'))
+    change_one_service(compose_manager)
+    return compose_manager.print_diff
+
+
+def prepare_generate_dry(directory: str):
+    compose_manager = ComposeManager(os.path.join(directory, 'docker-compose.yml'))
+    env_manager = EnvManager(os.path.join(directory, '.env'))
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate(compose_manager, env_manager, dry=True)
+    return run
+
+
+def prepare_env_load(directory: str):
+    return lambda: EnvManager(os.path.join(directory, '.env'))
+
+
+def prepare_env_save(directory: str):
+    env_manager = EnvManager(os.path.join(directory, '.env'))
+    env_manager.file_path = os.path.join(directory, '.env.saved')
+    return env_manager.save
+
+
+def prepare_display_diff(directory: str):
+    compose_manager = ComposeManager(os.path.join(directory, 'docker-compose.yml'))
+    source = compose_manager.render()
+    change_one_service(compose_manager)
+    target = compose_manager.render()
+    return lambda: display_diff(source, target)
+
+
+OPERATIONS = {
+    'compose load': prepare_compose_load,
+    'compose save': prepare_compose_save,
+    'render': prepare_render,
+    'print_diff': prepare_print_diff,
+    'generate --dry': prepare_generate_dry,
+    'env load': prepare_env_load,
+    'env save': prepare_env_save,
+    'display_diff': prepare_display_diff,
+}
+
+
+def build_operations(directory: str, size: int) -> dict:
+    """Returns the operations by name. Each one is a function preparing the state and returning the measured call."""
+    return {name: functools.partial(prepare, directory) for name, prepare in OPERATIONS.items()
+            if name != 'display_diff' or size <= DISPLAY_DIFF_MAX_SIZE}
+
+
+def measure_time(prepare, runs: int) -> float:
+    durations = []
+    for _ in range(runs):
+        call = prepare()
+        # Like timeit, keep collections of earlier garbage out of the measurement
+        gc.collect()
+        gc.disable()
+        try:
+            start_time = time.perf_counter()
+            call()
+            durations.append(time.perf_counter() - start_time)
+        finally:
+            gc.enable()
+    return statistics.median(durations)
+
+
+def measure_peak_memory(prepare) -> int:
+    call = prepare()
+    tracemalloc.start()
+    try:
+        call()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(sizes: list, runs: int) -> dict:
+    results = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            write_setup(directory, size)
+            for name, prepare in build_operations(directory, size).items():
+                results[f'{name}[{size}]'] = {
+                    'seconds': measure_time(prepare, runs),
+                    'peak_bytes': measure_peak_memory(prepare),
+                }
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Returns the operations that got slower or need more memory than the threshold allows."""
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            if metric == 'seconds' and result[metric] - baseline[key][metric] < NOISE_SECONDS:
+                continue
+            if baseline[key][metric] and result[metric] / baseline[key][metric] > threshold:
+                regressions.append(f'{key} {metric}: {baseline[key][metric]:.6g} -> {result[metric]:.6g}')
+    return regressions
+
+
+def print_results(results: dict, baseline: dict = None):
+    for key, result in results.items():
+        line = f'{key:<28} {result["seconds"] * 1000:10.2f} ms {result["peak_bytes"] / (1024 * 1024):9.2f} MB'
+        if baseline and key in baseline and baseline[key]['seconds']:
+            line += f'   {result["seconds"] / baseline[key]["seconds"]:5.2f}x time'
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--runs', type=int, default=RUNS)
+    parser.add_argument('--save-baseline', metavar='FILE', help='Write the results to FILE.')
+    parser.add_argument('--compare', metavar='FILE', help='Compare the results with the baseline in FILE.')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Allowed ratio to the baseline before an operation counts as regression.')
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.runs)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f'Regression: {regression}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,35 @@
+"""Measures the startup time of the CLI.
+
+Run from the repository root with ``python -m benchmarks.bench_startup``.
+"""
+import statistics
+import subprocess
+import sys
+import time
+
+RUNS = 10
+
+SCENARIOS = {
+    # What every command paid before the heavy modules were imported lazily
+    'import (eager)': [sys.executable, '-c', 'import docker, psycopg, yaml; import src.main'],
+    'import (lazy)': [sys.executable, '-c', 'import src.main'],
+    'generate --help': [sys.executable, '-m', 'src.main', 'generate', '--help'],
+}
+
+
+def measure(command: list, runs: int = RUNS) -> float:
+    durations = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        subprocess.run(command, check=True, capture_output=True)
+        durations.append(time.perf_counter() - start_time)
+    return statistics.median(durations)
+
+
+def main():
+    for name, command in SCENARIOS.items():
+        print(f'{name:<20} {measure(command) * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
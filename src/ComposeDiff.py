@@ -0,0 +1,189 @@
+import json
+from typing import NamedTuple
+
+import click
+
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+MISSING = object()
+
+
+class KeyChange(NamedTuple):
+    key: str
+    status: str
+    old: object = None
+    new: object = None
+    # Element changes of list values like labels and environment
+    added: list = None
+    removed: list = None
+
+    def to_dict(self) -> dict:
+        if self.added is not None:
+            return {'key': self.key, 'status': self.status, 'added': self.added, 'removed': self.removed}
+        return {'key': self.key, 'status': self.status, 'old': self.old, 'new': self.new}
+
+
+class ServiceChange(NamedTuple):
+    name: str
+    status: str
+    changes: list = []
+
+
+def _hashable(value):
+    return json.dumps(value, sort_keys=True) if isinstance(value, (dict, list)) else value
+
+
+def diff_lists(key: str, old: list, new: list, changes: list):
+    old_elements = {_hashable(element) for element in old}
+    new_elements = {_hashable(element) for element in new}
+    added = [element for element in new if _hashable(element) not in old_elements]
+    removed = [element for element in old if _hashable(element) not in new_elements]
+    if added or removed or old != new:
+        changes.append(KeyChange(key, CHANGED, added=added, removed=removed))
+
+
+def diff_values(key: str, old, new, changes: list):
+    """Adds the changes between two values to changes. Mappings are compared key by key and lists element by element,
+    so every value is only looked at once."""
+    if old is MISSING:
+        changes.append(KeyChange(key, ADDED, new=new))
+    elif new is MISSING:
+        changes.append(KeyChange(key, REMOVED, old=old))
+    elif isinstance(old, dict) and isinstance(new, dict):
+        for sub_key in list(old) + [sub_key for sub_key in new if sub_key not in old]:
+            diff_values(f'{key}.{sub_key}' if key else str(sub_key), old.get(sub_key, MISSING),
+                        new.get(sub_key, MISSING), changes)
+    elif isinstance(old, list) and isinstance(new, list):
+        diff_lists(key, old, new, changes)
+    elif old != new:
+        changes.append(KeyChange(key, CHANGED, old=old, new=new))
+
+
+class ComposeDiff:
+    """Structural difference between two compose configurations, service by service and key by key."""
+
+    def __init__(self, source: dict, target: dict):
+        source_services = source.get('services') or {}
+        target_services = target.get('services') or {}
+
+        self.services = []
+        for name, service in source_services.items():
+            if name not in target_services:
+                self.services.append(ServiceChange(name, REMOVED))
+                continue
+            changes = []
+            diff_values('', service, target_services[name], changes)
+            if changes:
+                self.services.append(ServiceChange(name, CHANGED, changes))
+        self.services += [ServiceChange(name, ADDED) for name in target_services if name not in source_services]
+
+        self.top_level = []
+        diff_values('', {key: value for key, value in source.items() if key != 'services'},
+                    {key: value for key, value in target.items() if key != 'services'}, self.top_level)
+
+    def __bool__(self):
+        return bool(self.services or self.top_level)
+
+    def services_with_status(self, *statuses) -> list:
+        return [service.name for service in self.services if service.status in statuses]
+
+    def to_dict(self) -> dict:
+        return {
+            'services': {
+                ADDED: self.services_with_status(ADDED),
+                REMOVED: self.services_with_status(REMOVED),
+                CHANGED: {service.name: [change.to_dict() for change in service.changes]
+                          for service in self.services if service.status == CHANGED},
+            },
+            'top_level': [change.to_dict() for change in self.top_level],
+        }
+
+    def render_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=4)
+
+    @staticmethod
+    def _render_change(change: KeyChange, indent: str) -> list:
+        if change.status == ADDED:
+            return [click.style(f'{indent}+ {change.key}: {change.new}', fg='green')]
+        if change.status == REMOVED:
+            return [click.style(f'{indent}- {change.key}: {change.old}', fg='red')]
+        if change.added is None:
+            return [f'{indent}~ {change.key}: ' + click.style(str(change.old), fg='red') + ' -> '
+                    + click.style(str(change.new), fg='green')]
+
+        lines = [f'{indent}~ {change.key}:']
+        lines += [click.style(f'{indent}    - {element}', fg='red') for element in change.removed]
+        lines += [click.style(f'{indent}    + {element}', fg='green') for element in change.added]
+        if not change.added and not change.removed:
+            lines.append(f'{indent}    (order changed)')
+        return lines
+
+    def render(self) -> str:
+        if not self:
+            return 'No changes.'
+
+        lines = []
+        for change in self.top_level:
+            lines += self._render_change(change, '')
+        for service in self.services:
+            if service.status == ADDED:
+                lines.append(click.style(f'+ service {service.name}', fg='green'))
+            elif service.status == REMOVED:
+                lines.append(click.style(f'- service {service.name}', fg='red'))
+            else:
+                lines.append(f'~ service {service.name}')
+                for change in service.changes:
+                    lines += self._render_change(change, '    ')
+        return '\n'.join(lines)
+
+
+class ApplyPlan(NamedTuple):
+    # Services whose definition was added or changed
+    changed: list
+    # Unchanged services that depend on a changed service
+    dependents: list
+    removed: list
+
+    @property
+    def services(self) -> list:
+        return self.changed + self.dependents
+
+    def __bool__(self):
+        return bool(self.changed or self.dependents or self.removed)
+
+    def render(self) -> str:
+        if not self:
+            return 'No services need to be recreated.'
+        lines = [f'Recreate {name}' for name in self.changed]
+        lines += [f'Recreate {name} (depends on a changed service)' for name in self.dependents]
+        lines += [f'Remove {name}' for name in self.removed]
+        return '\n'.join(lines)
+
+
+def _get_dependencies(service: dict) -> list:
+    # depends_on is either a list of services or a mapping of services to conditions
+    return list(service.get('depends_on') or [])
+
+
+def find_dependents(services: dict, names: list) -> list:
+    """Returns all services that directly or transitively depend on one of the given services."""
+    dependents_by_service = {}
+    for name, service in services.items():
+        for dependency in _get_dependencies(service):
+            dependents_by_service.setdefault(dependency, []).append(name)
+
+    found = set()
+    pending = list(names)
+    while pending:
+        for dependent in dependents_by_service.get(pending.pop(), []):
+            if dependent not in found and dependent not in names:
+                found.add(dependent)
+                pending.append(dependent)
+    return [name for name in services if name in found]
+
+
+def plan_apply(diff: ComposeDiff, config: dict) -> ApplyPlan:
+    services = config.get('services') or {}
+    changed = diff.services_with_status(CHANGED, ADDED)
+    return ApplyPlan(changed, find_dependents(services, changed), diff.services_with_status(REMOVED))
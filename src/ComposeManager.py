@@ -1,14 +1,25 @@
-import copy
 import os.path
 import subprocess
 from typing import Union
 
 import click
-import yaml
 
+from src.ComposeDiff import ComposeDiff, ApplyPlan, plan_apply
+from src.DockerBackend import get_container_backend
 from src.Services import ComposeService
 from src.errors import ServiceAlreadyExistsException, ServiceDoesNotExistException
-from src.helper import display_diff
+from src.helper import lazy_import
+
+yaml = lazy_import('yaml')
+
+
+def load_yaml(text: str):
+    # The libyaml bindings are several times faster than the pure python implementation
+    return yaml.load(text, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+
+def dump_yaml(data) -> str:
+    return yaml.dump(data, Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper), default_flow_style=False)
 
 
 class ComposeManager:
@@ -16,9 +27,10 @@ class ComposeManager:
     def __init__(self, file_path: str = 'docker-compose.yml'):
         self.initiated = False
         self.conf_path = file_path
+        self._source_text = None
+        self._source_config = None
         config = self._get_config()
         self.config = config
-        self.source_config = copy.deepcopy(config)
         self.services = self.config['services']
 
     def _get_config(self) -> dict:
@@ -27,20 +39,61 @@ class ComposeManager:
 
         with open(self.conf_path, 'r') as file:
             self.initiated = True
-            config = yaml.safe_load(file)
-
-        return config
+            self._source_text = file.read()
+
+        return load_yaml(self._source_text)
+
+    @property
+    def source_config(self) -> dict:
+        """The configuration as it is in the file. Parsed again on first use instead of copying every loaded config."""
+        if self._source_config is None:
+            if self._source_text is None:
+                self._source_config = {"version": "3.8", "services": {}}
+            else:
+                self._source_config = load_yaml(self._source_text)
+        return self._source_config
+
+    def save(self) -> bool:
+        """Writes the configuration. The file is left untouched if its content would not change, so its mtime only
+        changes with the configuration. Returns whether the file was written."""
+        rendered = self.render()
+        self.initiated = True
+        if rendered == self._source_text:
+            return False
 
-    def save(self):
         with open(self.conf_path, 'w') as file:
-            yaml.dump(self.config, file, default_flow_style=False)
-        self.initiated = True
+            file.write(rendered)
+        self._source_text = rendered
+        self._source_config = None
+        return True
 
     def render(self) -> str:
-        return yaml.dump(self.config, default_flow_style=False)
+        return dump_yaml(self.config)
+
+    def diff(self) -> ComposeDiff:
+        return ComposeDiff(self.source_config, self.config)
 
     def print_diff(self) -> str:
-        return display_diff(yaml.dump(self.source_config, default_flow_style=False), self.render())
+        return self.diff().render()
+
+    def plan_apply(self) -> ApplyPlan:
+        """Returns the services that have to be recreated to apply the configuration, the changed ones and the ones
+        that depend on them."""
+        return plan_apply(self.diff(), self.config)
+
+    @staticmethod
+    def apply(plan: ApplyPlan) -> bool:
+        """Recreates only the services of the plan, all other containers keep running untouched."""
+        try:
+            if plan.removed:
+                get_container_backend().remove(plan.removed)
+            if plan.services:
+                get_container_backend().up(plan.services, options=['--no-deps', '--force-recreate'])
+            click.echo("Changes applied successfully.")
+            return True
+        except subprocess.CalledProcessError as e:
+            click.echo(f"Failed to apply changes: {e}", err=True)
+            raise
 
     def add_service(self, service: ComposeService):
         if service.name in self.services:
@@ -65,17 +118,21 @@ class ComposeManager:
             raise ServiceDoesNotExistException(f'The service {service_name} does not exist.')
         del self.services[service_name]
 
+    def set_volume(self, volume_name: str, config: dict):
+        self.config.setdefault('volumes', {})[volume_name] = config
+
+    def remove_volume(self, volume_name: str):
+        """Removes the top level volume if it exists."""
+        volumes = self.config.get('volumes') or {}
+        volumes.pop(volume_name, None)
+        if not volumes and 'volumes' in self.config:
+            del self.config['volumes']
+
     @staticmethod
     def up(services: Union[bool, list] = False):
-        if services:
-            # Only start the services specified
-            command = ['docker', 'compose', 'up', '-d'] + list(services)
-        else:
-            # Start all services
-            command = ['docker', 'compose', 'up', '-d']
-
         try:
-            subprocess.check_call(command)
+            # Without services all services are started
+            get_container_backend().up(list(services) if services else None)
             click.echo("Services started successfully.")
             return True
         except subprocess.CalledProcessError as e:
@@ -84,15 +141,9 @@ class ComposeManager:
 
     @staticmethod
     def stop(services: Union[bool, list] = False):
-        if services:
-            # Only sop the services specified
-            command = ['docker', 'compose', 'stop'] + list(services)
-        else:
-            # Stop all services
-            command = ['docker', 'compose', 'stop']
-
         try:
-            subprocess.check_call(command)
+            # Without services all services are stopped
+            get_container_backend().stop(list(services) if services else None)
             click.echo("Services stopped successfully.")
             return True
         except subprocess.CalledProcessError as e:
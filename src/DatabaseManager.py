@@ -1,57 +1,282 @@
+import atexit
+import os
 import subprocess
+import tempfile
 import uuid
 
-import psycopg
+from src.DockerBackend import get_container_backend
+from src.constants import DB_USER, DEFAULT_DB
+from src.errors import OperationOnDatabaseDeniedException, DatabaseAlreadyExistsException, \
+    StreamingNotPossibleException
+from src.helper import lazy_import
+from src.timings import span
 
-from src.errors import OperationOnDatabaseDeniedException, DatabaseAlreadyExistsException
+psycopg = lazy_import('psycopg')
 
 DB_PORT = 5432
+STREAM_CHUNK_SIZE = 1024 * 1024  # 1 MB
+DEFAULT_JOBS = os.cpu_count() or 1
 
 try:
     from typing import Self
-except ImportError: # pragma: no cover
+except ImportError:  # pragma: no cover
     from typing import TypeVar
     Self = TypeVar("Self")
 
+# Open connections by connection string, shared by all DatabaseManager instances of the process
+_connection_pool = {}
+
+
+def close_connections(name: str = None):
+    """Closes the pooled connections, only the ones to the given database if a name is passed."""
+    for key in [key for key in _connection_pool if name is None or key[0] == name]:
+        _connection_pool.pop(key).close()
+
+
+atexit.register(close_connections)
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class ExecCatalogBackend:
+    """Manages databases with the postgres client tools inside the db container."""
+
+    def exists(self, name: str) -> bool:
+        # Check if database exists but also check for other errors
+        result = get_container_backend().exec('db', ['sh', '-c', f'psql -lqt | cut -d \\| -f 1 | grep -qw {name}'])
+
+        return result.returncode == 0
+
+    def create(self, name: str, user: str, template: str = None, owner: str = None):
+        options = ''
+        if template:
+            options += f'-T {template} '
+        if owner:
+            options += f'-O {owner} '
+        result = get_container_backend().exec('db', ['sh', '-c', f'createdb -U {user} {options}{name}'])
+
+        result.check_returncode()
+
+    def drop(self, name: str):
+        result = get_container_backend().exec('db', ['sh', '-c', f'dropdb --if-exists -U postgres {name}'])
+
+        result.check_returncode()
+
+
+class SqlCatalogBackend:
+    """Manages databases with SQL on a pooled connection to the maintenance database, which avoids starting a
+    docker exec session and a shell for every check. Falls back to the exec backend if the server is not reachable."""
+
+    def __init__(self, password: str, port: int = DB_PORT, fallback: ExecCatalogBackend = None):
+        self.password = password
+        self.port = port
+        self.fallback = fallback or ExecCatalogBackend()
+        self.reachable = True
+
+    def _get_manager(self):
+        """Returns a manager connected to the maintenance database or None if the server cannot be reached."""
+        if not self.reachable:
+            return None
+        manager = DatabaseManager(DEFAULT_DB, DB_USER, self.password, self.port)
+        try:
+            manager._get_connection()
+        except psycopg.OperationalError:
+            self.reachable = False
+            return None
+        return manager
+
+    def exists(self, name: str) -> bool:
+        manager = self._get_manager()
+        if manager is None:
+            return self.fallback.exists(name)
+        cursor = manager._run_sql_command('SELECT 1 FROM pg_database WHERE datname = %s;', params=(name,))
+        return cursor.fetchone() is not None
+
+    def create(self, name: str, user: str, template: str = None, owner: str = None):
+        manager = self._get_manager()
+        if manager is None:
+            return self.fallback.create(name, user, template=template, owner=owner)
+        statement = f'CREATE DATABASE {quote_identifier(name)} OWNER {quote_identifier(owner or user)}'
+        if template:
+            statement += f' TEMPLATE {quote_identifier(template)}'
+        # CREATE DATABASE cannot run inside a transaction
+        manager._run_sql_command(f'{statement};', autocommit=True)
+
+    def drop(self, name: str):
+        manager = self._get_manager()
+        if manager is None:
+            return self.fallback.drop(name)
+        manager._run_sql_command('SELECT pg_terminate_backend(pid) FROM pg_stat_activity '
+                                 'WHERE datname = %s AND pid <> pg_backend_pid();', params=(name,))
+        statement = f'DROP DATABASE IF EXISTS {quote_identifier(name)}'
+        # FORCE also terminates sessions that connect between the termination and the drop
+        if manager._get_connection().info.server_version >= 130000:
+            statement += ' WITH (FORCE)'
+        manager._run_sql_command(f'{statement};', autocommit=True)
+
+
+_catalog_backend = ExecCatalogBackend()
+
+
+def configure_catalog_backend(backend) -> None:
+    """Sets the backend used to check, create and drop databases."""
+    global _catalog_backend
+    _catalog_backend = backend
+
 
 class DatabaseManager:
     def __init__(self, name: str, user: str, password: str, port: str = DB_PORT):
         self.name = name
-        self.exists = self.db_exists(self.name)
+        self._exists = None
         self.user = user
         self.password = password
         self.port = port
 
+    @property
+    def exists(self) -> bool:
+        """Whether the database exists. Only checked on first access, not for every created manager."""
+        if self._exists is None:
+            self._exists = self.db_exists(self.name)
+        return self._exists
+
+    @exists.setter
+    def exists(self, value: bool):
+        self._exists = value
+
     def _connect(self):
         return psycopg.connect(
             f"host=127.0.0.1 port={self.port} dbname={self.name} user={self.user} password={self.password}")
 
-    def _run_sql_command(self, sql: str, autocommit: bool = False):
-        with self._connect() as conn:
+    def _get_connection(self):
+        """Returns a pooled connection, so consecutive statements do not pay for a new connection each."""
+        key = (self.name, self.user, self.password, self.port)
+        connection = _connection_pool.get(key)
+        if connection is None or connection.closed:
+            connection = self._connect()
+            _connection_pool[key] = connection
+        return connection
+
+    def _discard_connection(self, connection):
+        key = (self.name, self.user, self.password, self.port)
+        if _connection_pool.get(key) is connection:
+            del _connection_pool[key]
+        connection.close()
+
+    def _run_sql_command(self, sql: str, autocommit: bool = False, params=None):
+        conn = self._get_connection()
+        try:
             conn.autocommit = autocommit
-            cursor = conn.execute(sql.encode())
+            cursor = conn.execute(sql.encode(), params)
             conn.commit()
+        except psycopg.OperationalError:
+            self._discard_connection(conn)
+            raise
+        except Exception:
+            conn.rollback()
+            raise
         return cursor
 
-    def dump_db(self, destination_path: str) -> str:
-        path = f'{destination_path}/{self.name}_{uuid.uuid4()}.dump'
+    def run_batch(self, statements: list) -> list:
+        """Runs all statements in a single transaction on one connection. Either all of them are applied or none.
 
-        result = subprocess.run(
-            ['docker', 'compose', 'exec', 'db', 'sh', '-c', f'pg_dump -U postgres -Fc {self.name} > {path}'],
-            capture_output=True, text=True)
+        Returns the rows of every statement, or None for statements without a result."""
+        conn = self._get_connection()
+        results = []
+        try:
+            conn.autocommit = False
+            with conn.transaction():
+                for statement in statements:
+                    cursor = conn.execute(statement.encode())
+                    results.append(cursor.fetchall() if cursor.description else None)
+        except psycopg.OperationalError:
+            self._discard_connection(conn)
+            raise
+        return results
+
+    def existing_tables(self, table_names: list) -> set:
+        cursor = self._run_sql_command(
+            "SELECT table_name FROM information_schema.tables WHERE table_schema = 'public' AND table_name = ANY(%s);",
+            params=(list(table_names),))
+        return {row[0] for row in cursor.fetchall()}
+
+    def dump_db(self, destination_path: str, jobs: int = None) -> str:
+        """Dumps the database into the db container. With jobs a directory format dump is written in parallel."""
+        if jobs:
+            path = f'{destination_path}/{self.name}_{uuid.uuid4()}.dir'
+            command = f'pg_dump -U postgres -Fd -j {jobs} -f {path} {self.name}'
+        else:
+            path = f'{destination_path}/{self.name}_{uuid.uuid4()}.dump'
+            command = f'pg_dump -U postgres -Fc {self.name} > {path}'
+
+        with span(f'pg_dump {self.name}'):
+            result = get_container_backend().exec('db', ['sh', '-c', command])
 
         result.check_returncode()
 
         return path
 
+    def stream_to(self, name: str, user: str) -> int:
+        """Pipes a dump of this database directly into a new database without writing an intermediate file.
+
+        Returns the number of bytes that were transferred."""
+        if self.db_exists(name):
+            raise DatabaseAlreadyExistsException('Database already exists')
+
+        with tempfile.TemporaryFile() as dump_stderr, tempfile.TemporaryFile() as restore_stderr:
+            try:
+                dump = get_container_backend().exec_stream('db', ['pg_dump', '-U', 'postgres', '-Fc', self.name],
+                                                           stdout=subprocess.PIPE, stderr=dump_stderr)
+            except OSError as e:
+                raise StreamingNotPossibleException(f'Could not start pg_dump: {e}') from e
+
+            first_chunk = dump.stdout.read(STREAM_CHUNK_SIZE)
+            if not first_chunk:
+                dump.wait()
+                raise StreamingNotPossibleException(
+                    f'pg_dump produced no output (exit code {dump.returncode})')
+
+            self.create_db(name, user)
+            restore = get_container_backend().exec_stream(
+                'db', ['pg_restore', '--clean', '--if-exists', '--no-acl', '--no-owner', '-d', name, '-U', user],
+                stdin=subprocess.PIPE, stderr=restore_stderr)
+
+            transferred = 0
+            chunk = first_chunk
+            checked = ((dump, dump_stderr), (restore, restore_stderr))
+            try:
+                while chunk:
+                    restore.stdin.write(chunk)
+                    transferred += len(chunk)
+                    chunk = dump.stdout.read(STREAM_CHUNK_SIZE)
+            except BrokenPipeError:
+                # pg_restore exited early, its return code below tells us why. pg_dump is killed by us, so its
+                # return code says nothing.
+                dump.kill()
+                dump.wait()
+                checked = ((restore, restore_stderr),)
+            finally:
+                try:
+                    restore.stdin.close()
+                except BrokenPipeError:
+                    pass  # Buffered data pg_restore no longer reads
+                dump.stdout.close()
+
+            for process, stderr in checked:
+                if process.wait() != 0:
+                    stderr.seek(0)
+                    raise subprocess.CalledProcessError(process.returncode, process.args,
+                                                        stderr=stderr.read().decode(errors='replace'))
+
+        return transferred
+
     def drop_db(self) -> bool:
         if self.name == 'live':
             raise OperationOnDatabaseDeniedException('Cannot drop live database')
-        result = subprocess.run(
-            ['docker', 'compose', 'exec', 'db', 'sh', '-c', f'dropdb --if-exists -U postgres {self.name}'],
-            capture_output=True, text=True)
-
-        result.check_returncode()
+        # Our own pooled connections would block the drop
+        close_connections(self.name)
+        _catalog_backend.drop(self.name)
 
         self.exists = False
 
@@ -68,14 +293,28 @@ class DatabaseManager:
         return True
 
     @classmethod
-    def from_dump(cls, name: str, user: str, password: str, path: str) -> Self:
+    def from_template(cls, name: str, user: str, password: str, template: str) -> Self:
+        """Creates the database as a file level copy of the template database."""
+        if cls.db_exists(name):
+            raise DatabaseAlreadyExistsException('Database already exists')
+
+        # Postgres refuses to copy a template while other sessions are connected to it
+        cls.terminate_sessions(template)
+        with span(f'create {name} from template {template}'):
+            cls.create_db(name, 'postgres', template=template, owner=user)
+
+        return cls(name, user, password)
+
+    @classmethod
+    def from_dump(cls, name: str, user: str, password: str, path: str, jobs: int = None) -> Self:
         if cls.db_exists(name):
             raise DatabaseAlreadyExistsException('Database already exists')
 
         cls.create_db(name, user)
-        result = subprocess.run(['docker', 'compose', 'exec', 'db', 'sh', '-c',
-                                 f'pg_restore --clean --if-exists --no-acl --no-owner -d {name} -U {user} {path}'],
-                                capture_output=True, text=True)
+        jobs_option = f'-j {jobs} ' if jobs else ''
+        with span(f'pg_restore {name}'):
+            result = get_container_backend().exec('db', ['sh', '-c', f'pg_restore {jobs_option}--clean --if-exists '
+                                                                     f'--no-acl --no-owner -d {name} -U {user} {path}'])
 
         result.check_returncode()
 
@@ -83,24 +322,70 @@ class DatabaseManager:
 
     @staticmethod
     def db_exists(name: str) -> bool:
-        # Check if database exists but also check for other errors
-        result = subprocess.run(
-            ['docker', 'compose', 'exec', 'db', 'sh', '-c', f'psql -lqt | cut -d \| -f 1 | grep -qw {name}'],
-            capture_output=True, text=True)
+        return _catalog_backend.exists(name)
 
-        return result.returncode == 0
+    @staticmethod
+    def create_db(name: str, user: str, template: str = None, owner: str = None) -> bool:
+        _catalog_backend.create(name, user, template=template, owner=owner)
+
+        return True
 
     @staticmethod
-    def create_db(name: str, user: str) -> bool:
-        result = subprocess.run(['docker', 'compose', 'exec', 'db', 'sh', '-c', f'createdb -U {user} {name}'],
-                                capture_output=True, text=True)
+    def _run_psql(sql: str) -> subprocess.CompletedProcess:
+        result = get_container_backend().exec('db', ['psql', '-U', 'postgres', '-c', sql])
 
         result.check_returncode()
 
+        return result
+
+    @classmethod
+    def terminate_sessions(cls, name: str) -> bool:
+        cls._run_psql(f"SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+                      f"WHERE datname = '{name}' AND pid <> pg_backend_pid();")
         return True
 
+    @classmethod
+    def rename_db(cls, name: str, new_name: str) -> bool:
+        if name == 'live':
+            raise OperationOnDatabaseDeniedException('Cannot rename live database')
+        cls.terminate_sessions(name)
+        cls._run_psql(f'ALTER DATABASE {name} RENAME TO {new_name};')
+        return True
+
+    @classmethod
+    def set_allow_connections(cls, name: str, allow: bool) -> bool:
+        cls._run_psql(f'ALTER DATABASE {name} WITH ALLOW_CONNECTIONS {"true" if allow else "false"};')
+        return True
+
+    def reassign_objects(self, owner: str):
+        """Transfers all tables, views and standalone sequences in the public schema to the given role."""
+        self._run_sql_command(f"""DO $$
+DECLARE
+    r record;
+BEGIN
+    FOR r IN SELECT format('ALTER %s %I.%I OWNER TO %I',
+                           CASE c.relkind WHEN 'S' THEN 'SEQUENCE' WHEN 'v' THEN 'VIEW'
+                                          WHEN 'm' THEN 'MATERIALIZED VIEW' ELSE 'TABLE' END,
+                           n.nspname, c.relname, '{owner}') AS statement
+             FROM pg_class c
+             JOIN pg_namespace n ON n.oid = c.relnamespace
+             WHERE n.nspname = 'public'
+               AND c.relkind IN ('r', 'p', 'v', 'm', 'S')
+               -- Sequences owned by a column follow their table
+               AND NOT EXISTS (SELECT 1 FROM pg_depend d
+                               WHERE d.objid = c.oid AND c.relkind = 'S' AND d.deptype IN ('a', 'i'))
+    LOOP
+        EXECUTE r.statement;
+    END LOOP;
+END $$;""", True)
+
     def add_user(self, name: str, password: str):
         self._run_sql_command(f"""CREATE ROLE {name} LOGIN CREATEDB PASSWORD \'{password}\'""", True)
 
+    def add_users(self, users: dict):
+        """Creates the roles of all users by name and password in one transaction on one connection."""
+        self.run_batch([f"""CREATE ROLE {name} LOGIN CREATEDB PASSWORD \'{password}\'"""
+                        for name, password in users.items()])
+
     def remove_user(self, name: str):
         self._run_sql_command(f"""DROP ROLE IF EXISTS {name}""", True)
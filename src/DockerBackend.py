@@ -0,0 +1,283 @@
+import fnmatch
+import io
+import os
+import subprocess
+import tarfile
+import time
+from typing import NamedTuple
+
+from src.helper import docker, get_docker_client, format_throughput
+
+BACKEND_CLI = 'cli'
+BACKEND_SDK = 'sdk'
+BACKENDS = [BACKEND_CLI, BACKEND_SDK]
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+PROGRESS_INTERVAL = 5  # seconds
+
+
+class ExtractReport(NamedTuple):
+    files: int
+    bytes: int
+    seconds: float
+    # Files that were already present when resuming
+    skipped: int = 0
+
+    def __str__(self):
+        files_per_second = self.files / self.seconds if self.seconds > 0 else 0.0
+        skipped = f', skipped {self.skipped} present files' if self.skipped else ''
+        return f'{self.files} files, {format_throughput(self.bytes, self.seconds)}, {files_per_second:.0f} files/s' \
+               f'{skipped}'
+
+
+class ChunkReader(io.RawIOBase):
+    """File like wrapper around an iterator of byte chunks, so tarfile can read a streamed archive."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.buffer:
+            try:
+                self.buffer = memoryview(next(self.chunks))
+            except StopIteration:
+                return 0
+        size = min(len(b), len(self.buffer))
+        b[:size] = self.buffer[:size]
+        # A view of the rest instead of copying it for every read of tarfile
+        self.buffer = self.buffer[size:]
+        return size
+
+
+def _rename_top_level(name: str, new_top_level: str) -> str:
+    _, _, rest = name.partition('/')
+    return f'{new_top_level}/{rest}' if rest else new_top_level
+
+
+def matches(relative_path: str, patterns: list) -> bool:
+    """Whether the path or one of its directories matches one of the glob patterns, e.g. '*.pyc' or 'tests'."""
+    parts = relative_path.split('/')
+    return any(fnmatch.fnmatchcase(relative_path, pattern) or any(fnmatch.fnmatchcase(part, pattern) for part in parts)
+               for pattern in patterns)
+
+
+def is_selected(relative_path: str, include: list = None, exclude: list = None) -> bool:
+    if not relative_path:
+        return True  # The top level entry is the destination itself
+    if exclude and matches(relative_path, exclude):
+        return False
+    return not include or matches(relative_path, include)
+
+
+def is_present(member: tarfile.TarInfo, path: str) -> bool:
+    try:
+        stat = os.lstat(path)
+    except FileNotFoundError:
+        return False
+    return stat.st_size == member.size and int(stat.st_mtime) == int(member.mtime)
+
+
+def is_linked(path: str, target: str) -> bool:
+    try:
+        return os.path.samefile(path, target)
+    except FileNotFoundError:
+        return False
+
+
+def extract_archive(chunks, destination: str, include: list = None, exclude: list = None, resume: bool = False,
+                    progress=None) -> ExtractReport:
+    """Extracts a tar stream as returned by the archive endpoint of docker while it is read. The top level entry of the
+    archive, the copied file or directory, becomes the destination.
+
+    Files are only extracted if they match one of the include patterns and none of the exclude patterns. With resume,
+    files that are present with the same size and mtime are skipped, so an interrupted copy continues where it
+    stopped. progress is called with the report so far every few seconds."""
+    parent_dir = os.path.dirname(os.path.abspath(destination))
+    top_level = os.path.basename(os.path.normpath(destination))
+    os.makedirs(parent_dir, exist_ok=True)
+    extract_options = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
+
+    start_time = last_progress = time.monotonic()
+    files = num_bytes = skipped = 0
+    with tarfile.open(fileobj=ChunkReader(chunks), mode='r|') as archive:
+        for member in archive:
+            relative_path = member.name.partition('/')[2]
+            # Directories are always created, include patterns select the files in them
+            if not is_selected(relative_path, None if member.isdir() else include, exclude):
+                continue
+            if member.islnk() and not is_selected(member.linkname.partition('/')[2], include, exclude):
+                continue  # The target of the hardlink was not extracted
+
+            member.name = _rename_top_level(member.name, top_level)
+            if member.islnk():
+                member.linkname = _rename_top_level(member.linkname, top_level)
+            path = os.path.join(parent_dir, member.name)
+            if resume and (member.isfile() and is_present(member, path)
+                           or member.islnk() and is_linked(path, os.path.join(parent_dir, member.linkname))):
+                skipped += 1
+                continue
+            if not member.isdir() and os.path.lexists(path) and not os.path.isdir(path):
+                # Replaced instead of written in place, the file may be a hardlink shared with other trees, e.g. of
+                # the SourceCache, and linking fails if the path exists
+                os.unlink(path)
+            archive.extract(member, path=parent_dir, **extract_options)
+            if member.isfile():
+                files += 1
+                num_bytes += member.size
+
+            if progress is not None and time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                last_progress = time.monotonic()
+                progress(ExtractReport(files, num_bytes, last_progress - start_time, skipped))
+
+    return ExtractReport(files, num_bytes, time.monotonic() - start_time, skipped)
+
+
+class ComposeCliBackend:
+    """Runs container operations with the docker compose command line tool."""
+
+    def connect(self):
+        """Nothing to prepare, every operation starts the CLI."""
+
+    def exec(self, service: str, command: list) -> subprocess.CompletedProcess:
+        return subprocess.run(['docker', 'compose', 'exec', service] + command, capture_output=True, text=True)
+
+    def exec_stream(self, service: str, command: list, **kwargs) -> subprocess.Popen:
+        """Starts the command in the container and returns its process. Its input and output are passed like for
+        Popen, e.g. stdout=subprocess.PIPE, so large data can be streamed through it."""
+        return subprocess.Popen(['docker', 'compose', 'exec', '-T', service] + command, **kwargs)
+
+    def get_archive(self, service: str, src_path: str):
+        """Yields the path in the container as chunks of a tar stream. Raises CalledProcessError if it cannot be
+        copied."""
+        args = ['docker', 'compose', 'cp', f'{service}:{src_path}', '-']
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            chunk = process.stdout.read(ARCHIVE_CHUNK_SIZE)
+            if not chunk:
+                stderr = process.stderr.read()
+                raise subprocess.CalledProcessError(process.wait() or 1, args, stderr=stderr.decode(errors='replace'))
+            while chunk:
+                yield chunk
+                chunk = process.stdout.read(ARCHIVE_CHUNK_SIZE)
+        finally:
+            # The archive is not read to the end if the extraction stopped
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            process.stdout.close()
+            process.stderr.close()
+
+    def image_id(self, service: str) -> str:
+        """Returns the id of the image the container of the service runs, the digest of its content."""
+        return subprocess.check_output(['docker', 'inspect', '--format', '{{.Image}}', service], text=True).strip()
+
+    def up(self, services: list = None, options: list = None):
+        subprocess.check_call(['docker', 'compose', 'up', '-d'] + list(options or []) + list(services or []))
+
+    def stop(self, services: list = None):
+        subprocess.check_call(['docker', 'compose', 'stop'] + list(services or []))
+
+    def remove(self, services: list):
+        # Removed services are no longer part of the compose project, so their containers are removed by name
+        subprocess.check_call(['docker', 'rm', '--force'] + list(services))
+
+
+class DockerSdkBackend:
+    """Runs container operations in process through the docker API instead of starting the compose CLI for each one.
+    The containers are addressed by name, which is the service name (see ComposeService.to_dict).
+
+    Everything that needs the compose project, like creating containers, is passed on to the fallback backend."""
+
+    def __init__(self, fallback: ComposeCliBackend = None):
+        self.fallback = fallback or ComposeCliBackend()
+
+    def connect(self):
+        """Creates the docker client, which should be done before operations run in several threads."""
+        get_docker_client()
+
+    def exec(self, service: str, command: list) -> subprocess.CompletedProcess:
+        api = get_docker_client().api
+        args = ['docker', 'exec', service] + command
+        try:
+            exec_id = api.exec_create(service, command)['Id']
+        except docker.errors.NotFound:
+            return self.fallback.exec(service, command)
+        except docker.errors.APIError as e:
+            # e.g. the container is not running, reported like a failed command of the CLI backend
+            return subprocess.CompletedProcess(args, 1, '', str(e))
+
+        stdout, stderr = [], []
+        for out, err in api.exec_start(exec_id, stream=True, demux=True):
+            if out:
+                stdout.append(out)
+            if err:
+                stderr.append(err)
+        exit_code = api.exec_inspect(exec_id)['ExitCode']
+
+        return subprocess.CompletedProcess(args, exit_code, b''.join(stdout).decode(errors='replace'),
+                                           b''.join(stderr).decode(errors='replace'))
+
+    def exec_stream(self, service: str, command: list, **kwargs) -> subprocess.Popen:
+        # The API multiplexes the streams of an exec on one socket, pipes of a process are passed on more easily
+        return self.fallback.exec_stream(service, command, **kwargs)
+
+    def get_archive(self, service: str, src_path: str):
+        try:
+            chunks, _ = get_docker_client().api.get_archive(service, src_path, chunk_size=ARCHIVE_CHUNK_SIZE)
+        except docker.errors.APIError as e:
+            raise subprocess.CalledProcessError(1, ['docker', 'cp', f'{service}:{src_path}', '-'],
+                                                stderr=str(e)) from e
+        return chunks
+
+    def image_id(self, service: str) -> str:
+        try:
+            return get_docker_client().api.inspect_container(service)['Image']
+        except docker.errors.NotFound:
+            return self.fallback.image_id(service)
+        except docker.errors.APIError as e:
+            raise subprocess.CalledProcessError(1, ['docker', 'inspect', service], stderr=str(e)) from e
+
+    def up(self, services: list = None, options: list = None):
+        """Creates or recreates the containers whose compose definition changed, which only compose can do."""
+        return self.fallback.up(services, options)
+
+    def stop(self, services: list = None):
+        if not services:
+            return self.fallback.stop(services)
+
+        api = get_docker_client().api
+        for service in services:
+            try:
+                api.stop(service)
+            except docker.errors.NotFound:
+                continue  # Like compose, stopping a service without a container is not an error
+            except docker.errors.APIError as e:
+                raise subprocess.CalledProcessError(1, ['docker', 'stop', service], stderr=str(e)) from e
+
+    def remove(self, services: list):
+        api = get_docker_client().api
+        for service in services:
+            try:
+                api.remove_container(service, force=True)
+            except docker.errors.NotFound:
+                continue
+            except docker.errors.APIError as e:
+                raise subprocess.CalledProcessError(1, ['docker', 'rm', service], stderr=str(e)) from e
+
+
+_container_backend = ComposeCliBackend()
+
+
+def get_container_backend():
+    return _container_backend
+
+
+def configure_container_backend(name: str) -> None:
+    """Sets the backend used for container operations by name."""
+    global _container_backend
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown container backend {name}')
+    _container_backend = DockerSdkBackend() if name == BACKEND_SDK else ComposeCliBackend()
@@ -0,0 +1,100 @@
+import json
+import os
+import re
+import socket
+import time
+from typing import NamedTuple
+
+from src.helper import get_local_ip, run_probes, PROBE_TIMEOUT
+
+DNS_CACHE_FILE = '.dns_cache.json'
+DNS_CACHE_TTL = 300  # 5 minutes
+host_rule_regex = re.compile(r'Host\(([^)]*)\)')
+host_regex = re.compile(r'`([^`]+)`')
+
+
+class HostReport(NamedTuple):
+    ip: str
+    matches: bool
+    cached: bool
+    error: str = None
+
+
+def collect_hosts(services: dict) -> list:
+    """Returns all hostnames used in the traefik Host(...) rules of the compose services."""
+    hosts = []
+    for service in services.values():
+        for label in service.get('labels', []) or []:
+            key, _, value = label.partition('=')
+            if not key.endswith('.rule'):
+                continue
+            for rule in host_rule_regex.findall(value):
+                hosts += [host for host in host_regex.findall(rule) if host not in hosts]
+    return hosts
+
+
+def replace_domain(hosts: list, old_domain: str, new_domain: str) -> list:
+    """Moves the hosts of the old domain to the new domain, e.g. pre.old.de becomes pre.new.de."""
+    replaced_hosts = [new_domain]
+    for host in hosts:
+        if host == old_domain:
+            continue
+        if host.endswith(f'.{old_domain}'):
+            host = f'{host[:-len(old_domain)]}{new_domain}'
+        if host not in replaced_hosts:
+            replaced_hosts.append(host)
+    return replaced_hosts
+
+
+class DomainVerifier:
+    """Checks that hostnames point to this server. All hosts are resolved concurrently and successful lookups are
+    cached for a short time, so repeated checks of setups with many environments stay fast."""
+
+    def __init__(self, cache_path: str = DNS_CACHE_FILE, ttl: int = DNS_CACHE_TTL, timeout: float = PROBE_TIMEOUT):
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.timeout = timeout
+
+    def _load_cache(self) -> dict:
+        try:
+            with open(self.cache_path, 'r') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        now = time.time()
+        return {host: entry for host, entry in cache.items() if now - entry.get('resolved_at', 0) <= self.ttl}
+
+    def _save_cache(self, cache: dict):
+        try:
+            with open(self.cache_path, 'w') as f:
+                json.dump(cache, f)
+        except OSError:
+            pass  # The cache is only an optimization
+
+    def resolve(self, hosts: list) -> dict:
+        """Returns (ip, cached, error) for every host."""
+        cache = self._load_cache()
+        uncached_hosts = [host for host in hosts if host not in cache]
+        results = run_probes({host: lambda host=host: socket.gethostbyname(host) for host in uncached_hosts},
+                             timeout=self.timeout)
+
+        resolved = {host: (cache[host]['ip'], True, None) for host in hosts if host in cache}
+        for host, result in results.items():
+            resolved[host] = (result.value, False, result.error)
+            # Failed lookups are not cached, a fixed DNS record should be noticed right away
+            if result.error is None:
+                cache[host] = {'ip': result.value, 'resolved_at': time.time()}
+
+        if results:
+            self._save_cache(cache)
+        return {host: resolved[host] for host in hosts}
+
+    def verify(self, hosts: list) -> dict:
+        """Returns a HostReport for every host."""
+        local_ip = get_local_ip()
+        return {host: HostReport(ip, ip is not None and ip == local_ip, cached, error)
+                for host, (ip, cached, error) in self.resolve(hosts).items()}
+
+
+def get_dns_cache_path(env_file_path: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(env_file_path)), DNS_CACHE_FILE)
@@ -0,0 +1,260 @@
+import fcntl
+import json
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+FICLONE = 0x40049409  # ioctl request of Linux to create a copy-on-write clone of a file
+STRATEGY_AUTO = 'auto'
+STRATEGY_REFLINK = 'reflink'
+STRATEGY_HARDLINK = 'hardlink'
+STRATEGY_COPY = 'copy'
+STRATEGIES = [STRATEGY_AUTO, STRATEGY_REFLINK, STRATEGY_HARDLINK, STRATEGY_COPY]
+MODE_SYNC = 'sync'
+MODE_CLONE = 'clone'
+MODES = [MODE_SYNC, MODE_CLONE]
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+MANIFEST_VERSION = 1
+sha1_regex = re.compile(r'^[0-9a-f]{40}$')
+
+
+class TransferReport(NamedTuple):
+    strategy: str
+    files: int
+    bytes: int
+    seconds: float
+    deleted: int = 0
+
+    def __str__(self):
+        deleted = f', deleted {self.deleted} files' if self.deleted else ''
+        return (f'{self.files} files ({self.bytes / (1024 * 1024):.1f} MB) with {self.strategy}{deleted} '
+                f'in {self.seconds:.1f}s')
+
+
+def reflink_file(src: str, dst: str):
+    try:
+        with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        raise
+    shutil.copystat(src, dst)
+
+
+def hardlink_file(src: str, dst: str):
+    os.link(src, dst)
+
+
+def copy_file(src: str, dst: str):
+    shutil.copy2(src, dst)
+
+
+TRANSFER_FUNCTIONS = {
+    STRATEGY_REFLINK: reflink_file,
+    STRATEGY_HARDLINK: hardlink_file,
+    STRATEGY_COPY: copy_file,
+}
+
+
+def scan_directory(path: str, relative_dir: str, files: dict):
+    """Adds (size, mtime, sha1) of all files directly in the directory to files and returns its subdirectories."""
+    subdirectories = []
+    with os.scandir(os.path.join(path, relative_dir)) as entries:
+        for entry in entries:
+            relative_path = os.path.normpath(os.path.join(relative_dir, entry.name))
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(relative_path)
+            elif entry.is_file(follow_symlinks=False):
+                stat = entry.stat(follow_symlinks=False)
+                # Filestore files are named after the sha1 of their content
+                sha1 = entry.name if sha1_regex.match(entry.name) else None
+                files[relative_path] = (stat.st_size, stat.st_mtime_ns, sha1)
+    return subdirectories
+
+
+class FilestoreManager:
+    """Clones an Odoo filestore. The files are content addressed and never changed in place, so they can be
+    shared between filestores with reflinks or hardlinks instead of being copied."""
+
+    def __init__(self, source: str, destination: str, strategy: str = STRATEGY_AUTO, workers: int = DEFAULT_WORKERS):
+        if strategy not in STRATEGIES:
+            raise ValueError(f'Unknown filestore strategy {strategy}')
+        self.source = source
+        self.destination = destination
+        self.strategy = strategy
+        self.workers = workers
+
+    def _find_probe_file(self):
+        for root, _, files in os.walk(self.source):
+            for file in files:
+                return os.path.join(root, file)
+        return None
+
+    def detect_strategy(self) -> str:
+        """Returns the fastest strategy the filesystems of source and destination support."""
+        probe_file = self._find_probe_file()
+        if probe_file is None:
+            return STRATEGY_COPY
+
+        target_dir = os.path.dirname(os.path.abspath(self.destination))
+        os.makedirs(target_dir, exist_ok=True)
+        probe_target = os.path.join(target_dir, f'.filestore_probe_{os.getpid()}')
+        for strategy in (STRATEGY_REFLINK, STRATEGY_HARDLINK):
+            try:
+                TRANSFER_FUNCTIONS[strategy](probe_file, probe_target)
+                return strategy
+            except OSError:
+                continue
+            finally:
+                if os.path.lexists(probe_target):
+                    os.remove(probe_target)
+        return STRATEGY_COPY
+
+    def resolve_strategy(self) -> str:
+        if self.strategy == STRATEGY_AUTO:
+            return self.detect_strategy()
+        return self.strategy
+
+    def transfer(self, files: list, strategy: str) -> int:
+        """Transfers the relative file paths from source to destination and returns the number of bytes."""
+        transfer_function = TRANSFER_FUNCTIONS[strategy]
+
+        def transfer_file(relative_path):
+            src = os.path.join(self.source, relative_path)
+            transfer_function(src, os.path.join(self.destination, relative_path))
+            return os.path.getsize(src)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return sum(executor.map(transfer_file, files))
+
+    @property
+    def manifest_path(self) -> str:
+        destination = os.path.normpath(self.destination)
+        return os.path.join(os.path.dirname(destination), f'.{os.path.basename(destination)}.manifest.json')
+
+    def _load_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {'dirs': {}, 'files': {}}
+        if manifest.get('version') != MANIFEST_VERSION:
+            return {'dirs': {}, 'files': {}}
+        return manifest
+
+    def _save_manifest(self, files: dict):
+        dirs = {relative_dir: os.stat(os.path.join(self.destination, relative_dir)).st_mtime_ns
+                for relative_dir in {os.path.dirname(relative_path) or '.' for relative_path in files} | {'.'}}
+        with open(self.manifest_path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'dirs': dirs, 'files': files}, f)
+
+    def scan_source(self) -> dict:
+        files = {}
+        pending = ['.']
+        while pending:
+            pending += scan_directory(self.source, pending.pop(), files)
+        return files
+
+    def scan_destination(self) -> dict:
+        """Returns the files of the destination. Directories that did not change since the last sync are taken from
+        the manifest instead of stating every file in them."""
+        if not os.path.isdir(self.destination):
+            return {}
+
+        manifest = self._load_manifest()
+        manifest_files_by_dir = {}
+        for relative_path, entry in manifest['files'].items():
+            manifest_files_by_dir.setdefault(os.path.dirname(relative_path) or '.', {})[relative_path] = tuple(entry)
+
+        files = {}
+        pending = ['.']
+        while pending:
+            relative_dir = pending.pop()
+            mtime = os.stat(os.path.join(self.destination, relative_dir)).st_mtime_ns
+            if manifest['dirs'].get(relative_dir) == mtime:
+                files.update(manifest_files_by_dir.get(relative_dir, {}))
+                with os.scandir(os.path.join(self.destination, relative_dir)) as entries:
+                    pending += [os.path.normpath(os.path.join(relative_dir, entry.name)) for entry in entries
+                                if entry.is_dir(follow_symlinks=False)]
+            else:
+                pending += scan_directory(self.destination, relative_dir, files)
+        return files
+
+    @staticmethod
+    def is_same_file(source_entry: tuple, destination_entry: tuple) -> bool:
+        size, mtime, sha1 = source_entry
+        if size != destination_entry[0]:
+            return False
+        # Content addressed files with the same name are equal no matter when they were written
+        return sha1 is not None or mtime == destination_entry[1]
+
+    def _delete(self, files: list):
+        def delete_file(relative_path):
+            os.remove(os.path.join(self.destination, relative_path))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(delete_file, files))
+
+    def sync(self) -> TransferReport:
+        """Makes the destination equal to the source by transferring new and changed files and deleting removed
+        ones. The state of the destination is kept in a manifest to avoid stating every file on the next run."""
+        start_time = time.monotonic()
+        strategy = self.resolve_strategy()
+
+        source_files = self.scan_source()
+        destination_files = self.scan_destination()
+
+        to_transfer = [relative_path for relative_path, entry in source_files.items()
+                       if relative_path not in destination_files
+                       or not self.is_same_file(entry, destination_files[relative_path])]
+        to_delete = [relative_path for relative_path in destination_files if relative_path not in source_files]
+
+        # Changed files have to be removed first, links cannot replace an existing file
+        self._delete(to_delete + [relative_path for relative_path in to_transfer
+                                  if relative_path in destination_files])
+        # Every ancestor of a deleted file may have become empty, the deepest are removed first
+        removed_dirs = set()
+        for relative_path in to_delete:
+            relative_dir = os.path.dirname(relative_path)
+            while relative_dir and relative_dir not in removed_dirs:
+                removed_dirs.add(relative_dir)
+                relative_dir = os.path.dirname(relative_dir)
+        for relative_dir in sorted(removed_dirs, key=lambda path: path.count(os.sep), reverse=True):
+            if not os.path.isdir(os.path.join(self.source, relative_dir)):
+                try:
+                    os.rmdir(os.path.join(self.destination, relative_dir))
+                except OSError:
+                    pass  # Not empty, e.g. files that were added to the destination outside of a sync
+        for relative_dir in {os.path.dirname(relative_path) for relative_path in to_transfer}:
+            os.makedirs(os.path.join(self.destination, relative_dir), exist_ok=True)
+        os.makedirs(self.destination, exist_ok=True)
+
+        transferred = self.transfer(to_transfer, strategy)
+        self._save_manifest(source_files)
+
+        return TransferReport(strategy, len(to_transfer), transferred, time.monotonic() - start_time,
+                              deleted=len(to_delete))
+
+    def clone(self) -> TransferReport:
+        """Replaces the destination with a clone of the source."""
+        start_time = time.monotonic()
+        strategy = self.resolve_strategy()
+
+        if os.path.exists(self.destination):
+            shutil.rmtree(self.destination)
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+
+        files = []
+        for root, _, filenames in os.walk(self.source):
+            relative_root = os.path.relpath(root, self.source)
+            os.makedirs(os.path.join(self.destination, relative_root), exist_ok=True)
+            files += [os.path.normpath(os.path.join(relative_root, filename)) for filename in filenames]
+
+        transferred = self.transfer(files, strategy)
+
+        return TransferReport(strategy, len(files), transferred, time.monotonic() - start_time)
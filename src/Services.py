@@ -1,7 +1,10 @@
+from src.sizing import Sizing, PostgresTuning
+
 IMAGE_TRAEFIK = 'registry.hav.media/aura_odoo/traefik:v2.11'
 IMAGE_ODOO = 'registry.hav.media/aura_odoo/odoo'
 IMAGE_KWKHTMLTOPDF = 'registry.hav.media/aura_odoo/kwkhtmltopdf:0.12.5'
 IMAGE_POSTGRES = 'registry.hav.media/aura_odoo/postgres:15-alpine'
+IMAGE_PGBOUNCER = 'edoburu/pgbouncer:v1.22.1-p0'
 
 POSTGRES_PORT = 5432
 POSTGRES_USER = 'postgres'
@@ -46,7 +49,9 @@ class ProxyComposeService(ComposeService):
             ],
             'volumes': [
                 '/var/run/docker.sock:/var/run/docker.sock',
-                f'./volumes/{name}/letsencrypt:/letsencrypt'
+                f'./volumes/{name}/letsencrypt:/letsencrypt',
+                # Dynamic configuration written by generate, see src.traefik
+                f'./volumes/{name}/config:/etc/traefik:ro'
             ],
             'healthcheck': {
                 'test': 'traefik healthcheck --ping',
@@ -86,7 +91,8 @@ class ProxyComposeService(ComposeService):
 
 class OdooComposeService(ComposeService):
     def __init__(self, name: str, domain: str, db_password: str, admin_passwd: str, odoo_version: str,
-                 basic_auth: bool = True, https: bool = True, module_mode: str = 'included', **kwargs):
+                 basic_auth: bool = True, https: bool = True, module_mode: str = 'included', source_volume: str = None,
+                 sizing: Sizing = None, db_host: str = 'db', **kwargs):
         config = {
             'name': name,
             'image': f'{IMAGE_ODOO}:{odoo_version}',
@@ -95,7 +101,7 @@ class OdooComposeService(ComposeService):
                 f'DB_NAME={name}',
                 f'DB_USER={name}',
                 f'DB_PASSWORD={db_password}',
-                f'DB_HOST=db',
+                f'DB_HOST={db_host}',
 
                 f'ADMIN_PASSWD={admin_passwd}',
 
@@ -125,6 +131,25 @@ class OdooComposeService(ComposeService):
             ]
         }
 
+        # Static files get their own routers before the other routes, with cache headers, see src.traefik. The debug
+        # bundles are built on every request and keep their URL, they stay with the main router like /web/image, for
+        # which Odoo sets the cache headers from the unique parameter of the URL.
+        static_routers = [
+            (f'{name}-assets', 'PathPrefix(`/web/assets/`) && !PathPrefix(`/web/assets/debug/`)', 'assetsCache@file'),
+            (f'{name}-static', 'PathPrefix(`/{module:[^/]+}/static/`)', 'staticCache@file'),
+        ]
+        for router, path_rule, cache_middleware in static_routers:
+            config['labels'] += [
+                f'traefik.http.routers.{router}.rule={path_rule} && Host(`{domain}`)',
+                f'traefik.http.routers.{router}.priority=10',
+                f'traefik.http.routers.{router}.service={name}',
+                f'traefik.http.routers.{router}.entrypoints={"websecure" if https else "web"}',
+                f'traefik.http.routers.{router}.middlewares='
+                f'{"basic_auth@file," if basic_auth else ""}{cache_middleware},gzip@file',
+            ]
+            if https:
+                config['labels'].append(f'traefik.http.routers.{router}.tls.certresolver=main_resolver')
+
         if https:
             config['labels'] += [
                 f'traefik.http.routers.{name}-websocket.tls.certresolver=main_resolver',
@@ -132,10 +157,18 @@ class OdooComposeService(ComposeService):
             ]
 
         if module_mode == 'mounted':
+            # The sources are either a directory of the service or a volume shared with other services, see SourceCache
             config['volumes'] += [
-                f'./volumes/{name}/src:/odoo/src/'
+                f'{source_volume or f"./volumes/{name}/src"}:/odoo/src/'
             ]
 
+        if db_host not in config['depends_on']:
+            config['depends_on'].append(db_host)
+
+        if sizing is not None:
+            config['environment'] += sizing.environment()
+            config['deploy'] = sizing.deploy()
+
         if basic_auth:
             config['labels'] += [
                 f'traefik.http.routers.{name}.middlewares=basic_auth@file,gzip@file',
@@ -151,7 +184,7 @@ class OdooComposeService(ComposeService):
 
 
 class PostgresComposeService(ComposeService):
-    def __init__(self, name: str, **kwargs):
+    def __init__(self, name: str, tuning: PostgresTuning = None, **kwargs):
         config = {
             'name': name,
             'restart': 'always',
@@ -174,6 +207,30 @@ class PostgresComposeService(ComposeService):
                 './volumes/db:/var/lib/postgresql/data'
             ]
         }
+
+        if tuning is not None:
+            config['command'] = tuning.command()
+            config['shm_size'] = f'{tuning.shm_size // (1024 * 1024)}m'
+
+        config.update(kwargs)
+        super().__init__(**config)
+
+
+class PgBouncerComposeService(ComposeService):
+    """Connection pooler between the Odoo services and postgres, its configuration is written by src.pgbouncer."""
+
+    def __init__(self, name: str, **kwargs):
+        config = {
+            'name': name,
+            'restart': 'always',
+            'image': IMAGE_PGBOUNCER,
+            'volumes': [
+                f'./volumes/{name}:/etc/pgbouncer:ro'
+            ],
+            'depends_on': [
+                'db'
+            ]
+        }
         config.update(kwargs)
         super().__init__(**config)
 
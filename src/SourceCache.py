@@ -0,0 +1,134 @@
+import hashlib
+import os
+import shutil
+import stat
+
+from src.FilestoreManager import FilestoreManager, STRATEGY_HARDLINK
+from src.helper import copy_files_from_container
+
+SOURCE_MODE_COPY = 'copy'
+SOURCE_MODE_HARDLINK = 'hardlink'
+SOURCE_MODE_OVERLAY = 'overlay'
+SOURCE_MODES = [SOURCE_MODE_COPY, SOURCE_MODE_HARDLINK, SOURCE_MODE_OVERLAY]
+SOURCE_CACHE_PATH = './volumes/source_cache'
+SOURCE_PATH = '/odoo/src'
+COMPLETE_MARKER = '.complete'
+# Compiled files are written again by python, see get_source_exclude
+DEFAULT_SOURCE_EXCLUDE = ['*.pyc', '__pycache__']
+
+
+def get_source_mode(env_manager) -> str:
+    source_mode = env_manager.env_data.get('SOURCE_MODE', SOURCE_MODE_COPY)
+    if source_mode not in SOURCE_MODES:
+        raise ValueError(f'Unknown source mode {source_mode}')
+    return source_mode
+
+
+def get_source_exclude(env_manager) -> list:
+    """Returns the patterns of the files that are not copied from the sources, SOURCE_EXCLUDE separated by commas,
+    e.g. '*.pyc,__pycache__,tests,i18n'."""
+    source_exclude = env_manager.env_data.get('SOURCE_EXCLUDE')
+    if source_exclude is None:
+        return list(DEFAULT_SOURCE_EXCLUDE)
+    return [pattern.strip() for pattern in source_exclude.split(',') if pattern.strip()]
+
+
+def get_volume_name(service_name: str) -> str:
+    return f'{service_name}_src'
+
+
+def get_source_volume(compose_manager, service_name: str):
+    """Returns the overlay volume of the service if one is configured, None if its own source directory is mounted."""
+    volume_name = get_volume_name(service_name)
+    return volume_name if volume_name in (compose_manager.config.get('volumes') or {}) else None
+
+
+def make_read_only(path: str):
+    """Removes the write permission of all files. The directories stay writable, so files can still be replaced but
+    not changed in place, which would change them for every environment linking them."""
+    for root, _, files in os.walk(path):
+        for file in files:
+            file_path = os.path.join(root, file)
+            if not os.path.islink(file_path):
+                mode = os.stat(file_path).st_mode
+                os.chmod(file_path, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+class SourceCache:
+    """Keeps one extracted copy of the Odoo sources per image. The environments share it with hardlinks or as the
+    lower layer of an overlay mount instead of copying the sources for every environment."""
+
+    def __init__(self, path: str = SOURCE_CACHE_PATH, source_service: str = 'live', exclude: list = None):
+        self.path = path
+        self.source_service = source_service
+        self.exclude = DEFAULT_SOURCE_EXCLUDE if exclude is None else exclude
+
+    def base_path(self, image_id: str) -> str:
+        # Other exclude patterns give a different tree, so they get their own entry
+        key = image_id.split(':')[-1]
+        if self.exclude:
+            key += '-' + hashlib.sha1(','.join(sorted(self.exclude)).encode()).hexdigest()[:8]
+        return os.path.join(self.path, key, 'src')
+
+    def ensure_base(self) -> str:
+        """Returns the cached sources of the image the source service runs and extracts them on first use."""
+        # Imported here, the backends depend on the helper module
+        from src.DockerBackend import get_container_backend
+        base = self.base_path(get_container_backend().image_id(self.source_service))
+        marker = os.path.join(os.path.dirname(base), COMPLETE_MARKER)
+        if os.path.exists(marker):
+            return base
+
+        # Extract next to the cache entry and move it in place, an interrupted run never leaves a partial base but
+        # continues the extraction on the next run
+        partial = f'{base}.partial'
+        copy_files_from_container(self.source_service, SOURCE_PATH, partial, exclude=self.exclude, resume=True,
+                                  progress=True)
+        make_read_only(partial)
+        if os.path.exists(base):
+            shutil.rmtree(base)
+        os.rename(partial, base)
+        open(marker, 'w').close()
+        return base
+
+    @staticmethod
+    def overlay_layer_path(service_name: str) -> str:
+        return f'./volumes/{service_name}/src_overlay'
+
+    def overlay_volume(self, base: str, service_name: str) -> dict:
+        """Returns the compose volume mounting the cached sources with a writable layer of the service on top."""
+        layer = os.path.abspath(self.overlay_layer_path(service_name))
+        return {
+            'driver': 'local',
+            'driver_opts': {
+                'type': 'overlay',
+                'device': 'overlay',
+                'o': f'lowerdir={os.path.abspath(base)},upperdir={layer}/upper,workdir={layer}/work',
+            }
+        }
+
+    def configure_volume(self, compose_manager, service_name: str, source_mode: str, base: str = None):
+        """Adds the overlay volume of the service to the compose configuration or removes it in the other modes."""
+        if source_mode == SOURCE_MODE_OVERLAY:
+            compose_manager.set_volume(get_volume_name(service_name), self.overlay_volume(base, service_name))
+        else:
+            compose_manager.remove_volume(get_volume_name(service_name))
+
+    def provision(self, service_name: str, source_mode: str, base: str = None):
+        """Provides the sources of the service in the given mode. The base is extracted if it is not given."""
+        if source_mode == SOURCE_MODE_COPY:
+            copy_files_from_container(self.source_service, SOURCE_PATH, f'./volumes/{service_name}/src',
+                                      exclude=self.exclude, resume=True)
+            return
+        base = base or self.ensure_base()
+        if source_mode == SOURCE_MODE_HARDLINK:
+            FilestoreManager(base, f'./volumes/{service_name}/src', strategy=STRATEGY_HARDLINK).clone()
+        elif source_mode == SOURCE_MODE_OVERLAY:
+            layer = self.overlay_layer_path(service_name)
+            # The layer of the image the environment ran before does not fit the new base
+            if os.path.exists(layer):
+                shutil.rmtree(layer)
+            os.makedirs(os.path.join(layer, 'upper'))
+            os.makedirs(os.path.join(layer, 'work'))
+        else:
+            raise ValueError(f'Unknown source mode {source_mode}')
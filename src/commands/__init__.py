@@ -5,3 +5,4 @@ from . import inspect_command
 from . import manage_dev_env_command
 from . import mount_modules_command
 from . import refresh_enviroment_command
+from . import snapshot_command
@@ -1,9 +1,10 @@
 import click
 
+from src.DomainVerifier import DomainVerifier, collect_hosts, replace_domain, get_dns_cache_path
 from src.commands.generate_command import generate
 from src.decorators import require_initiated
 from src.error_codes import DOMAIN_NOT_CONFIGURED_ERROR_CODE
-from src.helper import check_domain_and_subdomain
+from src.helper import is_valid_hostname
 
 
 @click.command('change-domain')
@@ -16,7 +17,7 @@ def change_domain_command(ctx, new_domain):
 @require_initiated
 def change_domain(new_domain, compose_manager, env_manager):
     dev = env_manager.read_value('DEV', '0') == '1'
-    if not check_domain_and_subdomain(new_domain, dev):
+    if not is_valid_hostname(new_domain) or not dev and not verify_hosts(new_domain, compose_manager, env_manager):
         click.echo(
             f"Domain and subdomains must point to this server's IP. Please ensure the domain and subdomains are correctly configured.",
             err=True)
@@ -30,3 +31,13 @@ def change_domain(new_domain, compose_manager, env_manager):
         compose_manager=compose_manager,
         env_manager=env_manager,
     )
+
+
+def verify_hosts(new_domain, compose_manager, env_manager) -> bool:
+    """Checks every host of the setup, moved to the new domain, and prints the hosts that are not configured."""
+    hosts = replace_domain(collect_hosts(compose_manager.services), env_manager.read_value('DOMAIN'), new_domain)
+    report = DomainVerifier(get_dns_cache_path(env_manager.file_path)).verify(hosts)
+    for host, host_report in report.items():
+        if not host_report.matches:
+            click.echo(f"  {host} resolves to {host_report.ip or host_report.error}", err=True)
+    return all(host_report.matches for host_report in report.values())
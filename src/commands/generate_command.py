@@ -1,7 +1,14 @@
 import click
 
-from src.Services import ProxyComposeService, OdooComposeService, PostgresComposeService, KwkhtmltopdfComposeService
-from src.helper import generate_password, display_diff
+from src.Services import ProxyComposeService, OdooComposeService, PostgresComposeService, \
+    KwkhtmltopdfComposeService, PgBouncerComposeService
+from src.pgbouncer import PGBOUNCER_SERVICE, is_enabled as is_pgbouncer_enabled, get_db_host, apply_db_host, \
+    get_transaction_pooled_services, update_config as update_pgbouncer_config
+from src.SourceCache import get_source_volume
+from src.helper import generate_password, ensure_docker_running
+from src.sizing import SIZING_AUTO, SIZING_MODES, POSTGRES_PROFILE_OLTP, POSTGRES_PROFILES, get_host_resources, \
+    size_services, apply_sizing, render_sizing, tune_postgres, get_postgres_connections
+from src.traefik import BASIC_AUTH_USER, get_config_path, render_dynamic_config, write_dynamic_config
 
 
 @click.command('generate')
@@ -9,34 +16,121 @@ from src.helper import generate_password, display_diff
               help='Enable dashboard for the proxy service. Please use this only for debug purposes.')
 @click.option('--dry', is_flag=True,
               help='Runs the generation in dry mode and do not change any files.')
+@click.option('--json', 'as_json', is_flag=True,
+              help='Print the changes to the docker compose file as JSON.')
+@click.option('--apply', is_flag=True,
+              help='Recreate the changed services and the services depending on them.')
 @click.pass_context
-def generate_command(ctx, dry, dashboard):
+def generate_command(ctx, dry, dashboard, as_json, apply):
     generate(
         dashboard=dashboard,
         dry=dry,
+        as_json=as_json,
+        apply=apply,
         compose_manager=ctx.obj['compose_manager'],
         env_manager=ctx.obj['env_manager']
     )
 
 
-def generate(compose_manager, env_manager, dashboard=False, dry=False):
+def get_admin_passwd(compose_manager, service_name: str) -> str:
+    """Returns the admin password of the existing service. It is only generated for new services, a new password on
+    every run would change the service and recreate it on apply."""
+    for variable in (compose_manager.services.get(service_name) or {}).get('environment') or []:
+        key, _, value = variable.partition('=')
+        if key == 'ADMIN_PASSWD' and value:
+            return value
+    return generate_password()
+
+
+def get_sizing(env_manager, service_names: list, pgbouncer: bool = False):
+    """Returns the host, the sizes of the services and the tuning of postgres. The host is split between live, pre and
+    the dev environments, without a host for SIZING=off. Exits on an unknown SIZING or POSTGRES_PROFILE."""
+    sizing_mode = env_manager.env_data.get('SIZING', SIZING_AUTO)
+    if sizing_mode not in SIZING_MODES:
+        click.echo(f"Unknown SIZING {sizing_mode}. Use one of: {', '.join(SIZING_MODES)}", err=True)
+        exit(1)
+    postgres_profile = env_manager.env_data.get('POSTGRES_PROFILE', POSTGRES_PROFILE_OLTP)
+    if postgres_profile not in POSTGRES_PROFILES:
+        click.echo(f"Unknown POSTGRES_PROFILE {postgres_profile}. Use one of: {', '.join(POSTGRES_PROFILES)}",
+                   err=True)
+        exit(1)
+    if sizing_mode != SIZING_AUTO:
+        return None, {}, None
+    host = get_host_resources()
+    # Services behind the pooler share its connections of postgres
+    pooled_services = get_transaction_pooled_services(service_names) if pgbouncer else []
+    sizes = size_services(service_names, host, pooled_services=pooled_services)
+    postgres_tuning = tune_postgres(host, profile=postgres_profile,
+                                    expected_connections=get_postgres_connections(sizes, pooled_services))
+    return host, sizes, postgres_tuning
+
+
+def set_pgbouncer_service(compose_manager, pgbouncer: bool):
+    if pgbouncer:
+        compose_manager.set_service(PgBouncerComposeService(name=PGBOUNCER_SERVICE))
+    elif PGBOUNCER_SERVICE in compose_manager.services:
+        compose_manager.remove_service(PGBOUNCER_SERVICE)
+
+
+def save_compose_file(compose_manager, dry: bool = False, as_json: bool = False, sizing_report: str = None):
+    """Writes the Docker Compose file unless dry and reports the changes."""
+    if as_json:
+        # Only the JSON is printed, so it can be parsed
+        click.echo(compose_manager.diff().render_json())
+        if not dry:
+            compose_manager.save()
+    elif dry:
+        click.echo(compose_manager.print_diff())
+        if sizing_report:
+            click.echo(sizing_report)
+        click.echo("Docker Compose file 'docker-compose.yml' rendered successfully.")
+    elif compose_manager.save():
+        click.echo("Docker Compose file 'docker-compose.yml' updated successfully.")
+    else:
+        click.echo("Docker Compose file 'docker-compose.yml' unchanged.")
+
+
+def write_proxy_config(env_manager, https: bool = True, err: bool = False):
+    """Writes the middlewares the labels of the services reference. The basic auth password is generated on first
+    use and kept in the .env file."""
+    if env_manager.env_data.get('BASIC_AUTH_PASSWORD') is None:
+        env_manager.add_value('BASIC_AUTH_PASSWORD', generate_password())
+        env_manager.save()
+    basic_auth_user = env_manager.env_data.get('BASIC_AUTH_USER', BASIC_AUTH_USER)
+    config = render_dynamic_config({basic_auth_user: env_manager.env_data['BASIC_AUTH_PASSWORD']}, https=https)
+    if write_dynamic_config(config):
+        click.echo(f"Traefik configuration '{get_config_path()}' updated successfully.", err=err)
+
+
+def generate(compose_manager, env_manager, dashboard=False, dry=False, as_json=False, apply=False):
     if not env_manager.initiated:
         click.echo("Please run the 'init' command before generating the configuration.", err=True)
         exit(1)
+    if apply and not dry:
+        # Checked before anything is written, the changes could not be applied afterwards
+        ensure_docker_running()
     domain = env_manager.read_value('DOMAIN')
     version = env_manager.read_value('VERSION')
     is_dev = env_manager.read_value('DEV', '0') == '1'
     module_mode = env_manager.read_value('MODULE_MODE') if env_manager.read_value('MODULE_MODE') else 'included'
+    dev_services = [name for name in compose_manager.services if name.startswith('odoo_dev')]
+    pgbouncer = is_pgbouncer_enabled(env_manager)
+    host, sizes, postgres_tuning = get_sizing(env_manager, ['live', 'pre'] + dev_services, pgbouncer)
+    db_host = get_db_host(env_manager)
     # Store domain in the proxy service for later reference
     proxy_service = ProxyComposeService(name='proxy', domain=domain, dashboard=dashboard, https=not is_dev)
     live_service = OdooComposeService(name='live', domain=domain, db_password='${LIVE_DB_PASSWORD}',
-                                      admin_passwd=generate_password(), odoo_version=version, basic_auth=False,
-                                      https=not is_dev,
-                                      module_mode=module_mode)  # Generate a random password each time because it will never be needed
+                                      admin_passwd=get_admin_passwd(compose_manager, 'live'), odoo_version=version,
+                                      basic_auth=False, https=not is_dev, module_mode=module_mode,
+                                      source_volume=get_source_volume(compose_manager, 'live'),
+                                      sizing=sizes.get('live'), db_host=db_host)
     pre_service = OdooComposeService(name='pre', domain=f'pre.{domain}', db_password='${PRE_DB_PASSWORD}',
-                                     admin_passwd=generate_password(), odoo_version=version, https=not is_dev,
-                                     module_mode=module_mode)
-    db_service = PostgresComposeService(name='db')
+                                     admin_passwd=get_admin_passwd(compose_manager, 'pre'), odoo_version=version,
+                                     https=not is_dev,
+                                     module_mode=module_mode,
+                                     source_volume=get_source_volume(compose_manager, 'pre'),
+                                     sizing=sizes.get('pre'), db_host=db_host)
+    db_service = PostgresComposeService(name='db', tuning=postgres_tuning)
     kwkhtmltopdf_service = KwkhtmltopdfComposeService(name='kwkhtmltopdf')
     # Update services
     compose_manager.set_service(proxy_service)
@@ -44,10 +138,24 @@ def generate(compose_manager, env_manager, dashboard=False, dry=False):
     compose_manager.set_service(pre_service)
     compose_manager.set_service(db_service)
     compose_manager.set_service(kwkhtmltopdf_service)
-    # Write Docker Compose file
-    if dry:
-        click.echo(compose_manager.print_diff())
-        click.echo(f"Docker Compose file 'docker-compose.yml' rendered successfully.")
-    else:
-        compose_manager.save()
-        click.echo(f"Docker Compose file 'docker-compose.yml' updated successfully.")
+    set_pgbouncer_service(compose_manager, pgbouncer)
+    # The dev environments are not generated again, only their sizing and database host are updated
+    for service_name in dev_services:
+        if service_name in sizes:
+            apply_sizing(compose_manager.services[service_name], sizes[service_name])
+        apply_db_host(compose_manager.services[service_name], db_host)
+    # The plan has to be computed before saving, afterwards the file is the new source
+    plan = compose_manager.plan_apply() if apply else None
+    save_compose_file(compose_manager, dry, as_json,
+                      sizing_report=render_sizing(sizes, host, postgres_tuning) if sizes else None)
+
+    if pgbouncer and not dry:
+        update_pgbouncer_config(compose_manager, env_manager, sizes)
+
+    if not dry:
+        write_proxy_config(env_manager, https=not is_dev, err=as_json)
+
+    if plan is not None:
+        click.echo(plan.render(), err=as_json)
+        if plan and not dry:
+            compose_manager.apply(plan)
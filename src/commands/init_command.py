@@ -1,12 +1,11 @@
-import time
-
 import click
 
 from src.DatabaseManager import DatabaseManager
 from src.commands.generate_command import generate
 from src.constants import DB_USER, DEFAULT_DB
 from src.error_codes import DOMAIN_NOT_CONFIGURED_ERROR_CODE
-from src.helper import check_domain_and_subdomain, generate_password
+from src.helper import check_domain_and_subdomain, generate_password, ensure_services_healthy
+from src.timings import span
 
 
 @click.command('init')
@@ -26,7 +25,9 @@ def init(dev, domain, version, disable_domain_check,  compose_manager, env_manag
         exit(1)
     # Check if domain and subdomains point to the current server
     if not disable_domain_check:
-        if not check_domain_and_subdomain(domain, dev):
+        with span('check domain'):
+            domain_configured = check_domain_and_subdomain(domain, dev)
+        if not domain_configured:
             click.echo(
                 f"Domain and subdomains must point to this server's IP. Please ensure the domain and subdomains are correctly configured.",
                 err=True)
@@ -46,14 +47,17 @@ def init(dev, domain, version, disable_domain_check,  compose_manager, env_manag
     env_manager.save()
     click.echo('Setup initialized successfully.')
     # Run generate command
-    generate(
-        compose_manager=compose_manager,
-        env_manager=env_manager,
-    )
-    compose_manager.up(['db'])
-
-    time.sleep(5)
-
-    DatabaseManager(DEFAULT_DB, DB_USER, master_db_password).add_user('live', live_db_password)
-    DatabaseManager(DEFAULT_DB, DB_USER, master_db_password).add_user('pre', pre_db_password)
-    compose_manager.up()
+    with span('generate'):
+        generate(
+            compose_manager=compose_manager,
+            env_manager=env_manager,
+        )
+    with span('start database'):
+        compose_manager.up(['db'])
+        ensure_services_healthy(['db'])
+
+    with span('create users'):
+        DatabaseManager(DEFAULT_DB, DB_USER, master_db_password).add_user('live', live_db_password)
+        DatabaseManager(DEFAULT_DB, DB_USER, master_db_password).add_user('pre', pre_db_password)
+    with span('start services'):
+        compose_manager.up()
@@ -1,9 +1,10 @@
 import json
 
 import click
-import docker
 
-from src.helper import get_docker_versions, check_domain_and_subdomain, get_service_health
+from src.DomainVerifier import DomainVerifier, collect_hosts, get_dns_cache_path
+from src.commands.snapshot_command import get_snapshot_age
+from src.helper import get_docker_versions, get_services_state, run_probes
 
 
 @click.command('inspect')
@@ -16,31 +17,46 @@ def inspect_command(ctx, return_json):
 def inspect(return_json, compose_manager, env_manager):
     initialized = compose_manager.initiated
     domain = env_manager.read_value('DOMAIN') if initialized else 'Not initialized'
-    dev = env_manager.read_value('DEV', '0') == 1
+    dev = env_manager.read_value('DEV', '0') == '1'
     odoo_version = env_manager.read_value('VERSION') if initialized else 'Not initialized'
     # Count the number of dev environments with the "pr_" prefix
     num_dev_envs = sum(1 for service_name in compose_manager.services.keys() if service_name.startswith("odoo_dev"))
-    docker_version, docker_compose_version = get_docker_versions()
+    hosts = collect_hosts(compose_manager.services) if initialized else []
+    probes = {'docker_versions': lambda: get_docker_versions(use_cache=True)}
+    if initialized:
+        if not dev:
+            probes['domain'] = lambda: DomainVerifier(get_dns_cache_path(env_manager.file_path)).verify(hosts)
+        probes['services'] = lambda: get_services_state(['db', 'proxy'])
+    results = run_probes(probes)
+    docker_version, docker_compose_version = results['docker_versions'].value or (None, None)
     docker_installed = docker_version is not None
     docker_compose_installed = docker_compose_version is not None
-    domain_configured = check_domain_and_subdomain(domain, dev) if initialized else None
-    try:
-        db_health = get_service_health('db') if initialized else None
-    except docker.errors.NotFound:
-        db_health = None
-    try:
-        proxy_health = get_service_health('proxy') if initialized else None
-    except docker.errors.NotFound:
-        proxy_health = None
+    # A domain check that did not finish counts as not configured
+    host_reports = (results['domain'].value or {}) if 'domain' in results else {}
+    if not initialized:
+        domain_configured = subdomain_configured = None
+    elif dev:
+        domain_configured = subdomain_configured = True
+    else:
+        domain_configured = domain in host_reports and host_reports[domain].matches
+        subdomain_configured = all(host in host_reports and host_reports[host].matches
+                                   for host in hosts if host != domain)
+    states = (results['services'].value or {}) if initialized else {}
+    db_health = states['db'].health if 'db' in states else None
+    proxy_health = states['proxy'].health if 'proxy' in states else None
+    snapshot_age = get_snapshot_age(env_manager) if initialized else None
     if return_json:
         # Output data in JSON format
         data = {"state": {"initialized": initialized, "domain": domain, "odoo_version": odoo_version,
                           "num_dev_envs": num_dev_envs, "docker_version": docker_version,
                           "docker_compose_version": docker_compose_version, "db_health": db_health,
-                          "proxy_health": proxy_health},
-                "checklist": {"domain_configured": domain_configured, "subdomain_configured": domain_configured,
+                          "proxy_health": proxy_health, "snapshot_age": snapshot_age},
+                "checklist": {"domain_configured": domain_configured, "subdomain_configured": subdomain_configured,
                               "docker_installed": docker_installed,
-                              "docker_compose_installed": docker_compose_installed}}
+                              "docker_compose_installed": docker_compose_installed},
+                "hosts": {host: host_report._asdict() for host, host_report in host_reports.items()},
+                "probes": {name: {"latency_ms": round(result.latency * 1000, 1), "error": result.error}
+                           for name, result in results.items()}}
         click.echo(json.dumps(data, indent=4))
     else:
         # Output data in human-readable format
@@ -53,11 +69,18 @@ def inspect(return_json, compose_manager, env_manager):
         click.echo(f"  Docker Compose version: {docker_compose_version}")
         click.echo(f"  Database health: {db_health}")
         click.echo(f"  Proxy health: {proxy_health}")
+        if snapshot_age is not None:
+            click.echo(f"  Snapshot age: {snapshot_age // 3600}h {snapshot_age % 3600 // 60}m")
+        else:
+            click.echo("  Snapshot age: No snapshot")
 
         click.echo("\nChecklist:")
         if initialized:
             click.echo(f"  - Domain configured: {'✓' if domain_configured else '✗'}")
-            click.echo(f"  - Subdomain configured: {'✓' if domain_configured else '✗'}")
+            click.echo(f"  - Subdomain configured: {'✓' if subdomain_configured else '✗'}")
+            for host, host_report in host_reports.items():
+                if not host_report.matches:
+                    click.echo(f"    - {host} resolves to {host_report.ip or host_report.error}")
         else:
             click.echo("  - Domain configured: N/A (not initialized)")
             click.echo("  - Subdomain configured: N/A (not initialized)")
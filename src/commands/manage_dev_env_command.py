@@ -1,10 +1,19 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import click
 
 from src.DatabaseManager import DatabaseManager
+from src.DockerBackend import get_container_backend
 from src.Services import OdooComposeService
+from src.SourceCache import SourceCache, SOURCE_MODES, SOURCE_MODE_COPY, SOURCE_MODE_OVERLAY, get_source_mode, \
+    get_volume_name, get_source_exclude, DEFAULT_SOURCE_EXCLUDE
 from src.constants import DB_USER, DEFAULT_DB
-from src.errors import ServiceAlreadyExistsException, ServiceDoesNotExistException
+from src.errors import ServiceDoesNotExistException
 from src.helper import generate_password, copy_files_from_container
+from src.pgbouncer import get_db_host, update_config as update_pgbouncer_config
+from src.timings import step
+
+DEFAULT_COPY_LIMIT = 4
 
 
 @click.group()
@@ -13,11 +22,76 @@ def manage_dev_env():
 
 
 @manage_dev_env.command()
-@click.argument('pr_number')
+@click.argument('pr_numbers', nargs=-1, required=True)
+@click.option('--copy-limit', type=click.IntRange(min=1), default=DEFAULT_COPY_LIMIT, show_default=True,
+              help='Number of source copies that run at the same time.')
+@click.option('--source-mode', type=click.Choice(SOURCE_MODES),
+              help='How the sources are provided, defaults to SOURCE_MODE of the .env file or copy.')
 @click.pass_context
-def add(ctx, pr_number):
-    compose_manager = ctx.obj['compose_manager']
-    env_manager = ctx.obj['env_manager']
+def add(ctx, pr_numbers, copy_limit, source_mode):
+    add_dev_envs(pr_numbers, ctx.obj['compose_manager'], ctx.obj['env_manager'], copy_limit=copy_limit,
+                 source_mode=source_mode)
+
+
+def copy_sources(service_names: list, copy_limit: int = DEFAULT_COPY_LIMIT, provision=None,
+                 exclude: list = None) -> list:
+    """Copies the sources of the live container for every service concurrently, or provides them with the given
+    function. Returns the services that failed. Files copied by an earlier run are kept, so running it again only
+    copies what is missing."""
+    def copy(service_name):
+        copy_files_from_container('live', '/odoo/src', f'./volumes/{service_name}/src',
+                                  exclude=DEFAULT_SOURCE_EXCLUDE if exclude is None else exclude, resume=True,
+                                  progress=True)
+
+    provision = provision or copy
+    # The client is created before the threads start, they share it instead of setting it up in the first copy
+    get_container_backend().connect()
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=copy_limit) as executor:
+        futures = {executor.submit(provision, service_name): service_name for service_name in service_names}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                click.echo(f"Failed to copy the sources of {futures[future]}: {e}", err=True)
+                failed.append(futures[future])
+    return failed
+
+
+def provision_roles(compose_manager, env_manager, db_passwords: dict):
+    """Creates the database roles in one transaction and only then writes the compose file and .env, so nothing is
+    added if a role cannot be created."""
+    with step(f"Create {len(db_passwords)} database roles"):
+        DatabaseManager(DEFAULT_DB, DB_USER, env_manager.read_value('MASTER_DB_PASSWORD')).add_users(db_passwords)
+
+    compose_manager.save()
+    for service_name, db_password in db_passwords.items():
+        env_manager.add_value(f'{service_name}_DB_PASSWORD', db_password)
+    env_manager.save()
+    # The pooler needs the roles before the environments connect
+    update_pgbouncer_config(compose_manager, env_manager)
+
+
+def provide_sources(service_names: list, source_mode: str, source_cache: SourceCache, base: str = None,
+                    copy_limit: int = DEFAULT_COPY_LIMIT) -> list:
+    """Copies the sources or provides them from the SourceCache, depending on the source mode. Returns the services
+    that failed."""
+    if source_mode == SOURCE_MODE_COPY:
+        with step(f"Copy sources with up to {copy_limit} copies at a time"):
+            return copy_sources(service_names, copy_limit=copy_limit, exclude=source_cache.exclude)
+    with step(f"Provide sources as {source_mode}"):
+        return copy_sources(service_names, copy_limit=copy_limit,
+                            provision=lambda name: source_cache.provision(name, source_mode, base))
+
+
+def add_dev_envs(pr_numbers, compose_manager, env_manager, copy_limit: int = DEFAULT_COPY_LIMIT,
+                 source_mode: str = None):
+    """Adds the development environments of all PRs. The compose file and .env are written once and the roles are
+    created in one transaction, so nothing is added if one of the PRs already has an environment.
+
+    Unless the source mode is copy, the sources are extracted once into the shared SourceCache and every environment
+    only gets hardlinks or a writable overlay layer."""
     if not compose_manager.initiated:
         click.echo("Please run the 'init' command before running this command.", err=True)
         exit(1)
@@ -26,29 +100,49 @@ def add(ctx, pr_number):
     version = env_manager.read_value('VERSION')
     is_dev = env_manager.read_value('DEV', '0') == '1'
     module_mode = env_manager.read_value('MODULE_MODE') if env_manager.read_value('MODULE_MODE') else 'included'
-    service_name = f'odoo_dev_pr{pr_number}'
-
-    dev_service = OdooComposeService(name=service_name, domain=f'pr{pr_number}.{domain}',
-                                     db_password=f'{service_name}_DB_PASSWORD', admin_passwd=generate_password(),
-                                     odoo_version=version, https=not is_dev, module_mode=module_mode)
-
-    try:
-        compose_manager.add_service(dev_service)
-    except ServiceAlreadyExistsException:
-        click.echo(f"Development environment for PR{pr_number} already exists.", err=True)
+    source_mode = source_mode or get_source_mode(env_manager)
+    source_exclude = get_source_exclude(env_manager)
+    source_cache = SourceCache(exclude=source_exclude)
+
+    # Keep the order but ignore numbers that were passed twice
+    pr_numbers = list(dict.fromkeys(pr_numbers))
+    for pr_number in pr_numbers:
+        if f'odoo_dev_pr{pr_number}' in compose_manager.services:
+            click.echo(f"Development environment for PR{pr_number} already exists.", err=True)
+            exit(1)
+
+    db_passwords = {}
+    for pr_number in pr_numbers:
+        service_name = f'odoo_dev_pr{pr_number}'
+        password_key = f'{service_name}_DB_PASSWORD'.upper()
+        compose_manager.add_service(OdooComposeService(name=service_name, domain=f'pr{pr_number}.{domain}',
+                                                       db_password=f'${{{password_key}}}',
+                                                       admin_passwd=generate_password(), odoo_version=version,
+                                                       https=not is_dev, module_mode=module_mode,
+                                                       source_volume=get_volume_name(service_name)
+                                                       if source_mode == SOURCE_MODE_OVERLAY else None,
+                                                       db_host=get_db_host(env_manager)))
+        db_passwords[service_name] = generate_password()
+
+    base = None
+    if source_mode != SOURCE_MODE_COPY:
+        # The overlay volumes need the path of the base, so it is extracted before the compose file is written
+        with step("Prepare the shared sources"):
+            base = source_cache.ensure_base()
+        for service_name in db_passwords:
+            source_cache.configure_volume(compose_manager, service_name, source_mode, base)
+
+    provision_roles(compose_manager, env_manager, db_passwords)
+    failed = provide_sources(list(db_passwords), source_mode, source_cache, base, copy_limit=copy_limit)
+
+    for pr_number in pr_numbers:
+        if f'odoo_dev_pr{pr_number}' not in failed:
+            click.echo(f"Development environment for PR{pr_number} added successfully.")
+    if failed:
+        click.echo(f"Copying the sources failed for {', '.join(failed)}. The environments are configured, "
+                   f"copy the sources again to finish them.", err=True)
         exit(1)
 
-    db_password = generate_password()
-
-    DatabaseManager(DEFAULT_DB, DB_USER, env_manager.read_value('MASTER_DB_PASSWORD')).add_user(service_name,
-                                                                                                db_password)
-
-    compose_manager.save()
-    env_manager.add_value(f'{service_name}_DB_PASSWORD', db_password)
-    env_manager.save()
-    copy_files_from_container('live', '/odoo/src', f'./volumes/{service_name}/src')
-    click.echo(f"Development environment for PR{pr_number} added successfully.")
-
 
 @manage_dev_env.command()
 @click.argument('pr_number')
@@ -67,11 +161,13 @@ def remove(ctx, pr_number):
     except ServiceDoesNotExistException:
         click.echo(f"Development environment for PR{pr_number} does not exist.", err=True)
         exit(1)
+    compose_manager.remove_volume(get_volume_name(service_name))
 
     compose_manager.save()
     DatabaseManager(DEFAULT_DB, DB_USER, env_manager.read_value('MASTER_DB_PASSWORD')).remove_user(service_name)
     env_manager.remove_value(f'{service_name}_DB_PASSWORD')
     env_manager.save()
+    update_pgbouncer_config(compose_manager, env_manager)
     click.echo(f"Development environment for PR{pr_number} removed successfully.")
 
 
@@ -4,7 +4,9 @@ from src.ComposeManager import ComposeManager
 from src.EnvManager import EnvManager
 from src.commands.generate_command import generate
 from src.decorators import require_initiated
+from src.SourceCache import SourceCache, SOURCE_MODE_COPY, get_source_mode, get_source_exclude
 from src.helper import copy_files_from_container
+from src.timings import span
 
 
 @click.command('mount-modules')
@@ -26,16 +28,28 @@ def mount_modules(compose_manager: ComposeManager, env_manager: EnvManager):
 
     env_manager.save()
 
-    # Copy files for each container
-    copy_files_from_container('live', '/odoo/src/', './volumes/live/src')
-    copy_files_from_container('pre', '/odoo/src/', './volumes/pre/src')
-
-    for service_name in [key for key in compose_manager.services.keys() if key.startswith("odoo_dev")]:
-        copy_files_from_container(service_name, '/odoo/src/', f'./volumes/{service_name}/src')
+    service_names = ['live', 'pre'] + [key for key in compose_manager.services.keys() if key.startswith("odoo_dev")]
+    source_mode = get_source_mode(env_manager)
+    source_exclude = get_source_exclude(env_manager)
+    if source_mode == SOURCE_MODE_COPY:
+        # Copy files for each container
+        for service_name in service_names:
+            copy_files_from_container(service_name, '/odoo/src/', f'./volumes/{service_name}/src',
+                                      exclude=source_exclude, resume=True, progress=True)
+    else:
+        # Extract the sources once and share them between the containers
+        source_cache = SourceCache(exclude=source_exclude)
+        with span('prepare shared sources'):
+            base = source_cache.ensure_base()
+        for service_name in service_names:
+            source_cache.provision(service_name, source_mode, base)
+            source_cache.configure_volume(compose_manager, service_name, source_mode, base)
 
     click.echo("Mounted modules.")
 
     ctx = click.get_current_context()
-    ctx.invoke(generate)
+    with span('generate'):
+        ctx.invoke(generate)
 
-    compose_manager.up()
+    with span('start services'):
+        compose_manager.up()
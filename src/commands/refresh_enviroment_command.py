@@ -1,21 +1,37 @@
-import os
-import shutil
+import time
 import uuid
 
 import click
 
-from src.DatabaseManager import DatabaseManager
+from src.DatabaseManager import DatabaseManager, DEFAULT_JOBS
 from src.EnvManager import EnvManager
-from src.constants import DB_USER, DEFAULT_DB
+from src.FilestoreManager import FilestoreManager, STRATEGIES, STRATEGY_AUTO, MODES, MODE_SYNC
+from src.constants import DB_USER, SNAPSHOT_DB
 from src.decorators import require_initiated, require_database, prevent_on_enviroment
-from src.helper import remove_file_in_container
+from src.errors import StreamingNotPossibleException
+from src.helper import remove_file_in_container, format_throughput
+from src.timings import step
 
 
 @click.command('refresh-enviroment')
 @click.argument('enviroment')
+@click.option('--stream/--no-stream', default=True,
+              help='Pipe the dump directly into the restore without an intermediate file.')
+@click.option('--parallel', is_flag=True,
+              help='Use a directory format dump and restore it with multiple jobs. Disables streaming.')
+@click.option('--jobs', type=click.IntRange(min=1), default=DEFAULT_JOBS, show_default=True,
+              help='Number of jobs used for parallel dump and restore.')
+@click.option('--snapshot', is_flag=True,
+              help='Clone the database from the live snapshot instead of copying live.')
+@click.option('--filestore-strategy', type=click.Choice(STRATEGIES), default=STRATEGY_AUTO, show_default=True,
+              help='How the filestore files are cloned. auto detects the fastest one the filesystem supports.')
+@click.option('--filestore-mode', type=click.Choice(MODES), default=MODE_SYNC, show_default=True,
+              help='sync only transfers changed files, clone replaces the whole filestore.')
 @click.pass_context
-def refresh_enviroment_cli(ctx, enviroment):
-    refresh_enviroment(enviroment, ctx.obj['compose_manager'], ctx.obj['env_manager'])
+def refresh_enviroment_cli(ctx, enviroment, stream, parallel, jobs, snapshot, filestore_strategy, filestore_mode):
+    refresh_enviroment(enviroment, ctx.obj['compose_manager'], ctx.obj['env_manager'], stream=stream,
+                       jobs=jobs if parallel else None, snapshot=snapshot, filestore_strategy=filestore_strategy,
+                       filestore_mode=filestore_mode)
 
 
 def escape_db(name: str, env_manager: EnvManager) -> bool:
@@ -28,29 +44,70 @@ def escape_db(name: str, env_manager: EnvManager) -> bool:
                          'ir_cron': 'UPDATE ir_cron SET active = FALSE;',
                          'ir_config_parameter': f"UPDATE ir_config_parameter SET value = '{uuid.uuid4()}' WHERE key = 'database.uuid';"}
 
-    main_database_manager = DatabaseManager(DEFAULT_DB, DB_USER, env_manager.read_value('MASTER_DB_PASSWORD'))
-
-    def table_exists(table_name):
-        query = f"SELECT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = '{table_name}');"
-        cur = main_database_manager._run_sql_command(query, True)
-        return cur.fetchone()[0]
+    # The statements have to run against the refreshed database, not the maintenance database
+    database_manager = DatabaseManager(name, DB_USER, env_manager.read_value('MASTER_DB_PASSWORD'))
 
     try:
-        for table, escape_statement in escape_statements.items():
-            if not table_exists(table):
+        existing_tables = database_manager.existing_tables(list(escape_statements))
+        for table in escape_statements:
+            if table not in existing_tables:
                 click.echo(f"Table {table} does not exist. Skipping...", err=True)
-                continue
-            main_database_manager._run_sql_command(escape_statement, True)
+        database_manager.run_batch([escape_statement for table, escape_statement in escape_statements.items()
+                                    if table in existing_tables])
         return True
     except Exception as e:
         click.echo(f"Failed to escape database {name}: {e}", err=True)
         raise
 
 
+def copy_database_from_dump(name: str, owner: str, env_manager: EnvManager, jobs: int = None):
+    db_password = env_manager.read_value('MASTER_DB_PASSWORD')
+    with step(f"Copy new database{f' with {jobs} jobs' if jobs else ''}"):
+        path = DatabaseManager('live', 'postgres', db_password).dump_db('/tmp', jobs=jobs)
+    with step('Restore dump'):
+        owner_password = db_password if owner == DB_USER else env_manager.read_value(f'{owner}_DB_PASSWORD'.upper())
+        DatabaseManager.from_dump(name, owner, owner_password, path, jobs=jobs)
+    with step('Remove dump'):
+        remove_file_in_container('db', path, recursive=bool(jobs))
+
+
+def copy_database_streaming(name: str, owner: str, env_manager: EnvManager) -> bool:
+    db_password = env_manager.read_value('MASTER_DB_PASSWORD')
+    with step("Stream new database") as current:
+        start_time = time.monotonic()
+        try:
+            transferred = DatabaseManager('live', 'postgres', db_password).stream_to(name, owner)
+        except StreamingNotPossibleException as e:
+            click.echo(f"Streaming is not possible ({e}). Falling back to dump file.", err=True)
+            return False
+        current.bytes = transferred
+    click.echo(f"  Streamed {format_throughput(transferred, time.monotonic() - start_time)}")
+    return True
+
+
+def copy_live_database(name: str, owner: str, env_manager: EnvManager, stream: bool = True, jobs: int = None):
+    # A directory format dump cannot be streamed, so parallel jobs always use the dump path
+    if jobs or not stream or not copy_database_streaming(name, owner, env_manager):
+        copy_database_from_dump(name, owner, env_manager, jobs=jobs)
+
+
+def copy_database_from_snapshot(enviroment: str, env_manager: EnvManager) -> bool:
+    db_password = env_manager.read_value('MASTER_DB_PASSWORD')
+    if not DatabaseManager.db_exists(SNAPSHOT_DB):
+        click.echo("No snapshot found. Run the 'snapshot' command first. Falling back to copying live.", err=True)
+        return False
+    with step("Clone snapshot"):
+        enviroment_db_password = env_manager.read_value(f'{enviroment}_DB_PASSWORD'.upper())
+        DatabaseManager.from_template(enviroment, enviroment, enviroment_db_password, SNAPSHOT_DB)
+        DatabaseManager(enviroment, DB_USER, db_password).reassign_objects(enviroment)
+    return True
+
+
 @require_initiated
 @require_database
 @prevent_on_enviroment('live')
-def refresh_enviroment(enviroment, compose_manager, env_manager):
+def refresh_enviroment(enviroment, compose_manager, env_manager, stream=True, jobs=None, snapshot=False,
+                       filestore_strategy=STRATEGY_AUTO, filestore_mode=MODE_SYNC):
     db_password = env_manager.read_value('MASTER_DB_PASSWORD')
 
     if enviroment != 'pre':
@@ -59,24 +116,24 @@ def refresh_enviroment(enviroment, compose_manager, env_manager):
             click.echo(f"The environment {enviroment} does not exist or isn't an odoo env.", err=True)
             exit(1)
     click.echo(f"Refreshing {enviroment} environment")
-    click.echo("* Stopping environment")
-    compose_manager.stop([enviroment])
-    click.echo("* Removing old database")
-    DatabaseManager(enviroment, 'postgres', db_password).drop_db()
-    click.echo("* Copy new database")
-    path = DatabaseManager('live', 'postgres', db_password).dump_db('/tmp')
-    click.echo('* Restore dump')
-    enviroment_db_password = env_manager.read_value(f'{enviroment}_DB_PASSWORD'.upper())
-    DatabaseManager.from_dump(enviroment, enviroment, enviroment_db_password, path)
-    click.echo('* Remove dump')
-    remove_file_in_container('db', path)
-    click.echo('* Copy Filestore')
-    enviroment_folder_path = f'volumes/{enviroment}/filestore/pre'
-    live_folder_path = 'volumes/live/filestore/live'
-    if os.path.exists(enviroment_folder_path):
-        shutil.rmtree(enviroment_folder_path)
-    shutil.copytree(live_folder_path, enviroment_folder_path)
-    click.echo('* Escape new DB')
-    escape_db(enviroment, env_manager=env_manager)
-    click.echo("* Starting environment")
-    compose_manager.up([enviroment])
+    with step("Stopping environment"):
+        compose_manager.stop([enviroment])
+    with step("Removing old database"):
+        DatabaseManager(enviroment, 'postgres', db_password).drop_db()
+    if not snapshot or not copy_database_from_snapshot(enviroment, env_manager):
+        copy_live_database(enviroment, enviroment, env_manager, stream=stream, jobs=jobs)
+    with step('Copy Filestore') as current:
+        enviroment_folder_path = f'volumes/{enviroment}/filestore/pre'
+        live_folder_path = 'volumes/live/filestore/live'
+        filestore_manager = FilestoreManager(live_folder_path, enviroment_folder_path, strategy=filestore_strategy)
+        if filestore_mode == MODE_SYNC:
+            report = filestore_manager.sync()
+            click.echo(f'  Synced {report}')
+        else:
+            report = filestore_manager.clone()
+            click.echo(f'  Cloned {report}')
+        current.bytes = report.bytes
+    with step('Escape new DB'):
+        escape_db(enviroment, env_manager=env_manager)
+    with step("Starting environment"):
+        compose_manager.up([enviroment])
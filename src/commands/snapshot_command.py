@@ -0,0 +1,58 @@
+import time
+
+import click
+
+from src.DatabaseManager import DatabaseManager, DEFAULT_JOBS
+from src.EnvManager import EnvManager
+from src.commands.refresh_enviroment_command import copy_live_database
+from src.constants import DB_USER, SNAPSHOT_DB
+from src.decorators import require_initiated, require_database
+from src.timings import step
+
+SNAPSHOT_CREATED_AT_KEY = 'SNAPSHOT_CREATED_AT'
+
+
+@click.command('snapshot')
+@click.option('--stream/--no-stream', default=True,
+              help='Pipe the dump directly into the restore without an intermediate file.')
+@click.option('--parallel', is_flag=True,
+              help='Use a directory format dump and restore it with multiple jobs. Disables streaming.')
+@click.option('--jobs', type=click.IntRange(min=1), default=DEFAULT_JOBS, show_default=True,
+              help='Number of jobs used for parallel dump and restore.')
+@click.pass_context
+def snapshot_command(ctx, stream, parallel, jobs):
+    snapshot(ctx.obj['compose_manager'], ctx.obj['env_manager'], stream=stream, jobs=jobs if parallel else None)
+
+
+def get_snapshot_age(env_manager: EnvManager):
+    """Returns the age of the live snapshot in seconds or None if no snapshot was created yet."""
+    created_at = env_manager.env_data.get(SNAPSHOT_CREATED_AT_KEY)
+    if not created_at:
+        return None
+    return int(time.time()) - int(created_at)
+
+
+@require_initiated
+@require_database
+def snapshot(compose_manager, env_manager, stream=True, jobs=None):
+    db_password = env_manager.read_value('MASTER_DB_PASSWORD')
+    new_snapshot = f'{SNAPSHOT_DB}_new'
+    created_at = int(time.time())
+
+    click.echo("Creating live snapshot")
+    # The old snapshot stays usable until the new one is complete
+    DatabaseManager(new_snapshot, DB_USER, db_password).drop_db()
+    copy_live_database(new_snapshot, DB_USER, env_manager, stream=stream, jobs=jobs)
+    with step("Replace old snapshot"):
+        DatabaseManager.terminate_sessions(SNAPSHOT_DB)
+        DatabaseManager(SNAPSHOT_DB, DB_USER, db_password).drop_db()
+        DatabaseManager.rename_db(new_snapshot, SNAPSHOT_DB)
+        # Nobody should work on the snapshot, it is only used as template
+        DatabaseManager.set_allow_connections(SNAPSHOT_DB, False)
+
+    if SNAPSHOT_CREATED_AT_KEY in env_manager.env_data:
+        env_manager.update_value(SNAPSHOT_CREATED_AT_KEY, str(created_at))
+    else:
+        env_manager.add_value(SNAPSHOT_CREATED_AT_KEY, str(created_at))
+    env_manager.save()
+    click.echo("Snapshot created successfully.")
@@ -1,3 +1,4 @@
 DB_PORT = 5432
 DB_USER = 'postgres'
 DEFAULT_DB = 'postgres'
+SNAPSHOT_DB = 'live_snapshot'
@@ -1,11 +1,10 @@
 from functools import wraps
 
 import click
-import docker
 
 REQUIRE_INIT_ERROR_CODE = 9
 
-from src.helper import get_service_health
+from src.helper import get_services_state
 
 
 def require_initiated(func):
@@ -36,14 +35,13 @@ def prevent_on_enviroment(disallowed_env):
 def require_database(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
-        try:
-            service_health = get_service_health('db')
-            if service_health != 'healthy':
-                click.echo("The database service is not healthy.", err=True)
-                exit(1)
-        except docker.errors.NotFound:
+        state = get_services_state(['db']).get('db')
+        if state is None:
             click.echo("The database service is not running.", err=True)
             exit(1)
+        if state.health != 'healthy':
+            click.echo("The database service is not healthy.", err=True)
+            exit(1)
         return func(*args, **kwargs)
 
     return wrapper
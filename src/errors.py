@@ -36,3 +36,7 @@ class OperationOnDatabaseDeniedException(DatabaseException):
 
 class DatabaseAlreadyExistsException(DatabaseException):
     pass
+
+
+class StreamingNotPossibleException(DatabaseException):
+    pass
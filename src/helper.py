@@ -1,16 +1,57 @@
 import difflib
+import importlib
+import importlib.util
+import json
+import os
 import re
 import secrets
+import shutil
 import socket
 import subprocess
+import sys
+import threading
 import time
+import types
+from typing import NamedTuple, Callable
 
 import click
-import docker
-from docker.errors import DockerException
+
+from src.error_codes import DOCKER_NOT_RUNNING_ERROR_CODE
+from src.timings import span
+
+
+_lazy_import_lock = threading.Lock()
+
+
+class LazyModule(types.ModuleType):
+    """Stands in for a module until an attribute of it is needed. Unlike importlib.util.LazyLoader, which is not
+    thread safe, the import is done under a lock, so threads that need the module at the same time all get the
+    loaded module instead of a partially executed one."""
+
+    def __getattr__(self, attribute):
+        # Only called for attributes the proxy does not have itself, i.e. those of the real module
+        with _lazy_import_lock:
+            module = importlib.import_module(self.__name__)
+        return getattr(module, attribute)
+
+
+def lazy_import(name: str):
+    """Returns the module without executing it. It is loaded on the first attribute access, which keeps the startup
+    of commands that do not need heavy dependencies fast."""
+    if name in sys.modules:
+        return sys.modules[name]
+    if importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError(f'No module named {name!r}', name=name)
+    return LazyModule(name)
+
+
+docker = lazy_import('docker')
 
 PASSWORD_LENGTH = 32
+DOCKER_VERSIONS_CACHE_TTL = 3600  # 1 hour
+PROBE_TIMEOUT = 5  # seconds
 SERVICE_READY_WAIT_TIME = 300  # 300 seconds = 5 minutes
+health_status_regex = re.compile(r'\((healthy|unhealthy|health: starting)\)')
 valid_hostname_regex = r'^([a-zA-Z0-9]|[a-zA-Z0-9][a-zA-Z0-9\-]*[a-zA-Z0-9])' \
                        r'(\.([a-zA-Z0-9]|[a-zA-Z0-9][a-zA-Z0-9\-]*[a-zA-Z0-9]))*$'
 
@@ -27,8 +68,12 @@ def get_local_ip():
     return ip
 
 
+def is_valid_hostname(hostname: str) -> bool:
+    return re.match(valid_hostname_regex, hostname) is not None
+
+
 def check_domain_and_subdomain(domain: str, dev=False) -> bool:
-    if not re.match(valid_hostname_regex, domain):
+    if not is_valid_hostname(domain):
         return False
 
     if dev:
@@ -42,15 +87,101 @@ def check_domain_and_subdomain(domain: str, dev=False) -> bool:
     return domain_ip == local_ip and test_subdomain_ip == local_ip
 
 
+_docker_client = None
+_docker_client_lock = threading.Lock()
+
+
+class ServiceState(NamedTuple):
+    status: str
+    health: str
+
+
+class ProbeResult(NamedTuple):
+    value: object
+    latency: float
+    error: str = None
+
+
 def get_docker_client():
-    return docker.from_env()
+    """Returns the docker client shared by the whole process. It is created on first use."""
+    global _docker_client
+    with _docker_client_lock:
+        if _docker_client is None:
+            _docker_client = docker.from_env()
+    return _docker_client
+
+
+def _parse_health(container: dict):
+    if 'Health' in container:
+        return container['Health'].get('Status') or None
+    # Older APIs only report the health as part of the status text, e.g. "Up 3 minutes (healthy)"
+    match = health_status_regex.search(container.get('Status', ''))
+    if match is None:
+        return None
+    return 'starting' if match.group(1) == 'health: starting' else match.group(1)
+
+
+def get_services_state(service_names=None) -> dict:
+    """Returns the status and health of all containers by name with a single API call."""
+    states = {}
+    for container in get_docker_client().api.containers(all=True):
+        for name in container.get('Names', []):
+            states[name.lstrip('/')] = ServiceState(container.get('State'), _parse_health(container))
+
+    if service_names is None:
+        return states
+    return {name: states[name] for name in service_names if name in states}
+
+
+def _get_docker_versions_cache_path() -> str:
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'aura-maintainer', 'docker_versions.json')
+
+
+def _get_docker_binary_mtime():
+    docker_binary = shutil.which('docker')
+    if docker_binary is None:
+        return None
+    return os.stat(docker_binary).st_mtime
 
 
-def get_docker_versions():
+def _read_cached_docker_versions():
+    binary_mtime = _get_docker_binary_mtime()
+    if binary_mtime is None:
+        return None
+    try:
+        with open(_get_docker_versions_cache_path(), 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # An update of docker replaces the binary, so the cache is only valid for the binary it was created with
+    expired = time.time() - cache.get('created_at', 0) > DOCKER_VERSIONS_CACHE_TTL
+    if cache.get('binary_mtime') != binary_mtime or expired:
+        return None
+    return cache['docker_version'], cache['docker_compose_version']
+
+
+def _write_cached_docker_versions(docker_version: str, docker_compose_version: str):
+    cache_path = _get_docker_versions_cache_path()
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, 'w') as f:
+            json.dump({'binary_mtime': _get_docker_binary_mtime(), 'created_at': time.time(),
+                       'docker_version': docker_version, 'docker_compose_version': docker_compose_version}, f)
+    except OSError:
+        pass  # The cache is only an optimization
+
+
+def get_docker_versions(use_cache: bool = False):
+    if use_cache:
+        cached_versions = _read_cached_docker_versions()
+        if cached_versions is not None:
+            return cached_versions
+
     try:
         client = get_docker_client()
         docker_version = client.version()['Version']
-    except DockerException:
+    except docker.errors.DockerException:
         docker_version = None
 
     try:
@@ -60,51 +191,125 @@ def get_docker_versions():
     except Exception:
         docker_compose_version = None
 
+    # Failures are not cached, a stopped docker daemon should be noticed as soon as it is started again
+    if use_cache and docker_version is not None and docker_compose_version is not None:
+        _write_cached_docker_versions(docker_version, docker_compose_version)
+
     return docker_version, docker_compose_version
 
 
+def ensure_docker_running():
+    """Exits if docker or docker compose are not installed or docker is not running."""
+    with span('check docker'):
+        docker_version, compose_version = get_docker_versions(use_cache=True)
+    if docker_version is None or compose_version is None:
+        click.echo("Docker and/or Docker Compose are not installed or running.", err=True)
+        exit(DOCKER_NOT_RUNNING_ERROR_CODE)
+
+
+def run_probes(probes: dict, timeout: float = PROBE_TIMEOUT) -> dict:
+    """Runs the probe functions concurrently and returns a ProbeResult for each of them.
+
+    Probes that did not finish within the timeout are reported as timed out. They keep running in a daemon thread,
+    so a hanging probe (e.g. a slow DNS resolver) never blocks the caller or the exit of the process."""
+    results = {}
+    start_time = time.monotonic()
+
+    def run(name: str, probe: Callable):
+        probe_start_time = time.monotonic()
+        try:
+            value = probe()
+        except Exception as e:
+            results[name] = ProbeResult(None, time.monotonic() - probe_start_time, str(e) or type(e).__name__)
+            return
+        results[name] = ProbeResult(value, time.monotonic() - probe_start_time)
+
+    threads = [threading.Thread(target=run, args=(name, probe), daemon=True) for name, probe in probes.items()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(max(0.0, start_time + timeout - time.monotonic()))
+
+    return {name: results.get(name, ProbeResult(None, time.monotonic() - start_time, 'timeout')) for name in probes}
+
+
 def generate_password(length=PASSWORD_LENGTH) -> str:
     return secrets.token_urlsafe(length)
 
 
-def ensure_services_healthy(service_names):
+def _check_current_health(service_names, pending: set, timings: dict):
+    """Removes the services that are already healthy from pending, exits if one is not running or unhealthy."""
+    states = get_services_state(service_names)
+    for service_name in list(pending):
+        if service_name not in states:
+            click.echo(f"The {service_name} service is not running.", err=True)
+            exit(5)
+
+        health_status = states[service_name].health
+        if health_status == 'healthy':
+            timings[service_name] = 0.0
+            pending.discard(service_name)
+        elif health_status == 'unhealthy':
+            click.echo(f"{service_name} is unhealthy. Please check your service.", err=True)
+            exit(6)
+        else:
+            click.echo(f"Waiting for {service_name} to become healthy...")
+
+
+def _watch_health_events(events, pending: set, timings: dict, start_time: float):
+    """Removes the services from pending as their health_status events arrive, until none is left or the event
+    stream ends. Exits if a service stops or becomes unhealthy."""
+    for event in events:
+        service_name = event.get('Actor', {}).get('Attributes', {}).get('name')
+        if service_name not in pending:
+            continue
+
+        action = event.get('Action') or event.get('status', '')
+        if action == 'die':
+            click.echo(f"The {service_name} service stopped while waiting for it.", err=True)
+            exit(5)
+        if not action.startswith('health_status'):
+            continue
+
+        health_status = action.split(':', 1)[-1].strip()
+        if health_status == 'healthy':
+            timings[service_name] = time.time() - start_time
+            pending.discard(service_name)
+            click.echo(f"{service_name} is now healthy ({timings[service_name]:.1f}s).")
+            if not pending:
+                return
+        elif health_status == 'unhealthy':
+            click.echo(f"{service_name} is unhealthy. Please check your service.", err=True)
+            exit(6)
+
+
+def ensure_services_healthy(service_names) -> dict:
+    """Waits until all services are healthy and returns the seconds each service needed to become healthy.
+
+    Instead of polling, the health_status events of all services are watched at once until a global deadline."""
     client = get_docker_client()
 
     start_time = time.time()
+    deadline = start_time + SERVICE_READY_WAIT_TIME
+    pending = set(service_names)
+    timings = {}
 
-    first_check = True
-
-    for service_name in service_names:
-        # Continue looping until the service is healthy or the timeout is reached
-        while True:
-            # Check if the timeout has been reached
-            elapsed_time = time.time() - start_time
-            if elapsed_time > SERVICE_READY_WAIT_TIME:
-                click.echo(f"Timeout reached while waiting for {service_name} to become healthy.", err=True)
-                exit(4)
-
-            # Get the service
-            try:
-                client.containers.get(service_name)
-            except docker.errors.NotFound:
-                click.echo(f"The {service_name} service is not running.", err=True)
-                exit(5)
-
-            # Get the health status
-            health_status = get_service_health(service_name)
-
-            if health_status == 'healthy':
-                if not first_check:
-                    click.echo(f"{service_name} is now healthy.")
-                break
-            elif health_status == 'unhealthy':
-                click.echo(f"{service_name} is unhealthy. Please check your service.", err=True)
-                exit(6)
-
-            # Sleep for a while before checking the status again
-            click.echo(f"Waiting for {service_name} to become healthy...")
-            first_check = False
-            time.sleep(5)
+    # Subscribe before checking the current state, so no status change in between is missed
+    events = client.events(decode=True, until=int(deadline) + 1,
+                           filters={'type': 'container', 'container': list(pending)})
+    try:
+        _check_current_health(service_names, pending, timings)
+        if pending:
+            # The event stream ends at the deadline
+            _watch_health_events(events, pending, timings, start_time)
+    finally:
+        events.close()
+
+    if pending:
+        click.echo(f"Timeout reached while waiting for {', '.join(sorted(pending))} to become healthy.", err=True)
+        exit(4)
+
+    return timings
 
 
 def get_service_health(service_name):
@@ -126,23 +331,48 @@ def remove_file_in_container(container_name: str, path: str, recursive: bool = F
     if recursive:
         rm_command += ' -r'
 
-    result = subprocess.run(['docker', 'compose', 'exec', container_name, 'sh', '-c', f'{rm_command} {path}'],
-                            capture_output=True, text=True)
+    # Imported here, the backends depend on this module
+    from src.DockerBackend import get_container_backend
+    with span(f'remove {path} in {container_name}'):
+        result = get_container_backend().exec(container_name, ['sh', '-c', f'{rm_command} {path}'])
 
     result.check_returncode()
 
     return True
 
 
-def copy_files_from_container(service_name: str, src_path: str, dest_path: str) -> bool:
-    result = subprocess.run(['docker', 'compose', 'cp', f'{service_name}:{src_path}', dest_path],
-                            capture_output=True, text=True)
+def copy_files_from_container(service_name: str, src_path: str, dest_path: str, include: list = None,
+                              exclude: list = None, resume: bool = False, progress: bool = False) -> bool:
+    """Copies the path from the container by extracting its archive while it is streamed. See extract_archive for
+    the include and exclude patterns and resume. With progress the copied files and throughput are printed every few
+    seconds."""
+    from src.DockerBackend import get_container_backend, extract_archive
 
-    result.check_returncode()
+    def print_progress(report):
+        click.echo(f'  {service_name}:{src_path}: {report}')
+
+    with span(f'copy {service_name}:{src_path}') as current:
+        chunks = get_container_backend().get_archive(service_name, src_path)
+        try:
+            report = extract_archive(chunks, dest_path, include=include, exclude=exclude, resume=resume,
+                                     progress=print_progress if progress else None)
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+        current.bytes = report.bytes
+
+    if progress:
+        print_progress(report)
 
     return True
 
 
+def format_throughput(num_bytes: int, seconds: float) -> str:
+    megabytes = num_bytes / (1024 * 1024)
+    rate = megabytes / seconds if seconds > 0 else 0.0
+    return f'{megabytes:.1f} MB in {seconds:.1f}s ({rate:.1f} MB/s)'
+
+
 def display_diff(string1: str, string2: str) -> str:
     output = []
     matcher = difflib.SequenceMatcher(None, string1, string2)
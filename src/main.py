@@ -1,35 +1,73 @@
 import click
 
 from src.ComposeManager import ComposeManager
+from src.DatabaseManager import SqlCatalogBackend, configure_catalog_backend
+from src.DockerBackend import BACKEND_SDK, BACKENDS, configure_container_backend
 from src.EnvManager import EnvManager
-from src.commands import change_domain_command, init_command, generate_command, inspect_command, mount_modules_command, \
-    refresh_enviroment_command
-from src.error_codes import DOCKER_NOT_RUNNING_ERROR_CODE
-from src.helper import get_docker_versions
+from src.SourceCache import SOURCE_MODE_COPY, SOURCE_MODES
+from src.commands import change_domain_command, init_command, generate_command, inspect_command, \
+    manage_dev_env_command, mount_modules_command, refresh_enviroment_command, snapshot_command
+from src.helper import ensure_docker_running
+from src import timings
+
+# Commands that only work on the configuration files or check docker themselves, e.g. generate with --apply
+DOCKER_INDEPENDENT_COMMANDS = ['generate', 'change-domain', 'inspect']
+
+
+def report_timings(tree: bool, json_file):
+    root = timings.get_root()
+    if tree:
+        click.echo(timings.render_tree(root), err=True)
+    if json_file is not None:
+        json_file.write(timings.render_json(root) + '\n')
 
 
 @click.group()
+@click.option('--timings', 'show_timings', is_flag=True, help='Print how long each step took when the command ends.')
+@click.option('--timings-json', type=click.File('w'),
+              help='Write how long each step took as JSON to the file when the command ends, - for stdout.')
 @click.pass_context
-def cli(ctx):
+def cli(ctx, show_timings, timings_json):
+    timings.reset()
+    if show_timings or timings_json is not None:
+        # Also called if the command fails or exits early
+        ctx.call_on_close(lambda: report_timings(show_timings, timings_json))
+
     # Check if Docker is installed & running
-    docker_version, compose_version = get_docker_versions()
-    if docker_version is None or compose_version is None:
-        click.echo("Docker and/or Docker Compose are not installed or running.", err=True)
-        exit(DOCKER_NOT_RUNNING_ERROR_CODE)
+    if ctx.invoked_subcommand not in DOCKER_INDEPENDENT_COMMANDS:
+        ensure_docker_running()
 
     ctx.obj = {
         'compose_manager': ComposeManager(),
         'env_manager': EnvManager(),
     }
 
+    # Talk to the containers through the docker API unless the CLI is configured
+    container_backend = ctx.obj['env_manager'].env_data.get('CONTAINER_BACKEND', BACKEND_SDK)
+    if container_backend not in BACKENDS:
+        click.echo(f"Unknown CONTAINER_BACKEND {container_backend}. Use one of: {', '.join(BACKENDS)}", err=True)
+        exit(1)
+    configure_container_backend(container_backend)
+
+    source_mode = ctx.obj['env_manager'].env_data.get('SOURCE_MODE', SOURCE_MODE_COPY)
+    if source_mode not in SOURCE_MODES:
+        click.echo(f"Unknown SOURCE_MODE {source_mode}. Use one of: {', '.join(SOURCE_MODES)}", err=True)
+        exit(1)
+
+    # Check, create and drop databases over SQL instead of a docker exec session per operation
+    master_db_password = ctx.obj['env_manager'].env_data.get('MASTER_DB_PASSWORD')
+    if master_db_password:
+        configure_catalog_backend(SqlCatalogBackend(master_db_password))
+
 
 cli.add_command(init_command.init_command)
 cli.add_command(change_domain_command.change_domain_command)
 cli.add_command(generate_command.generate_command)
 cli.add_command(inspect_command.inspect_command)
-# cli.add_command(manage_dev_env_command.command_)
+cli.add_command(manage_dev_env_command.manage_dev_env)
 cli.add_command(mount_modules_command.command_mount_modules)
 cli.add_command(refresh_enviroment_command.refresh_enviroment_cli)
+cli.add_command(snapshot_command.snapshot_command)
 
 if __name__ == '__main__':
     cli()
@@ -0,0 +1,160 @@
+"""Configuration of the PgBouncer connection pooler between the Odoo services and postgres.
+
+The Odoo services connect to the pooler with their own roles. Live keeps session pooling, the other environments
+share the server connections with transaction pooling. The roles and passwords are taken from the .env file.
+"""
+import os
+
+from src.DockerBackend import get_container_backend
+from src.Services import POSTGRES_PORT
+from src.helper import docker
+from src.sizing import POSTGRES_MAX_CONNECTIONS, DB_CONNECTION_FRACTION, MIN_POOL_SIZE, SIZING_AUTO, \
+    get_expected_connections, get_max_connections, get_postgres_connections, size_services
+
+PGBOUNCER_SERVICE = 'pgbouncer'
+PGBOUNCER_CONFIG_PATH = './volumes/pgbouncer'
+POOL_MODE_SESSION = 'session'
+POOL_MODE_TRANSACTION = 'transaction'
+# Environments whose connections are not shared, e.g. for LISTEN/NOTIFY of the bus
+SESSION_POOLED_SERVICES = ['live']
+# Server connections of a session pooled service without sizing
+DEFAULT_SESSION_POOL_SIZE = 20
+MIN_CLIENT_CONNECTIONS = 100
+
+
+def is_enabled(env_manager) -> bool:
+    return env_manager.env_data.get('PGBOUNCER', '0') == '1'
+
+
+def get_db_host(env_manager) -> str:
+    """Returns the host the Odoo services connect to."""
+    return PGBOUNCER_SERVICE if is_enabled(env_manager) else 'db'
+
+
+def apply_db_host(service: dict, db_host: str) -> dict:
+    """Points a service configuration, e.g. of a dev environment, which is not generated again, to the database
+    host."""
+    service['environment'] = [f'DB_HOST={db_host}' if variable.startswith('DB_HOST=') else variable
+                              for variable in service.get('environment') or []]
+    depends_on = [dependency for dependency in service.get('depends_on') or [] if dependency != PGBOUNCER_SERVICE]
+    if db_host not in depends_on:
+        depends_on.append(db_host)
+    service['depends_on'] = depends_on
+    return service
+
+
+def get_pool_mode(service_name: str) -> str:
+    return POOL_MODE_SESSION if service_name in SESSION_POOLED_SERVICES else POOL_MODE_TRANSACTION
+
+
+def get_transaction_pooled_services(service_names: list) -> list:
+    """Returns the services that share the server connections, see size_services."""
+    return [service_name for service_name in service_names if get_pool_mode(service_name) == POOL_MODE_TRANSACTION]
+
+
+def get_passwords(env_manager, service_names: list) -> dict:
+    """Returns the password of the role of every service that has one in the .env file."""
+    passwords = {}
+    for service_name in service_names:
+        password = env_manager.env_data.get(f'{service_name}_DB_PASSWORD'.upper())
+        if password:
+            passwords[service_name] = password
+    return passwords
+
+
+def get_pool_sizes(service_names: list, sizes: dict = None, max_connections: int = POSTGRES_MAX_CONNECTIONS) -> dict:
+    """Returns the server connections of every service. Session pooled services need one for every connection of
+    their processes, the other services share what is left of the connections of postgres. Raises ValueError if
+    there is not at least one connection left for every shared service."""
+    sizes = sizes or {}
+    pool_sizes = {}
+    for service_name in service_names:
+        if get_pool_mode(service_name) == POOL_MODE_SESSION:
+            sizing = sizes.get(service_name)
+            pool_sizes[service_name] = sizing.processes * sizing.db_maxconn if sizing else DEFAULT_SESSION_POOL_SIZE
+
+    shared_services = [service_name for service_name in service_names if service_name not in pool_sizes]
+    left = int(max_connections * DB_CONNECTION_FRACTION) - sum(pool_sizes.values())
+    if shared_services and left < len(shared_services):
+        raise ValueError(f'{left} connections of postgres are left for {len(shared_services)} services with '
+                         f'transaction pooling, raise max_connections')
+    for service_name in shared_services:
+        pool_sizes[service_name] = left // len(shared_services)
+    return {service_name: pool_sizes[service_name] for service_name in service_names}
+
+
+def render_ini(service_names: list, sizes: dict = None, max_connections: int = POSTGRES_MAX_CONNECTIONS) -> str:
+    lines = ['[databases]']
+    lines += [f'{service_name} = host=db port={POSTGRES_PORT} dbname={service_name} '
+              f'pool_mode={get_pool_mode(service_name)} pool_size={pool_size}'
+              for service_name, pool_size in get_pool_sizes(service_names, sizes, max_connections).items()]
+    lines += [
+        # Other databases, e.g. postgres for listing the databases, are passed through
+        f'* = host=db port={POSTGRES_PORT}',
+        '',
+        '[pgbouncer]',
+        'listen_addr = 0.0.0.0',
+        f'listen_port = {POSTGRES_PORT}',
+        'auth_type = scram-sha-256',
+        'auth_file = /etc/pgbouncer/userlist.txt',
+        f'pool_mode = {POOL_MODE_SESSION}',
+        f'max_client_conn = {max(MIN_CLIENT_CONNECTIONS, get_expected_connections(sizes or {}))}',
+        f'default_pool_size = {MIN_POOL_SIZE}',
+        'server_reset_query = DISCARD ALL',
+        'ignore_startup_parameters = extra_float_digits',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def render_userlist(passwords: dict) -> str:
+    def quote(value: str) -> str:
+        return '"' + value.replace('"', '""') + '"'
+
+    return ''.join(f'{quote(role)} {quote(password)}\n' for role, password in passwords.items())
+
+
+def write_config(env_manager, service_names: list, sizes: dict = None, path: str = PGBOUNCER_CONFIG_PATH,
+                 max_connections: int = POSTGRES_MAX_CONNECTIONS) -> bool:
+    """Writes pgbouncer.ini and userlist.txt for the services. Returns whether a file changed."""
+    os.makedirs(path, exist_ok=True)
+    changed = False
+    for file_name, content in [('pgbouncer.ini', render_ini(service_names, sizes, max_connections)),
+                               ('userlist.txt', render_userlist(get_passwords(env_manager, service_names)))]:
+        file_path = os.path.join(path, file_name)
+        if os.path.exists(file_path):
+            with open(file_path, 'r') as f:
+                if f.read() == content:
+                    continue
+        with open(file_path, 'w') as f:
+            f.write(content)
+        changed = True
+    return changed
+
+
+def reload() -> bool:
+    """Lets a running pooler read its configuration again. Does nothing if it or docker is not running, it reads the
+    configuration when it starts. Returns whether it was reloaded."""
+    try:
+        return get_container_backend().exec(PGBOUNCER_SERVICE, ['kill', '-HUP', '1']).returncode == 0
+    except (docker.errors.DockerException, OSError):
+        return False
+
+
+def update_config(compose_manager, env_manager, sizes: dict = None) -> bool:
+    """Writes the configuration for the Odoo services of the compose file and reloads a running pooler if it
+    changed. The services are sized like generate does if no sizes are given, and postgres is expected to have the
+    max_connections tune_postgres sets for them. Returns whether it changed."""
+    if not is_enabled(env_manager):
+        return False
+    service_names = [service_name for service_name in compose_manager.services
+                     if service_name in ('live', 'pre') or service_name.startswith('odoo_dev')]
+    pooled_services = get_transaction_pooled_services(service_names)
+    if sizes is None and env_manager.env_data.get('SIZING', SIZING_AUTO) == SIZING_AUTO:
+        sizes = size_services(service_names, pooled_services=pooled_services)
+    # Without sizing postgres keeps its default
+    max_connections = get_max_connections(get_postgres_connections(sizes, pooled_services)) if sizes \
+        else POSTGRES_MAX_CONNECTIONS
+    if not write_config(env_manager, service_names, sizes, max_connections=max_connections):
+        return False
+    reload()
+    return True
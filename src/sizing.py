@@ -0,0 +1,290 @@
+"""Splits the CPU and memory of the host between the Odoo services and tunes postgres for the host.
+
+The live environment gets the largest share, pre the next and the dev environments split the rest. Every service gets
+worker, memory and time limits for Odoo and compose resource limits that fit its share. Postgres gets the memory that
+is left for it and settings in the way of pgtune for the expected number of connections.
+"""
+import math
+import os
+import textwrap
+from typing import NamedTuple
+
+PRIORITY_LIVE = 'live'
+PRIORITY_PRE = 'pre'
+PRIORITY_DEV = 'dev'
+# Share of the host each priority gets, split evenly between its services
+PRIORITY_SHARES = {PRIORITY_LIVE: 0.5, PRIORITY_PRE: 0.2, PRIORITY_DEV: 0.3}
+MAX_CRON_THREADS = {PRIORITY_LIVE: 2, PRIORITY_PRE: 1, PRIORITY_DEV: 1}
+# A dev environment serves a few developers, more workers would only hold memory
+MAX_WORKERS = {PRIORITY_DEV: 2}
+# Services of a lower priority give up their workers first if the host is too small for all of them
+PRIORITY_ORDER = [PRIORITY_DEV, PRIORITY_PRE, PRIORITY_LIVE]
+# The master process and the gevent process of the websocket run next to the workers and cron threads
+EXTRA_PROCESSES = 2
+# Memory left for postgres, the proxy and the system
+RESERVED_MEMORY_FRACTION = 0.25
+MIN_LIMIT_MEMORY = 512 * 1024 * 1024
+MAX_LIMIT_MEMORY = 2560 * 1024 * 1024  # Default hard limit of Odoo
+SOFT_LIMIT_FRACTION = 0.8
+MIN_CPUS = 0.5
+LIMIT_TIME_CPU = 600
+LIMIT_TIME_REAL = 1200
+MIN_DB_MAXCONN = 2
+MAX_DB_MAXCONN = 64  # Default of Odoo
+# Connections of postgres the Odoo processes may use together, the rest is left for maintenance
+DB_CONNECTION_FRACTION = 0.8
+# Connections of a process to the pooler, which are cheap compared to those of postgres
+POOLED_DB_MAXCONN = 16
+# Server connections the pooler keeps at least for a database
+MIN_POOL_SIZE = 2
+POSTGRES_MAX_CONNECTIONS = 100
+POSTGRES_PROFILE_OLTP = 'oltp'
+POSTGRES_PROFILE_MIXED = 'mixed'
+POSTGRES_PROFILES = [POSTGRES_PROFILE_OLTP, POSTGRES_PROFILE_MIXED]
+# Mixed workloads run larger queries, which get more memory per operation and use less connections
+WORK_MEM_DIVISORS = {POSTGRES_PROFILE_OLTP: 1, POSTGRES_PROFILE_MIXED: 2}
+WAL_SIZES = {POSTGRES_PROFILE_OLTP: ('2GB', '8GB'), POSTGRES_PROFILE_MIXED: ('1GB', '4GB')}
+MAX_MAINTENANCE_WORK_MEM = 2 * 1024 ** 3
+MAX_WAL_BUFFERS = 16 * 1024 * 1024
+MIN_WORK_MEM = 64 * 1024
+MIN_SHM_SIZE = 256 * 1024 * 1024
+MAX_PARALLEL_WORKERS_PER_GATHER = 4
+# Memory of a postgres connection besides its work_mem, connections above the default take it from the buffers
+CONNECTION_MEMORY = 10 * 1024 * 1024
+SIZING_AUTO = 'auto'
+SIZING_OFF = 'off'
+SIZING_MODES = [SIZING_AUTO, SIZING_OFF]
+# Environment variables of the Odoo image set by the sizing
+SIZING_VARIABLES = ['WORKERS', 'MAX_CRON_THREADS', 'LIMIT_MEMORY_SOFT', 'LIMIT_MEMORY_HARD', 'LIMIT_TIME_CPU',
+                    'LIMIT_TIME_REAL', 'DB_MAXCONN']
+
+
+class HostResources(NamedTuple):
+    cpus: int
+    memory: int  # bytes
+
+
+class Sizing(NamedTuple):
+    workers: int
+    max_cron_threads: int
+    limit_memory_soft: int
+    limit_memory_hard: int
+    limit_time_cpu: int
+    limit_time_real: int
+    db_maxconn: int
+    cpus: float
+    memory: int  # bytes
+
+    @property
+    def processes(self) -> int:
+        return self.workers + self.max_cron_threads + EXTRA_PROCESSES
+
+    def environment(self) -> list:
+        return [f'{variable}={value}' for variable, value in zip(SIZING_VARIABLES, self[:len(SIZING_VARIABLES)])]
+
+    def deploy(self) -> dict:
+        return {'resources': {'limits': {'cpus': str(self.cpus), 'memory': f'{self.memory // (1024 * 1024)}M'}}}
+
+
+class PostgresTuning(NamedTuple):
+    settings: dict
+    shm_size: int  # bytes
+
+    def command(self) -> list:
+        command = ['postgres']
+        for setting, value in self.settings.items():
+            command += ['-c', f'{setting}={value}']
+        return command
+
+
+def _read_cgroup_memory_limit():
+    try:
+        with open('/sys/fs/cgroup/memory.max', 'r') as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    return int(value) if value.isdigit() else None
+
+
+def get_host_resources() -> HostResources:
+    """Returns the CPUs and memory usable by this process, which respects CPU affinity and a cgroup memory limit."""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+    memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    cgroup_limit = _read_cgroup_memory_limit()
+    if cgroup_limit is not None:
+        memory = min(memory, cgroup_limit)
+    return HostResources(cpus, memory)
+
+
+def get_priority(service_name: str) -> str:
+    if service_name == 'live':
+        return PRIORITY_LIVE
+    if service_name == 'pre':
+        return PRIORITY_PRE
+    return PRIORITY_DEV
+
+
+def get_shares(service_names: list) -> dict:
+    """Returns the share of the host for each service. Shares of priorities without services go to the others."""
+    counts = {}
+    for service_name in service_names:
+        priority = get_priority(service_name)
+        counts[priority] = counts.get(priority, 0) + 1
+    total = sum(PRIORITY_SHARES[priority] for priority in counts)
+    return {service_name: PRIORITY_SHARES[get_priority(service_name)] / total / counts[get_priority(service_name)]
+            for service_name in service_names}
+
+
+def cut_workers(workers: dict, other_processes: dict, max_processes: int):
+    """Removes workers until all processes fit into max_processes, from the services of the lowest priority and with
+    the most workers first. Every service keeps at least one worker."""
+    while sum(workers.values()) + sum(other_processes.values()) > max_processes:
+        candidates = [service_name for service_name in workers if workers[service_name] > 1]
+        if not candidates:
+            return
+        service_name = min(candidates, key=lambda name: (PRIORITY_ORDER.index(get_priority(name)), -workers[name]))
+        workers[service_name] -= 1
+
+
+def size_services(service_names: list, host: HostResources = None, max_connections: int = POSTGRES_MAX_CONNECTIONS,
+                  pooled_services: list = ()) -> dict:
+    """Returns the Sizing of every service by name. The memory of all services together stays within the memory of
+    the host that is not reserved, and the connections of all processes within the connections of postgres. If the
+    host is too small for that, workers are removed from the services of the lowest priority first.
+
+    The pooled services connect to a pooler that shares a few connections of postgres between their processes, see
+    src.pgbouncer. Only their pools count against the connections of postgres."""
+    host = host or get_host_resources()
+    # Odoo recommends two workers per CPU plus one
+    total_workers = host.cpus * 2 + 1
+    available_memory = host.memory * (1 - RESERVED_MEMORY_FRACTION)
+
+    shares = get_shares(service_names)
+    memory = {service_name: int(available_memory * share) for service_name, share in shares.items()}
+    other_processes = {service_name: MAX_CRON_THREADS[get_priority(service_name)] + EXTRA_PROCESSES
+                       for service_name in service_names}
+    workers = {}
+    for service_name, share in shares.items():
+        # Not more workers than fit into the memory of the service with the minimal limit
+        workers[service_name] = max(1, min(int(total_workers * share),
+                                           memory[service_name] // MIN_LIMIT_MEMORY - other_processes[service_name],
+                                           MAX_WORKERS.get(get_priority(service_name), total_workers)))
+
+    # Every process connecting to postgres directly has its own connection pool, together they have to fit into the
+    # connections of postgres next to the pools of the pooler
+    direct_services = [service_name for service_name in service_names if service_name not in pooled_services]
+    pools = MIN_POOL_SIZE * (len(service_names) - len(direct_services))
+    connections = int(max_connections * DB_CONNECTION_FRACTION) - pools
+    direct_workers = {service_name: workers[service_name] for service_name in direct_services}
+    direct_other_processes = {service_name: other_processes[service_name] for service_name in direct_services}
+    cut_workers(direct_workers, direct_other_processes, max(0, connections) // MIN_DB_MAXCONN)
+    workers.update(direct_workers)
+    processes = sum(direct_workers.values()) + sum(direct_other_processes.values())
+    db_maxconn = max(MIN_DB_MAXCONN, min(MAX_DB_MAXCONN, connections // processes)) if processes else MAX_DB_MAXCONN
+
+    sizes = {}
+    for service_name in service_names:
+        service_processes = workers[service_name] + other_processes[service_name]
+        # Below the minimal limit only if even a single worker does not fit, the limits never exceed the memory
+        limit_memory_hard = min(MAX_LIMIT_MEMORY, memory[service_name] // service_processes)
+        sizes[service_name] = Sizing(workers[service_name], MAX_CRON_THREADS[get_priority(service_name)],
+                                     int(limit_memory_hard * SOFT_LIMIT_FRACTION), limit_memory_hard, LIMIT_TIME_CPU,
+                                     LIMIT_TIME_REAL,
+                                     POOLED_DB_MAXCONN if service_name in pooled_services else db_maxconn,
+                                     round(min(host.cpus, max(MIN_CPUS, host.cpus * shares[service_name])), 2),
+                                     memory[service_name])
+    return sizes
+
+
+def format_postgres_memory(num_bytes: int) -> str:
+    if num_bytes >= 1024 * 1024:
+        return f'{num_bytes // (1024 * 1024)}MB'
+    return f'{max(num_bytes // 1024, 1)}kB'
+
+
+def get_max_connections(expected_connections: int, max_connections: int = POSTGRES_MAX_CONNECTIONS) -> int:
+    """Returns max_connections raised so the expected connections fit next to the ones left for maintenance."""
+    return max(max_connections, math.ceil(expected_connections / DB_CONNECTION_FRACTION))
+
+
+def tune_postgres(host: HostResources = None, max_connections: int = POSTGRES_MAX_CONNECTIONS,
+                  profile: str = POSTGRES_PROFILE_OLTP, expected_connections: int = None) -> PostgresTuning:
+    """Returns the postgres settings for the memory left by the Odoo services, assuming SSD storage. The memory per
+    operation is based on the expected connections, e.g. of get_expected_connections, or max_connections.
+    max_connections is raised if the expected connections do not fit, see get_max_connections."""
+    if profile not in POSTGRES_PROFILES:
+        raise ValueError(f'Unknown postgres profile {profile}')
+    host = host or get_host_resources()
+    max_connections = get_max_connections(expected_connections or 0, max_connections)
+    memory = int(host.memory * RESERVED_MEMORY_FRACTION)
+    # Never less than half of the memory for the buffers and the operations
+    usable_memory = max(memory // 2, memory - max(0, max_connections - POSTGRES_MAX_CONNECTIONS) * CONNECTION_MEMORY)
+
+    shared_buffers = usable_memory // 4
+    settings = {
+        'max_connections': max_connections,
+        'shared_buffers': format_postgres_memory(shared_buffers),
+        'effective_cache_size': format_postgres_memory(memory * 3 // 4),
+        'maintenance_work_mem': format_postgres_memory(min(memory // 16, MAX_MAINTENANCE_WORK_MEM)),
+        'checkpoint_completion_target': 0.9,
+        'wal_buffers': format_postgres_memory(min(shared_buffers * 3 // 100, MAX_WAL_BUFFERS)),
+        'default_statistics_target': 100,
+        'random_page_cost': 1.1,
+        'effective_io_concurrency': 200,
+        'min_wal_size': WAL_SIZES[profile][0],
+        'max_wal_size': WAL_SIZES[profile][1],
+    }
+
+    parallel_workers_per_gather = 1
+    if host.cpus >= 4:
+        parallel_workers_per_gather = min(math.ceil(host.cpus / 2), MAX_PARALLEL_WORKERS_PER_GATHER)
+        settings.update({
+            'max_worker_processes': host.cpus,
+            'max_parallel_workers_per_gather': parallel_workers_per_gather,
+            'max_parallel_workers': host.cpus,
+            'max_parallel_maintenance_workers': parallel_workers_per_gather,
+        })
+
+    # Every connection may run a few sorts or hashes at the same time, each of the parallel workers with its own
+    connections = min(expected_connections or max_connections, max_connections)
+    work_mem = (usable_memory - shared_buffers) // (connections * 3) // parallel_workers_per_gather
+    settings['work_mem'] = format_postgres_memory(max(work_mem // WORK_MEM_DIVISORS[profile], MIN_WORK_MEM))
+
+    # Parallel queries exchange their data in /dev/shm, the 64 MB of docker are too small for them
+    return PostgresTuning(settings, max(MIN_SHM_SIZE, shared_buffers))
+
+
+def get_expected_connections(sizes: dict) -> int:
+    """Returns the connections the Odoo services open at most."""
+    return sum(sizing.processes * sizing.db_maxconn for sizing in sizes.values())
+
+
+def get_postgres_connections(sizes: dict, pooled_services: list = ()) -> int:
+    """Returns the connections of postgres the Odoo services use at most, the pooled services at least the minimal
+    pool each. See size_services."""
+    return get_expected_connections({service_name: sizing for service_name, sizing in sizes.items()
+                                     if service_name not in pooled_services}) + \
+        MIN_POOL_SIZE * len([service_name for service_name in sizes if service_name in pooled_services])
+
+
+def apply_sizing(service: dict, sizing: Sizing) -> dict:
+    """Replaces the sizing of a service configuration, e.g. of a dev environment, which is not generated again."""
+    environment = [variable for variable in service.get('environment') or []
+                   if variable.partition('=')[0] not in SIZING_VARIABLES]
+    service['environment'] = environment + sizing.environment()
+    service['deploy'] = sizing.deploy()
+    return service
+
+
+def render_sizing(sizes: dict, host: HostResources, postgres_tuning: PostgresTuning = None) -> str:
+    lines = [f'Sizing for {host.cpus} CPUs and {host.memory / (1024 ** 3):.1f} GB memory:']
+    for service_name, sizing in sizes.items():
+        lines.append(f'  {service_name:<20} {sizing.workers:>3} workers {sizing.max_cron_threads:>2} cron  '
+                     f'memory {sizing.limit_memory_hard // (1024 * 1024):>5} MB/process '
+                     f'{sizing.memory // (1024 * 1024):>6} MB total  {sizing.cpus:>5} CPUs  '
+                     f'db_maxconn {sizing.db_maxconn}')
+    if postgres_tuning is not None:
+        lines.append(f'  {"db":<20} shm_size {format_postgres_memory(postgres_tuning.shm_size)}')
+        lines += textwrap.wrap(' '.join(f'{setting}={value}' for setting, value in postgres_tuning.settings.items()),
+                               width=120, initial_indent=' ' * 4, subsequent_indent=' ' * 4)
+    return '\n'.join(lines)
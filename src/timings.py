@@ -0,0 +1,96 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import click
+
+
+class Span:
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        # Bytes moved in the step, where known
+        self.bytes = None
+        self.children = []
+
+    @property
+    def seconds(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self) -> dict:
+        data = {'name': self.name, 'seconds': round(self.seconds, 6)}
+        if self.bytes is not None:
+            data['bytes'] = self.bytes
+        if self.children:
+            data['children'] = [child.to_dict() for child in self.children]
+        return data
+
+
+_root = Span('total')
+_local = threading.local()
+
+
+def _get_stack() -> list:
+    # Spans opened in other threads are attached to the root
+    if not hasattr(_local, 'stack'):
+        _local.stack = [_root]
+    return _local.stack
+
+
+def get_root() -> Span:
+    return _root
+
+
+def reset():
+    global _root
+    _root = Span('total')
+    _local.__dict__.clear()
+
+
+@contextmanager
+def span(name: str):
+    """Measures the enclosed block as a child of the current span. Recording is cheap, so spans are always recorded
+    and only reported if requested."""
+    stack = _get_stack()
+    current = Span(name)
+    stack[-1].children.append(current)
+    stack.append(current)
+    try:
+        yield current
+    finally:
+        current.end = time.perf_counter()
+        stack.pop()
+
+
+@contextmanager
+def step(message: str):
+    """Prints the step like the other progress lines of the commands and measures it."""
+    click.echo(f'* {message}')
+    with span(message) as current:
+        yield current
+
+
+def _format_bytes(num_bytes: int) -> str:
+    return f'{num_bytes / (1024 * 1024):.1f} MB'
+
+
+def render_tree(root: Span = None) -> str:
+    root = root or _root
+    lines = []
+
+    def render(current: Span, depth: int):
+        line = f'{"  " * depth}{current.name:<{max(40 - 2 * depth, 1)}} {current.seconds:8.2f}s'
+        if current.bytes is not None:
+            line += f'  {_format_bytes(current.bytes)}'
+        lines.append(line)
+        for child in current.children:
+            render(child, depth + 1)
+
+    render(root, 0)
+    return '\n'.join(lines)
+
+
+def render_json(root: Span = None) -> str:
+    return json.dumps((root or _root).to_dict())
@@ -0,0 +1,88 @@
+"""Dynamic configuration of traefik, read by its file provider from /etc/traefik.
+
+It defines the middlewares the labels of the services reference: compression, basic auth, the websocket headers and
+the cache headers of the static files.
+"""
+import base64
+import hashlib
+import os
+
+from src.ComposeManager import dump_yaml
+
+DYNAMIC_CONFIG_FILE = 'dynamic.yml'
+BASIC_AUTH_USER = 'admin'
+# Compressing is not worth it for small responses, or for files that are compressed already
+COMPRESS_MIN_RESPONSE_BODY_BYTES = 1024
+COMPRESS_EXCLUDED_CONTENT_TYPES = [
+    'image/png', 'image/jpeg', 'image/gif', 'image/webp', 'image/x-icon',
+    'font/woff', 'font/woff2',
+    'application/zip', 'application/gzip', 'application/pdf', 'application/octet-stream',
+    'text/event-stream',
+]
+# The asset bundles contain a hash of their content in the URL and never change
+ASSETS_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Static files of the modules keep their URL when a module is updated
+STATIC_CACHE_CONTROL = 'public, max-age=86400'
+
+
+def get_config_path(proxy_name: str = 'proxy') -> str:
+    return f'./volumes/{proxy_name}/config'
+
+
+def hash_password(password: str) -> str:
+    """Returns the password in the SHA1 format of htpasswd, which traefik supports without extra dependencies. The
+    passwords are generated with enough entropy that the missing salt does not matter."""
+    return '{SHA}' + base64.b64encode(hashlib.sha1(password.encode()).digest()).decode()
+
+
+def render_dynamic_config(basic_auth_users: dict, https: bool = True) -> dict:
+    """Returns the dynamic configuration for the users with their plain passwords."""
+    return {
+        'http': {
+            'middlewares': {
+                'gzip': {
+                    'compress': {
+                        'minResponseBodyBytes': COMPRESS_MIN_RESPONSE_BODY_BYTES,
+                        'excludedContentTypes': COMPRESS_EXCLUDED_CONTENT_TYPES,
+                    }
+                },
+                'basic_auth': {
+                    'basicAuth': {
+                        'users': [f'{user}:{hash_password(password)}' for user, password in basic_auth_users.items()],
+                        'removeHeader': True,
+                    }
+                },
+                'websocketHeader': {
+                    'headers': {
+                        'customRequestHeaders': {'X-Forwarded-Proto': 'https' if https else 'http'}
+                    }
+                },
+                'assetsCache': {
+                    'headers': {
+                        'customResponseHeaders': {'Cache-Control': ASSETS_CACHE_CONTROL}
+                    }
+                },
+                'staticCache': {
+                    'headers': {
+                        'customResponseHeaders': {'Cache-Control': STATIC_CACHE_CONTROL}
+                    }
+                },
+            }
+        }
+    }
+
+
+def write_dynamic_config(config: dict, path: str = None) -> bool:
+    """Writes the configuration to the directory of the file provider. Returns whether the file changed, an
+    unchanged file is not written to not trigger a reload of traefik."""
+    path = path or get_config_path()
+    os.makedirs(path, exist_ok=True)
+    file_path = os.path.join(path, DYNAMIC_CONFIG_FILE)
+    rendered = dump_yaml(config)
+    if os.path.exists(file_path):
+        with open(file_path, 'r') as f:
+            if f.read() == rendered:
+                return False
+    with open(file_path, 'w') as f:
+        f.write(rendered)
+    return True
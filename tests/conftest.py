@@ -0,0 +1,10 @@
+import pytest
+
+from src import DatabaseManager, DockerBackend
+
+
+@pytest.fixture(autouse=True)
+def default_backends(monkeypatch):
+    """The cli configures process wide backends, every test starts with the defaults."""
+    monkeypatch.setattr(DockerBackend, '_container_backend', DockerBackend.ComposeCliBackend())
+    monkeypatch.setattr(DatabaseManager, '_catalog_backend', DatabaseManager.ExecCatalogBackend())
@@ -8,6 +8,7 @@ import pytest
 from click.testing import CliRunner
 from docker.errors import DockerException
 
+from src import helper
 from src.error_codes import DOCKER_NOT_RUNNING_ERROR_CODE, DOMAIN_NOT_CONFIGURED_ERROR_CODE
 from src.main import cli
 
@@ -65,9 +66,11 @@ class TestInitCommand:
             assert any(service == container.name and container.status == 'running' for container in containers), \
                 f"Service {service} is not running"
 
-    def test_if_command_does_not_run_if_docker_and_compose_does_not_run(self, monkeypatch):
+    def test_if_command_does_not_run_if_docker_and_compose_does_not_run(self, monkeypatch, tmp_path):
         # Mock Docker to simulate it is not installed
         monkeypatch.setattr(docker, 'from_env', raise_docker_not_running)
+        monkeypatch.setattr(helper, '_docker_client', None)
+        monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
 
         runner = CliRunner()
 
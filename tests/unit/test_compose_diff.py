@@ -0,0 +1,140 @@
+import json
+
+import click
+import pytest
+
+from src.ComposeDiff import ComposeDiff, KeyChange, ADDED, REMOVED, CHANGED, find_dependents, plan_apply
+
+
+@pytest.fixture
+def source():
+    return {
+        'version': '3.8',
+        'services': {
+            'live': {
+                'image': 'odoo:16.0',
+                'environment': ['DB_NAME=live', 'ADMIN_PASSWD=old'],
+                'labels': ['traefik.enable=true'],
+                'healthcheck': {'retries': 5, 'interval': '5s'},
+            },
+            'db': {'image': 'postgres'},
+            'odoo_dev_old': {'image': 'odoo:16.0'},
+        }
+    }
+
+
+@pytest.fixture
+def target():
+    return {
+        'version': '3.8',
+        'services': {
+            'live': {
+                'image': 'odoo:17.0',
+                'environment': ['DB_NAME=live', 'ADMIN_PASSWD=new'],
+                'labels': ['traefik.enable=true', 'traefik.http.routers.live.priority=1'],
+                'healthcheck': {'retries': 30, 'interval': '5s'},
+                'restart': 'always',
+            },
+            'db': {'image': 'postgres'},
+            'odoo_dev_new': {'image': 'odoo:17.0'},
+        }
+    }
+
+
+class TestComposeDiff:
+
+    def test_services(self, source, target):
+        diff = ComposeDiff(source, target)
+
+        assert diff.services_with_status(ADDED) == ['odoo_dev_new']
+        assert diff.services_with_status(REMOVED) == ['odoo_dev_old']
+        assert diff.services_with_status(CHANGED) == ['live']
+
+    def test_key_changes(self, source, target):
+        live = ComposeDiff(source, target).services[0]
+
+        assert live.changes == [
+            KeyChange('image', CHANGED, old='odoo:16.0', new='odoo:17.0'),
+            KeyChange('environment', CHANGED, added=['ADMIN_PASSWD=new'], removed=['ADMIN_PASSWD=old']),
+            KeyChange('labels', CHANGED, added=['traefik.http.routers.live.priority=1'], removed=[]),
+            KeyChange('healthcheck.retries', CHANGED, old=5, new=30),
+            KeyChange('restart', ADDED, new='always'),
+        ]
+
+    def test_no_changes(self, source):
+        diff = ComposeDiff(source, source)
+
+        assert not diff
+        assert diff.render() == 'No changes.'
+
+    def test_top_level_changes(self):
+        diff = ComposeDiff({'version': '3.8', 'services': {}}, {'services': {}, 'networks': {'default': {}}})
+
+        assert [change.key for change in diff.top_level] == ['version', 'networks']
+
+    def test_order_change(self):
+        diff = ComposeDiff({'services': {'live': {'depends_on': ['db', 'proxy']}}},
+                           {'services': {'live': {'depends_on': ['proxy', 'db']}}})
+
+        assert diff.services[0].changes == [KeyChange('depends_on', CHANGED, added=[], removed=[])]
+
+    def test_render(self, source, target):
+        rendered = click.unstyle(ComposeDiff(source, target).render())
+
+        assert rendered.splitlines() == [
+            '~ service live',
+            '    ~ image: odoo:16.0 -> odoo:17.0',
+            '    ~ environment:',
+            '        - ADMIN_PASSWD=old',
+            '        + ADMIN_PASSWD=new',
+            '    ~ labels:',
+            '        + traefik.http.routers.live.priority=1',
+            '    ~ healthcheck.retries: 5 -> 30',
+            '    + restart: always',
+            '- service odoo_dev_old',
+            '+ service odoo_dev_new',
+        ]
+
+    def test_render_json(self, source, target):
+        data = json.loads(ComposeDiff(source, target).render_json())
+
+        assert data['services']['added'] == ['odoo_dev_new']
+        assert data['services']['removed'] == ['odoo_dev_old']
+        assert data['services']['changed']['live'][0] == {'key': 'image', 'status': 'changed', 'old': 'odoo:16.0',
+                                                          'new': 'odoo:17.0'}
+        assert data['services']['changed']['live'][1]['added'] == ['ADMIN_PASSWD=new']
+        assert data['top_level'] == []
+
+
+class TestPlanApply:
+
+    @pytest.fixture
+    def services(self):
+        return {
+            'proxy': {'image': 'traefik'},
+            'db': {'image': 'postgres'},
+            'live': {'image': 'odoo', 'depends_on': ['db', 'proxy']},
+            'pre': {'image': 'odoo', 'depends_on': ['db', 'proxy']},
+            'odoo_dev_pr1': {'image': 'odoo', 'depends_on': {'live': {'condition': 'service_started'}}},
+        }
+
+    def test_find_dependents(self, services):
+        assert find_dependents(services, ['db']) == ['live', 'pre', 'odoo_dev_pr1']
+        assert find_dependents(services, ['pre']) == []
+
+    def test_plan(self, services):
+        target = {'services': dict(services, proxy={'image': 'traefik:v3'}, odoo_dev_pr2={'image': 'odoo'})}
+        del target['services']['odoo_dev_pr1']
+
+        plan = plan_apply(ComposeDiff({'services': services}, target), target)
+
+        assert plan.changed == ['proxy', 'odoo_dev_pr2']
+        assert plan.dependents == ['live', 'pre']
+        assert plan.removed == ['odoo_dev_pr1']
+        assert plan.render().splitlines()[2] == 'Recreate live (depends on a changed service)'
+
+    def test_empty_plan(self, services):
+        plan = plan_apply(ComposeDiff({'services': services}, {'services': services}), {'services': services})
+
+        assert not plan
+        assert plan.render() == 'No services need to be recreated.'
@@ -1,8 +1,10 @@
+import os
 import subprocess
 from unittest.mock import patch, mock_open, MagicMock
 
 import pytest
 
+from src.ComposeDiff import ApplyPlan
 from src.ComposeManager import ComposeManager
 from src.Services import ComposeService
 from src.errors import ServiceAlreadyExistsException, ServiceDoesNotExistException
@@ -36,6 +38,39 @@ class TestComposeManager:
         assert manager.initiated
         mock_file.assert_called_once_with('docker-compose.yml', 'w')
 
+    def test_save_skips_identical_content(self, tmp_path):
+        conf_path = tmp_path / 'docker-compose.yml'
+        manager = ComposeManager(str(conf_path))
+        assert manager.save()
+        mtime = os.stat(conf_path).st_mtime_ns
+
+        manager = ComposeManager(str(conf_path))
+        assert not manager.save()
+        assert os.stat(conf_path).st_mtime_ns == mtime
+
+        manager.add_service(ComposeService('new_service', 'new_image'))
+        assert manager.save()
+        assert 'new_service' in ComposeManager(str(conf_path)).services
+
+    def test_source_config_is_not_changed_by_edits(self, tmp_path):
+        conf_path = tmp_path / 'docker-compose.yml'
+        conf_path.write_text(MOCK_FILE)
+        manager = ComposeManager(str(conf_path))
+
+        manager.update_service(ComposeService('test_service', 'updated_image'))
+
+        assert manager.source_config['services']['test_service']['image'] == 'test_image'
+        assert manager.print_diff() != manager.render()
+
+    @patch('src.ComposeManager.get_container_backend')
+    @patch('click.echo')
+    def test_apply(self, mock_click, mock_get_container_backend):
+        ComposeManager.apply(ApplyPlan(['pre'], ['odoo_dev_pr1'], ['odoo_dev_pr2']))
+
+        backend = mock_get_container_backend.return_value
+        backend.remove.assert_called_once_with(['odoo_dev_pr2'])
+        backend.up.assert_called_once_with(['pre', 'odoo_dev_pr1'], options=['--no-deps', '--force-recreate'])
+
     @patch('builtins.open', new_callable=mock_open)
     def test_render(self, mock_file):
         manager = ComposeManager()
@@ -48,7 +83,6 @@ class TestComposeManager:
         manager.print_diff()
         assert not mock_file.called
 
-
     def test_add_service(self):
         manager = ComposeManager()
         new_service = ComposeService('new_service', 'new_image')
@@ -4,8 +4,10 @@ from unittest.mock import patch, MagicMock, call
 
 import pytest
 
-from src.DatabaseManager import DatabaseManager
-from src.errors import DatabaseAlreadyExistsException
+from src import DatabaseManager as database_manager_module
+from src.DatabaseManager import DatabaseManager, close_connections, SqlCatalogBackend, ExecCatalogBackend
+from src.errors import DatabaseAlreadyExistsException, StreamingNotPossibleException, \
+    OperationOnDatabaseDeniedException
 
 
 @pytest.fixture
@@ -34,6 +36,22 @@ class TestDump:
         mock_run.assert_called_once()
         assert path == expected_path
 
+    @patch('uuid.uuid4')
+    @patch('subprocess.run')
+    def test_dump_db_parallel(self, mock_run, mock_uuid, db_manager, db_name):
+        test_uuid = uuid.UUID('1234567890abcdef1234567890abcdef')
+        mock_uuid.return_value = test_uuid
+        mock_run.return_value = MagicMock(returncode=0)
+
+        expected_path = f'/destination_path/{db_name}_{test_uuid}.dir'
+        path = db_manager.dump_db('/destination_path', jobs=4)
+
+        assert path == expected_path
+        mock_run.assert_called_once_with(
+            ['docker', 'compose', 'exec', 'db', 'sh', '-c',
+             f'pg_dump -U postgres -Fd -j 4 -f {expected_path} {db_name}'],
+            capture_output=True, text=True)
+
     @patch('subprocess.run')
     def test_dump_db_error(self, mock_run, db_manager, db_name):
         # Mock subprocess to simulate an error
@@ -45,6 +63,128 @@ class TestDump:
             db_manager.dump_db('/destination_path')
 
 
+class TestStreamTo:
+
+    @staticmethod
+    def _process(returncode=0, chunks=()):
+        process = MagicMock(returncode=returncode)
+        process.wait.return_value = returncode
+        process.stdout.read.side_effect = list(chunks) + [b'']
+        return process
+
+    @patch('src.DatabaseManager.DatabaseManager.create_db')
+    @patch('src.DatabaseManager.DatabaseManager.db_exists', return_value=False)
+    @patch('subprocess.Popen')
+    def test_stream_to(self, mock_popen, mock_db_exists, mock_create_db, db_manager):
+        dump = self._process(chunks=[b'abc', b'de'])
+        restore = self._process()
+        mock_popen.side_effect = [dump, restore]
+
+        transferred = db_manager.stream_to('pre', 'pre')
+
+        assert transferred == 5
+        mock_create_db.assert_called_once_with('pre', 'pre')
+        restore.stdin.write.assert_has_calls([call(b'abc'), call(b'de')])
+        restore.stdin.close.assert_called_once()
+
+    @patch('src.DatabaseManager.DatabaseManager.create_db')
+    @patch('src.DatabaseManager.DatabaseManager.db_exists', return_value=False)
+    @patch('subprocess.Popen')
+    def test_stream_to_without_output(self, mock_popen, mock_db_exists, mock_create_db, db_manager):
+        mock_popen.return_value = self._process(returncode=1)
+
+        with pytest.raises(StreamingNotPossibleException):
+            db_manager.stream_to('pre', 'pre')
+
+        mock_create_db.assert_not_called()
+
+    @patch('src.DatabaseManager.DatabaseManager.db_exists', return_value=False)
+    @patch('subprocess.Popen', side_effect=FileNotFoundError)
+    def test_stream_to_without_docker(self, mock_popen, mock_db_exists, db_manager):
+        with pytest.raises(StreamingNotPossibleException):
+            db_manager.stream_to('pre', 'pre')
+
+    @patch('src.DatabaseManager.DatabaseManager.create_db')
+    @patch('src.DatabaseManager.DatabaseManager.db_exists', return_value=False)
+    @patch('subprocess.Popen')
+    def test_stream_to_restore_error(self, mock_popen, mock_db_exists, mock_create_db, db_manager):
+        mock_popen.side_effect = [self._process(chunks=[b'abc']), self._process(returncode=1)]
+
+        with pytest.raises(subprocess.CalledProcessError):
+            db_manager.stream_to('pre', 'pre')
+
+    @patch('src.DatabaseManager.DatabaseManager.create_db')
+    @patch('src.DatabaseManager.DatabaseManager.db_exists', return_value=False)
+    @patch('subprocess.Popen')
+    def test_stream_to_restore_exits_early(self, mock_popen, mock_db_exists, mock_create_db, db_manager):
+        dump = self._process(chunks=[b'abc', b'de'])
+        # pg_dump is killed, its return code must not hide the error of pg_restore
+        dump.wait.return_value = -9
+        restore = self._process(returncode=1)
+        restore.stdin.write.side_effect = [None, BrokenPipeError]
+        restore.args = ['pg_restore']
+        mock_popen.side_effect = [dump, restore]
+
+        with pytest.raises(subprocess.CalledProcessError) as e:
+            db_manager.stream_to('pre', 'pre')
+
+        assert e.value.returncode == 1
+        assert e.value.cmd == ['pg_restore']
+        dump.kill.assert_called_once()
+
+    @patch('src.DatabaseManager.DatabaseManager.db_exists', return_value=True)
+    def test_stream_to_already_exists(self, mock_db_exists, db_manager):
+        with pytest.raises(DatabaseAlreadyExistsException):
+            db_manager.stream_to('pre', 'pre')
+
+
+class TestFromTemplate:
+    @patch('subprocess.run')
+    def test_from_template(self, mock_run):
+        mock_run.return_value = MagicMock(returncode=1)
+
+        new_db_manager = DatabaseManager.from_template('pre', 'pre', 'password', 'live_snapshot')
+
+        assert new_db_manager.name == 'pre'
+        mock_run.assert_any_call(
+            ['docker', 'compose', 'exec', 'db', 'psql', '-U', 'postgres', '-c',
+             "SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+             "WHERE datname = 'live_snapshot' AND pid <> pg_backend_pid();"],
+            capture_output=True, text=True)
+        mock_run.assert_any_call(
+            ['docker', 'compose', 'exec', 'db', 'sh', '-c', 'createdb -U postgres -T live_snapshot -O pre pre'],
+            capture_output=True, text=True)
+
+    @patch('subprocess.run')
+    def test_from_template_already_exists(self, mock_run):
+        mock_run.return_value = MagicMock(returncode=0)
+
+        with pytest.raises(DatabaseAlreadyExistsException):
+            DatabaseManager.from_template('pre', 'pre', 'password', 'live_snapshot')
+
+        mock_run.assert_called_once()
+
+
+class TestRenameDb:
+    @patch('subprocess.run')
+    def test_rename_db(self, mock_run):
+        mock_run.return_value = MagicMock(returncode=0)
+
+        assert DatabaseManager.rename_db('live_snapshot_new', 'live_snapshot')
+
+        mock_run.assert_called_with(
+            ['docker', 'compose', 'exec', 'db', 'psql', '-U', 'postgres', '-c',
+             'ALTER DATABASE live_snapshot_new RENAME TO live_snapshot;'],
+            capture_output=True, text=True)
+
+    @patch('subprocess.run')
+    def test_rename_live_db(self, mock_run):
+        with pytest.raises(OperationOnDatabaseDeniedException):
+            DatabaseManager.rename_db('live', 'live_old')
+
+        mock_run.assert_not_called()
+
+
 class TestFromDump:
     @patch('subprocess.run')
     def test_from_dump(self, mock_run):
@@ -57,6 +197,17 @@ class TestFromDump:
         assert isinstance(new_db_manager, DatabaseManager)
         assert new_db_manager.name == 'new_db'
 
+    @patch('subprocess.run')
+    def test_from_dump_parallel(self, mock_run):
+        mock_run.return_value = MagicMock(returncode=1)
+
+        DatabaseManager.from_dump('new_db', 'user', 'password', '/path/to/dump.dir', jobs=8)
+
+        mock_run.assert_any_call(
+            ['docker', 'compose', 'exec', 'db', 'sh', '-c',
+             'pg_restore -j 8 --clean --if-exists --no-acl --no-owner -d new_db -U user /path/to/dump.dir'],
+            capture_output=True, text=True)
+
     @patch('subprocess.run')
     def test_from_dump_already_exists(self, mock_run):
         # Mock subprocess
@@ -143,6 +294,88 @@ class TestDbExists:
             db_manager.db_exists(db_name)
 
 
+class TestLazyExists:
+
+    @patch('src.DatabaseManager.DatabaseManager.db_exists', return_value=True)
+    def test_exists_checked_on_first_access(self, mock_db_exists, db_name):
+        db_manager = DatabaseManager(db_name, 'postgres', 'password')
+
+        mock_db_exists.assert_not_called()
+        assert db_manager.exists
+        assert db_manager.exists
+        mock_db_exists.assert_called_once_with(db_name)
+
+
+class TestSqlCatalogBackend:
+
+    @pytest.fixture
+    def connection(self, monkeypatch):
+        monkeypatch.setattr(database_manager_module, '_connection_pool', {})
+        connection = MagicMock(closed=False)
+        connection.info.server_version = 160002
+        with patch('src.DatabaseManager.DatabaseManager._connect', return_value=connection):
+            yield connection
+
+    def executed(self, connection):
+        return [statement.args[0].decode() for statement in connection.execute.call_args_list]
+
+    def test_exists(self, connection):
+        connection.execute.return_value.fetchone.return_value = (1,)
+
+        assert SqlCatalogBackend('password').exists('pre')
+        connection.execute.assert_called_once_with(b'SELECT 1 FROM pg_database WHERE datname = %s;', ('pre',))
+
+    def test_does_not_exist(self, connection):
+        connection.execute.return_value.fetchone.return_value = None
+
+        assert not SqlCatalogBackend('password').exists('pre')
+
+    def test_create(self, connection):
+        SqlCatalogBackend('password').create('pre', 'postgres', template='live_snapshot', owner='pre')
+
+        assert self.executed(connection) == ['CREATE DATABASE "pre" OWNER "pre" TEMPLATE "live_snapshot";']
+        assert connection.autocommit is True
+
+    def test_drop_with_force(self, connection):
+        SqlCatalogBackend('password').drop('pre')
+
+        executed = self.executed(connection)
+        assert 'pg_terminate_backend' in executed[0]
+        assert executed[1] == 'DROP DATABASE IF EXISTS "pre" WITH (FORCE);'
+
+    def test_drop_on_old_server(self, connection):
+        connection.info.server_version = 120015
+
+        SqlCatalogBackend('password').drop('pre')
+
+        assert self.executed(connection)[1] == 'DROP DATABASE IF EXISTS "pre";'
+
+    @patch('src.DatabaseManager.DatabaseManager._connect')
+    def test_falls_back_to_exec(self, mock_connect, monkeypatch):
+        monkeypatch.setattr(database_manager_module, '_connection_pool', {})
+        mock_connect.side_effect = database_manager_module.psycopg.OperationalError('connection refused')
+        fallback = MagicMock(spec=ExecCatalogBackend)
+        fallback.exists.return_value = True
+        backend = SqlCatalogBackend('password', fallback=fallback)
+
+        assert backend.exists('pre')
+        backend.drop('pre')
+
+        fallback.drop.assert_called_once_with('pre')
+        # The unreachable server is only tried once
+        mock_connect.assert_called_once()
+
+    def test_configured_backend_is_used(self, monkeypatch):
+        backend = MagicMock()
+        monkeypatch.setattr(database_manager_module, '_catalog_backend', backend)
+
+        DatabaseManager.create_db('pre', 'pre')
+        DatabaseManager('pre', 'pre', 'password').drop_db()
+
+        backend.create.assert_called_once_with('pre', 'pre', template=None, owner=None)
+        backend.drop.assert_called_once_with('pre')
+
+
 class TestDbCreate:
 
     def test_create_db(self, db_manager, db_name, monkeypatch):
@@ -212,6 +445,10 @@ class TestDbConnect:
 
 class TestDbRunSql:
 
+    @pytest.fixture(autouse=True)
+    def empty_pool(self, monkeypatch):
+        monkeypatch.setattr(database_manager_module, '_connection_pool', {})
+
     @patch('src.DatabaseManager.DatabaseManager._connect')
     def test_execute_sql(self, mock_connect, db_manager):
         mock_connect.return_value = MagicMock()
@@ -220,6 +457,66 @@ class TestDbRunSql:
 
         mock_connect.assert_called_once()
 
+    @patch('src.DatabaseManager.DatabaseManager._connect')
+    def test_connection_is_reused(self, mock_connect, db_manager, db_name):
+        mock_connect.return_value = MagicMock(closed=False)
+
+        db_manager._run_sql_command('SELECT 1;')
+        DatabaseManager(db_name, 'postgres', 'password')._run_sql_command('SELECT 2;')
+
+        mock_connect.assert_called_once()
+        assert mock_connect.return_value.execute.call_count == 2
+
+    @patch('src.DatabaseManager.DatabaseManager._connect')
+    def test_closed_connection_is_replaced(self, mock_connect, db_manager):
+        mock_connect.return_value = MagicMock(closed=True)
+
+        db_manager._run_sql_command('SELECT 1;')
+        db_manager._run_sql_command('SELECT 2;')
+
+        assert mock_connect.call_count == 2
+
+    @patch('src.DatabaseManager.DatabaseManager._connect')
+    def test_failed_statement_is_rolled_back(self, mock_connect, db_manager):
+        connection = MagicMock(closed=False)
+        connection.execute.side_effect = ValueError
+        mock_connect.return_value = connection
+
+        with pytest.raises(ValueError):
+            db_manager._run_sql_command('SELECT broken;')
+
+        connection.rollback.assert_called_once()
+
+    @patch('src.DatabaseManager.DatabaseManager._connect')
+    def test_close_connections(self, mock_connect, db_manager):
+        mock_connect.return_value = MagicMock(closed=False)
+        db_manager._run_sql_command('SELECT 1;')
+
+        close_connections(db_manager.name)
+
+        mock_connect.return_value.close.assert_called_once()
+        assert not database_manager_module._connection_pool
+
+    @patch('src.DatabaseManager.DatabaseManager._connect')
+    def test_run_batch(self, mock_connect, db_manager):
+        connection = MagicMock(closed=False)
+        connection.execute.side_effect = [MagicMock(description=None),
+                                          MagicMock(description=['id'], **{'fetchall.return_value': [(1,)]})]
+        mock_connect.return_value = connection
+
+        results = db_manager.run_batch(['DELETE FROM ir_mail_server;', 'SELECT id FROM ir_cron;'])
+
+        assert results == [None, [(1,)]]
+        mock_connect.assert_called_once()
+        connection.transaction.assert_called_once()
+
+    @patch('src.DatabaseManager.DatabaseManager._run_sql_command')
+    def test_existing_tables(self, mock_run_sql_command, db_manager):
+        mock_run_sql_command.return_value.fetchall.return_value = [('ir_cron',)]
+
+        assert db_manager.existing_tables(['ir_cron', 'fetchmail_server']) == {'ir_cron'}
+        assert mock_run_sql_command.call_args.kwargs['params'] == (['ir_cron', 'fetchmail_server'],)
+
 
 class TestAddUser:
     @patch('src.DatabaseManager.DatabaseManager._run_sql_command')
@@ -231,6 +528,15 @@ class TestAddUser:
         mock_run_sql_command.assert_called_once_with(
             """CREATE ROLE test_user LOGIN CREATEDB PASSWORD 'password-test-user'""", True)
 
+    @patch('src.DatabaseManager.DatabaseManager.run_batch')
+    def test_add_users(self, mock_run_batch, db_manager):
+        db_manager.add_users({'odoo_dev_pr1': 'first', 'odoo_dev_pr2': 'second'})
+
+        mock_run_batch.assert_called_once_with([
+            """CREATE ROLE odoo_dev_pr1 LOGIN CREATEDB PASSWORD 'first'""",
+            """CREATE ROLE odoo_dev_pr2 LOGIN CREATEDB PASSWORD 'second'""",
+        ])
+
 
 class TestRemoveUser:
 
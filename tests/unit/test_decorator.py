@@ -1,14 +1,9 @@
 import click
-import docker
 import pytest
 
 from src import decorators
 from src.decorators import require_initiated, REQUIRE_INIT_ERROR_CODE, prevent_on_enviroment, require_database
-
-
-class MockDockerContainerNotFoundError:
-    def __init__(self, *args, **kwargs):
-        raise docker.errors.NotFound('Docker container not found')
+from src.helper import ServiceState
 
 
 class MockClickContext:
@@ -60,7 +55,7 @@ class TestDecorators:
 
     # Test for check_database_health decorator
     def test_require_database(self, monkeypatch):
-        monkeypatch.setattr(decorators, 'get_service_health', lambda _: 'unhealthy')
+        monkeypatch.setattr(decorators, 'get_services_state', lambda _: {'db': ServiceState('running', 'unhealthy')})
 
         @require_database
         def dummy_function():
@@ -71,7 +66,7 @@ class TestDecorators:
         assert cm.value.code == 1
 
     def test_require_database_container_not_found(self, monkeypatch):
-        monkeypatch.setattr(decorators, 'get_service_health', MockDockerContainerNotFoundError)
+        monkeypatch.setattr(decorators, 'get_services_state', lambda _: {})
 
         @require_database
         def dummy_function():
@@ -82,7 +77,7 @@ class TestDecorators:
         assert cm.value.code == 1
 
     def test_require_database_successfull(self, monkeypatch):
-        monkeypatch.setattr(decorators, 'get_service_health', lambda _: 'healthy')
+        monkeypatch.setattr(decorators, 'get_services_state', lambda _: {'db': ServiceState('running', 'healthy')})
 
         @require_database
         def dummy_function():
@@ -0,0 +1,256 @@
+import io
+import os
+import subprocess
+import tarfile
+from unittest.mock import patch, MagicMock
+
+import docker
+import pytest
+
+from src.DockerBackend import ComposeCliBackend, DockerSdkBackend, configure_container_backend, \
+    get_container_backend, extract_archive
+
+
+def make_archive(files: dict) -> bytes:
+    archive_bytes = io.BytesIO()
+    with tarfile.open(fileobj=archive_bytes, mode='w') as archive:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return archive_bytes.getvalue()
+
+
+def in_chunks(data: bytes, size: int = 100):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+@pytest.fixture
+def api():
+    with patch('src.DockerBackend.get_docker_client') as mock_get_docker_client:
+        yield mock_get_docker_client.return_value.api
+
+
+@pytest.fixture
+def fallback():
+    return MagicMock(spec=ComposeCliBackend)
+
+
+class TestComposeCliBackend:
+
+    @patch('subprocess.run')
+    def test_exec(self, mock_run):
+        ComposeCliBackend().exec('db', ['psql', '-c', 'SELECT 1;'])
+
+        mock_run.assert_called_once_with(['docker', 'compose', 'exec', 'db', 'psql', '-c', 'SELECT 1;'],
+                                         capture_output=True, text=True)
+
+    @patch('subprocess.Popen')
+    def test_get_archive(self, mock_popen):
+        archive = make_archive({'src/README': b'readme'})
+        process = mock_popen.return_value
+        process.stdout = io.BytesIO(archive)
+        process.poll.return_value = 0
+
+        chunks = list(ComposeCliBackend().get_archive('live', '/odoo/src'))
+
+        assert b''.join(chunks) == archive
+        process.kill.assert_not_called()
+        assert mock_popen.call_args.args[0] == ['docker', 'compose', 'cp', 'live:/odoo/src', '-']
+
+    @patch('subprocess.Popen')
+    def test_get_archive_failure(self, mock_popen):
+        process = mock_popen.return_value
+        process.stdout = io.BytesIO(b'')
+        process.stderr = io.BytesIO(b'no such file')
+        process.wait.return_value = 1
+
+        with pytest.raises(subprocess.CalledProcessError) as error_info:
+            list(ComposeCliBackend().get_archive('live', '/missing'))
+
+        assert error_info.value.stderr == 'no such file'
+
+    @patch('subprocess.Popen')
+    def test_exec_stream(self, mock_popen):
+        ComposeCliBackend().exec_stream('db', ['pg_dump', 'live'], stdout=subprocess.PIPE)
+
+        mock_popen.assert_called_once_with(['docker', 'compose', 'exec', '-T', 'db', 'pg_dump', 'live'],
+                                           stdout=subprocess.PIPE)
+
+    @patch('subprocess.check_call')
+    def test_up_with_options(self, mock_check_call):
+        ComposeCliBackend().up(['pre'], options=['--no-deps'])
+
+        mock_check_call.assert_called_once_with(['docker', 'compose', 'up', '-d', '--no-deps', 'pre'])
+
+
+class TestDockerSdkBackend:
+
+    def test_exec(self, api):
+        api.exec_create.return_value = {'Id': 'exec-id'}
+        api.exec_start.return_value = iter([(b'1\n', None), (b'2\n', b'warning')])
+        api.exec_inspect.return_value = {'ExitCode': 0}
+
+        result = DockerSdkBackend().exec('db', ['psql', '-c', 'SELECT 1;'])
+
+        api.exec_create.assert_called_once_with('db', ['psql', '-c', 'SELECT 1;'])
+        api.exec_start.assert_called_once_with('exec-id', stream=True, demux=True)
+        assert result.returncode == 0
+        assert result.stdout == '1\n2\n'
+        assert result.stderr == 'warning'
+
+    def test_exec_failure(self, api):
+        api.exec_create.return_value = {'Id': 'exec-id'}
+        api.exec_start.return_value = iter([(None, b'error')])
+        api.exec_inspect.return_value = {'ExitCode': 2}
+
+        result = DockerSdkBackend().exec('db', ['false'])
+
+        with pytest.raises(subprocess.CalledProcessError):
+            result.check_returncode()
+
+    def test_exec_unknown_container_uses_fallback(self, api, fallback):
+        api.exec_create.side_effect = docker.errors.NotFound('No such container')
+
+        DockerSdkBackend(fallback).exec('odoo', ['true'])
+
+        fallback.exec.assert_called_once_with('odoo', ['true'])
+
+    def test_get_archive(self, api, tmp_path):
+        archive = make_archive({'src/addons/module.py': b'print(1)', 'src/README': b'readme'})
+        api.get_archive.return_value = (in_chunks(archive), {})
+
+        destination = tmp_path / 'volumes' / 'live' / 'src'
+        extract_archive(DockerSdkBackend().get_archive('live', '/odoo/src/'), str(destination))
+
+        assert (destination / 'addons' / 'module.py').read_bytes() == b'print(1)'
+        assert (destination / 'README').read_bytes() == b'readme'
+
+    def test_get_archive_missing_path(self, api):
+        api.get_archive.side_effect = docker.errors.NotFound('Could not find the file')
+
+        with pytest.raises(subprocess.CalledProcessError):
+            DockerSdkBackend().get_archive('live', '/missing')
+
+    def test_image_id(self, api, fallback):
+        api.inspect_container.return_value = {'Image': 'sha256:abc'}
+
+        assert DockerSdkBackend(fallback).image_id('live') == 'sha256:abc'
+        fallback.image_id.assert_not_called()
+
+    def test_image_id_unknown_container_uses_fallback(self, api, fallback):
+        api.inspect_container.side_effect = docker.errors.NotFound('missing')
+        fallback.image_id.return_value = 'sha256:abc'
+
+        assert DockerSdkBackend(fallback).image_id('live') == 'sha256:abc'
+
+    def test_up_uses_fallback(self, api, fallback):
+        # Only compose recreates containers whose definition changed
+        DockerSdkBackend(fallback).up(['pre'])
+
+        api.start.assert_not_called()
+        fallback.up.assert_called_once_with(['pre'], None)
+
+    def test_stop(self, api, fallback):
+        api.stop.side_effect = [None, docker.errors.NotFound('No such container')]
+
+        DockerSdkBackend(fallback).stop(['pre', 'gone'])
+
+        assert api.stop.call_count == 2
+        fallback.stop.assert_not_called()
+
+    def test_stop_error(self, api):
+        api.stop.side_effect = docker.errors.APIError('Cannot stop')
+
+        with pytest.raises(subprocess.CalledProcessError):
+            DockerSdkBackend().stop(['pre'])
+
+
+class TestExtractArchive:
+
+    def test_single_file(self, tmp_path):
+        extract_archive(in_chunks(make_archive({'odoo.conf': b'[options]'})), str(tmp_path / 'copy.conf'))
+
+        assert (tmp_path / 'copy.conf').read_bytes() == b'[options]'
+
+    def test_include_and_exclude(self, tmp_path):
+        archive = make_archive({
+            'src/odoo/models.py': b'models',
+            'src/odoo/models.pyc': b'compiled',
+            'src/odoo/tests/test_models.py': b'test',
+            'src/odoo/i18n/de.po': b'po',
+            'src/README': b'readme',
+        })
+
+        report = extract_archive(in_chunks(archive), str(tmp_path / 'src'), include=['*.py', '*.po'],
+                                 exclude=['*.pyc', 'tests'])
+
+        extracted = sorted(str(path.relative_to(tmp_path)) for path in tmp_path.rglob('*') if path.is_file())
+        assert extracted == ['src/odoo/i18n/de.po', 'src/odoo/models.py']
+        assert report.files == 2
+        assert report.bytes == len(b'models') + len(b'po')
+
+    def test_resume_skips_present_files(self, tmp_path):
+        archive = make_archive({'src/a.py': b'a', 'src/b.py': b'b'})
+        extract_archive(in_chunks(archive), str(tmp_path / 'src'))
+        (tmp_path / 'src' / 'b.py').write_bytes(b'partial write')
+
+        report = extract_archive(in_chunks(archive), str(tmp_path / 'src'), resume=True)
+
+        assert (report.files, report.skipped) == (1, 1)
+        assert (tmp_path / 'src' / 'b.py').read_bytes() == b'b'
+
+    def test_resume_with_hardlink(self, tmp_path):
+        archive_bytes = io.BytesIO()
+        with tarfile.open(fileobj=archive_bytes, mode='w') as archive:
+            info = tarfile.TarInfo('src/a.py')
+            info.size = 1
+            archive.addfile(info, io.BytesIO(b'a'))
+            link = tarfile.TarInfo('src/link.py')
+            link.type = tarfile.LNKTYPE
+            link.linkname = 'src/a.py'
+            archive.addfile(link)
+        archive = archive_bytes.getvalue()
+        extract_archive(in_chunks(archive), str(tmp_path / 'src'), resume=True)
+
+        report = extract_archive(in_chunks(archive), str(tmp_path / 'src'), resume=True)
+
+        assert report.skipped == 2
+        assert (tmp_path / 'src' / 'link.py').read_bytes() == b'a'
+
+    def test_changed_file_is_replaced(self, tmp_path):
+        # A file linked into another tree must not be changed through the link
+        archive = make_archive({'src/a.py': b'new'})
+        (tmp_path / 'cache').mkdir()
+        (tmp_path / 'cache' / 'a.py').write_bytes(b'old')
+        (tmp_path / 'src').mkdir()
+        os.link(tmp_path / 'cache' / 'a.py', tmp_path / 'src' / 'a.py')
+
+        extract_archive(in_chunks(archive), str(tmp_path / 'src'), resume=True)
+
+        assert (tmp_path / 'src' / 'a.py').read_bytes() == b'new'
+        assert (tmp_path / 'cache' / 'a.py').read_bytes() == b'old'
+
+    @patch('src.DockerBackend.PROGRESS_INTERVAL', 0)
+    def test_progress(self, tmp_path):
+        reports = []
+
+        extract_archive(in_chunks(make_archive({'src/a.py': b'a', 'src/b.py': b'b'})), str(tmp_path / 'src'),
+                        progress=reports.append)
+
+        assert [report.files for report in reports][-1] == 2
+        assert 'files/s' in str(reports[-1])
+
+
+class TestConfigureBackend:
+
+    def test_configure(self):
+        configure_container_backend('sdk')
+        assert isinstance(get_container_backend(), DockerSdkBackend)
+
+        configure_container_backend('cli')
+        assert isinstance(get_container_backend(), ComposeCliBackend)
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            configure_container_backend('podman')
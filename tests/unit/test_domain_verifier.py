@@ -0,0 +1,91 @@
+import json
+import socket
+from unittest.mock import patch
+
+import pytest
+
+from src.DomainVerifier import DomainVerifier, collect_hosts, replace_domain, get_dns_cache_path
+from src.Services import OdooComposeService, ProxyComposeService
+
+
+@pytest.fixture
+def services():
+    return {
+        'proxy': ProxyComposeService('proxy', 'example.com', dashboard=True).to_dict(),
+        'live': OdooComposeService('live', 'example.com', 'db_pass', 'admin_pass', '17.0').to_dict(),
+        'pre': OdooComposeService('pre', 'pre.example.com', 'db_pass', 'admin_pass', '17.0').to_dict(),
+        'odoo_dev_pr12': OdooComposeService('odoo_dev_pr12', 'pr12.example.com', 'db_pass', 'admin_pass',
+                                            '17.0').to_dict(),
+        'db': {'image': 'postgres'},
+    }
+
+
+class TestCollectHosts:
+
+    def test_collect_hosts(self, services):
+        hosts = collect_hosts(services)
+
+        assert sorted(hosts) == ['example.com', 'pr12.example.com', 'pre.example.com', 'proxy.example.com']
+
+    def test_collect_multiple_hosts_in_one_rule(self):
+        services = {'web': {'labels': ['traefik.http.routers.web.rule=Host(`a.de`, `b.de`) || Host(`c.de`)']}}
+
+        assert collect_hosts(services) == ['a.de', 'b.de', 'c.de']
+
+    def test_replace_domain(self):
+        hosts = ['example.com', 'pre.example.com', 'other.de']
+
+        assert replace_domain(hosts, 'example.com', 'new.de') == ['new.de', 'pre.new.de', 'other.de']
+
+
+class TestDomainVerifier:
+
+    @patch('src.DomainVerifier.get_local_ip', return_value='192.168.1.1')
+    @patch('socket.gethostbyname')
+    def test_verify(self, mock_gethostbyname, mock_get_local_ip, tmp_path):
+        mock_gethostbyname.side_effect = lambda host: '192.168.1.2' if host == 'pre.example.com' else '192.168.1.1'
+
+        report = DomainVerifier(str(tmp_path / 'cache.json')).verify(['example.com', 'pre.example.com'])
+
+        assert list(report) == ['example.com', 'pre.example.com']
+        assert report['example.com'].matches
+        assert not report['pre.example.com'].matches
+        assert report['pre.example.com'].ip == '192.168.1.2'
+
+    @patch('src.DomainVerifier.get_local_ip', return_value='192.168.1.1')
+    @patch('socket.gethostbyname', return_value='192.168.1.1')
+    def test_verify_uses_cache(self, mock_gethostbyname, mock_get_local_ip, tmp_path):
+        verifier = DomainVerifier(str(tmp_path / 'cache.json'))
+
+        verifier.verify(['example.com'])
+        report = verifier.verify(['example.com'])
+
+        mock_gethostbyname.assert_called_once_with('example.com')
+        assert report['example.com'].cached
+        assert report['example.com'].matches
+
+    @patch('src.DomainVerifier.get_local_ip', return_value='192.168.1.1')
+    @patch('socket.gethostbyname', return_value='192.168.1.1')
+    def test_expired_cache(self, mock_gethostbyname, mock_get_local_ip, tmp_path):
+        cache_path = tmp_path / 'cache.json'
+        cache_path.write_text(json.dumps({'example.com': {'ip': '10.0.0.1', 'resolved_at': 0}}))
+
+        report = DomainVerifier(str(cache_path)).verify(['example.com'])
+
+        mock_gethostbyname.assert_called_once()
+        assert not report['example.com'].cached
+
+    @patch('src.DomainVerifier.get_local_ip', return_value='192.168.1.1')
+    @patch('socket.gethostbyname', side_effect=socket.gaierror('Name or service not known'))
+    def test_failed_lookup_is_not_cached(self, mock_gethostbyname, mock_get_local_ip, tmp_path):
+        verifier = DomainVerifier(str(tmp_path / 'cache.json'))
+
+        report = verifier.verify(['missing.example.com'])
+        verifier.verify(['missing.example.com'])
+
+        assert mock_gethostbyname.call_count == 2
+        assert not report['missing.example.com'].matches
+        assert report['missing.example.com'].error == 'Name or service not known'
+
+    def test_dns_cache_path_next_to_env(self):
+        assert get_dns_cache_path('/opt/odoo/.env') == '/opt/odoo/.dns_cache.json'
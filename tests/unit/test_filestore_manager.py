@@ -0,0 +1,183 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from src import FilestoreManager as filestore_module
+from src.FilestoreManager import FilestoreManager, STRATEGY_COPY, STRATEGY_HARDLINK, STRATEGY_REFLINK
+
+
+@pytest.fixture
+def source(tmp_path):
+    source = tmp_path / 'live'
+    for folder, name, content in [('ab', 'ab12', b'first'), ('ab', 'ab34', b'second'), ('cd', 'cd56', b'third')]:
+        (source / folder).mkdir(parents=True, exist_ok=True)
+        (source / folder / name).write_bytes(content)
+    return source
+
+
+def read_tree(path):
+    return {os.path.relpath(os.path.join(root, file), path): open(os.path.join(root, file), 'rb').read()
+            for root, _, files in os.walk(path) for file in files}
+
+
+class TestClone:
+
+    @pytest.mark.parametrize('strategy', [STRATEGY_COPY, STRATEGY_HARDLINK])
+    def test_clone(self, source, tmp_path, strategy):
+        destination = tmp_path / 'pre'
+
+        report = FilestoreManager(str(source), str(destination), strategy=strategy).clone()
+
+        assert read_tree(destination) == read_tree(source)
+        assert report.strategy == strategy
+        assert report.files == 3
+        assert report.bytes == len(b'first') + len(b'second') + len(b'third')
+
+    def test_clone_replaces_destination(self, source, tmp_path):
+        destination = tmp_path / 'pre'
+        (destination / 'ef').mkdir(parents=True)
+        (destination / 'ef' / 'ef78').write_bytes(b'old')
+
+        FilestoreManager(str(source), str(destination), strategy=STRATEGY_COPY).clone()
+
+        assert read_tree(destination) == read_tree(source)
+
+    def test_clone_hardlink_shares_inode(self, source, tmp_path):
+        destination = tmp_path / 'pre'
+
+        FilestoreManager(str(source), str(destination), strategy=STRATEGY_HARDLINK).clone()
+
+        assert os.stat(destination / 'ab' / 'ab12').st_ino == os.stat(source / 'ab' / 'ab12').st_ino
+
+    def test_unknown_strategy(self, source, tmp_path):
+        with pytest.raises(ValueError):
+            FilestoreManager(str(source), str(tmp_path / 'pre'), strategy='teleport')
+
+
+class TestDetectStrategy:
+
+    def test_detect_reflink(self, source, tmp_path):
+        with patch.dict(filestore_module.TRANSFER_FUNCTIONS, {STRATEGY_REFLINK: lambda src, dst: None}):
+            assert FilestoreManager(str(source), str(tmp_path / 'pre')).detect_strategy() == STRATEGY_REFLINK
+
+    def test_detect_falls_back_to_hardlink(self, source, tmp_path):
+        def reflink_not_supported(src, dst):
+            raise OSError('Operation not supported')
+
+        with patch.dict(filestore_module.TRANSFER_FUNCTIONS, {STRATEGY_REFLINK: reflink_not_supported}):
+            assert FilestoreManager(str(source), str(tmp_path / 'pre')).detect_strategy() == STRATEGY_HARDLINK
+
+        assert not [file for file in os.listdir(tmp_path) if file.startswith('.filestore_probe')]
+
+    def test_detect_falls_back_to_copy(self, source, tmp_path):
+        def not_supported(src, dst):
+            raise OSError('Invalid cross-device link')
+
+        with patch.dict(filestore_module.TRANSFER_FUNCTIONS,
+                        {STRATEGY_REFLINK: not_supported, STRATEGY_HARDLINK: not_supported}):
+            assert FilestoreManager(str(source), str(tmp_path / 'pre')).detect_strategy() == STRATEGY_COPY
+
+    def test_detect_empty_source(self, tmp_path):
+        (tmp_path / 'live').mkdir()
+        assert FilestoreManager(str(tmp_path / 'live'), str(tmp_path / 'pre')).detect_strategy() == STRATEGY_COPY
+
+
+class TestSync:
+
+    def test_sync_into_empty_destination(self, source, tmp_path):
+        destination = tmp_path / 'pre'
+
+        report = FilestoreManager(str(source), str(destination), strategy=STRATEGY_COPY).sync()
+
+        assert read_tree(destination) == read_tree(source)
+        assert report.files == 3
+        assert report.deleted == 0
+        assert os.path.exists(tmp_path / '.pre.manifest.json')
+
+    def test_sync_transfers_only_changes(self, source, tmp_path):
+        destination = tmp_path / 'pre'
+        manager = FilestoreManager(str(source), str(destination), strategy=STRATEGY_COPY)
+        manager.sync()
+
+        (source / 'ab' / 'ab34').unlink()
+        (source / 'ef').mkdir()
+        (source / 'ef' / 'ef78').write_bytes(b'fourth')
+
+        report = manager.sync()
+
+        assert read_tree(destination) == read_tree(source)
+        assert report.files == 1
+        assert report.bytes == len(b'fourth')
+        assert report.deleted == 1
+
+    def test_sync_removes_deleted_directories(self, source, tmp_path):
+        (source / 'cd' / 'ee').mkdir()
+        (source / 'cd' / 'ee' / 'x.txt').write_bytes(b'nested')
+        (source / 'cd' / 'cd56').unlink()
+        destination = tmp_path / 'pre'
+        manager = FilestoreManager(str(source), str(destination), strategy=STRATEGY_COPY)
+        manager.sync()
+
+        (source / 'cd' / 'ee' / 'x.txt').unlink()
+        (source / 'cd' / 'ee').rmdir()
+        (source / 'cd').rmdir()
+        manager.sync()
+
+        assert sorted(os.listdir(destination)) == ['ab']
+
+    def test_sync_without_changes(self, source, tmp_path):
+        destination = tmp_path / 'pre'
+        manager = FilestoreManager(str(source), str(destination), strategy=STRATEGY_COPY)
+        manager.sync()
+
+        report = manager.sync()
+
+        assert report.files == 0
+        assert report.deleted == 0
+
+    def test_sync_uses_manifest_for_unchanged_directories(self, source, tmp_path):
+        destination = tmp_path / 'pre'
+        manager = FilestoreManager(str(source), str(destination), strategy=STRATEGY_COPY)
+        manager.sync()
+
+        with patch.object(filestore_module, 'scan_directory', wraps=filestore_module.scan_directory) as mock_scan:
+            manager.scan_destination()
+
+        mock_scan.assert_not_called()
+
+    def test_sync_rescans_directories_changed_outside(self, source, tmp_path):
+        destination = tmp_path / 'pre'
+        manager = FilestoreManager(str(source), str(destination), strategy=STRATEGY_COPY)
+        manager.sync()
+
+        # Simulate the environment garbage collecting an attachment
+        (destination / 'cd' / 'cd56').unlink()
+        # Make sure the directory change is visible even with a coarse timestamp resolution
+        os.utime(destination / 'cd', ns=(0, 0))
+
+        report = manager.sync()
+
+        assert read_tree(destination) == read_tree(source)
+        assert report.files == 1
+
+    def test_sync_replaces_changed_files(self, source, tmp_path):
+        destination = tmp_path / 'pre'
+        manager = FilestoreManager(str(source), str(destination), strategy=STRATEGY_HARDLINK)
+        manager.sync()
+
+        (source / 'ab' / 'ab12').unlink()
+        (source / 'ab' / 'ab12').write_bytes(b'changed content')
+
+        manager.sync()
+
+        assert read_tree(destination) == read_tree(source)
+
+    def test_sha1_named_files_are_recognized(self, tmp_path):
+        sha1 = 'da39a3ee5e6b4b0d3255bfef95601890afd80709'
+        (tmp_path / 'live' / 'da').mkdir(parents=True)
+        (tmp_path / 'live' / 'da' / sha1).write_bytes(b'')
+
+        files = FilestoreManager(str(tmp_path / 'live'), str(tmp_path / 'pre')).scan_source()
+
+        assert files[os.path.join('da', sha1)][2] == sha1
@@ -0,0 +1,17 @@
+from click.testing import CliRunner
+
+from src.main import cli
+
+
+class TestGenerate:
+
+    def test_unchanged_compose_file(self, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / '.env').write_text('DOMAIN=example.com\nVERSION=17.0\nDEV=1\nMODULE_MODE=included\nSIZING=off\n')
+        runner = CliRunner()
+
+        first = runner.invoke(cli, ['generate'])
+        second = runner.invoke(cli, ['generate'])
+
+        assert "Docker Compose file 'docker-compose.yml' updated successfully." in first.output
+        assert "Docker Compose file 'docker-compose.yml' unchanged." in second.output
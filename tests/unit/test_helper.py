@@ -1,5 +1,11 @@
+import io
 import socket
 import subprocess
+import sys
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch, MagicMock
 
 import pytest
@@ -7,7 +13,10 @@ from click.testing import CliRunner
 from docker.errors import DockerException
 
 from src.helper import display_diff, remove_file_in_container, copy_files_from_container, get_local_ip, \
-    check_domain_and_subdomain, generate_password, get_docker_versions
+    check_domain_and_subdomain, generate_password, get_docker_versions, format_throughput, \
+    ensure_services_healthy, get_services_state, get_docker_client, lazy_import, \
+    run_probes
+from src import helper
 from src.main import cli
 
 
@@ -30,6 +39,14 @@ class TestDisplayDiff:
         display_diff(string1, string2)
 
 
+class TestFormatThroughput:
+    def test_format_throughput(self):
+        assert format_throughput(100 * 1024 * 1024, 4) == '100.0 MB in 4.0s (25.0 MB/s)'
+
+    def test_format_throughput_without_duration(self):
+        assert format_throughput(1024 * 1024, 0) == '1.0 MB in 0.0s (0.0 MB/s)'
+
+
 class TestRemoveFileInContainer:
 
     @patch('subprocess.run')
@@ -72,17 +89,26 @@ class TestRemoveFileInContainer:
 
 class TestCopyFilesFromContainer:
 
-    @patch('subprocess.run')
-    def test_copy_file(self, mock_subprocess_run):
-        mock_result = MagicMock()
-        mock_subprocess_run.return_value = mock_result
-        mock_result.check_returncode.return_value = None
+    @patch('src.DockerBackend.get_container_backend')
+    def test_copy_file(self, mock_get_container_backend, tmp_path):
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w') as tar:
+            info = tarfile.TarInfo('file')
+            info.size = 4
+            tar.addfile(info, io.BytesIO(b'data'))
+        mock_get_container_backend.return_value.get_archive.return_value = [archive.getvalue()]
 
-        result = copy_files_from_container('container_name', '/path/to/file', '/dest/path')
+        result = copy_files_from_container('container_name', '/path/to/file', str(tmp_path / 'dest'))
         assert result
-        mock_subprocess_run.assert_called_once_with(
-            ['docker', 'compose', 'cp', 'container_name:/path/to/file', '/dest/path'], capture_output=True,
-            text=True)
+        mock_get_container_backend.return_value.get_archive.assert_called_once_with('container_name', '/path/to/file')
+        assert (tmp_path / 'dest').read_bytes() == b'data'
+
+    @patch('src.DockerBackend.get_container_backend')
+    def test_copy_file_failure(self, mock_get_container_backend, tmp_path):
+        mock_get_container_backend.return_value.get_archive.side_effect = subprocess.CalledProcessError(1, ['docker'])
+
+        with pytest.raises(subprocess.CalledProcessError):
+            copy_files_from_container('container_name', '/missing', str(tmp_path / 'dest'))
 
 
 class TestCheckDomain:
@@ -221,6 +247,50 @@ class TestDockerVersions:
         assert docker_version is None
         assert docker_compose_version is None
 
+    @patch('src.helper._get_docker_binary_mtime', return_value=1234.0)
+    @patch('src.helper.get_docker_client')
+    @patch('subprocess.run')
+    def test_get_docker_versions_cached(self, mock_run, mock_get_docker_client, mock_mtime, monkeypatch, tmp_path):
+        monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+        mock_get_docker_client.return_value.version.return_value = {'Version': '20.10.7'}
+        mock_run.return_value = MagicMock(stdout='docker compose version 1.29.2\n')
+
+        assert get_docker_versions(use_cache=True) == ('20.10.7', '1.29.2')
+        assert get_docker_versions(use_cache=True) == ('20.10.7', '1.29.2')
+
+        mock_run.assert_called_once()
+        mock_get_docker_client.assert_called_once()
+
+    @patch('src.helper._get_docker_binary_mtime')
+    @patch('src.helper.get_docker_client')
+    @patch('subprocess.run')
+    def test_get_docker_versions_cache_invalidated_by_binary(self, mock_run, mock_get_docker_client, mock_mtime,
+                                                             monkeypatch, tmp_path):
+        monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+        mock_get_docker_client.return_value.version.return_value = {'Version': '20.10.7'}
+        mock_run.return_value = MagicMock(stdout='docker compose version 1.29.2\n')
+
+        mock_mtime.return_value = 1234.0
+        get_docker_versions(use_cache=True)
+        mock_mtime.return_value = 5678.0
+        get_docker_versions(use_cache=True)
+
+        assert mock_run.call_count == 2
+
+    @patch('src.helper._get_docker_binary_mtime', return_value=1234.0)
+    @patch('src.helper.get_docker_client')
+    @patch('subprocess.run')
+    def test_get_docker_versions_failure_not_cached(self, mock_run, mock_get_docker_client, mock_mtime, monkeypatch,
+                                                    tmp_path):
+        monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+        mock_get_docker_client.side_effect = DockerException
+        mock_run.return_value = MagicMock(stdout='docker compose version 1.29.2\n')
+
+        assert get_docker_versions(use_cache=True) == (None, '1.29.2')
+        assert get_docker_versions(use_cache=True) == (None, '1.29.2')
+
+        assert mock_run.call_count == 2
+
     @patch('src.helper.get_docker_versions')
     @patch('click.echo')
     def test_all_versions_present(self, mock_echo, mock_get_docker_versions):
@@ -230,3 +300,217 @@ class TestDockerVersions:
         result = runner.invoke(cli)
         mock_echo.assert_not_called()
         assert result.exit_code == 0
+
+
+class TestEnsureDockerRunning:
+
+    @patch('src.helper.get_docker_versions', return_value=(None, None))
+    def test_generate_apply_checks_docker(self, mock_get_docker_versions, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / '.env').write_text('DOMAIN=example.com\nVERSION=17.0\n')
+
+        result = CliRunner().invoke(cli, ['generate', '--apply'])
+
+        assert result.exit_code == 2
+        assert 'Docker and/or Docker Compose are not installed or running.' in result.output
+        assert not (tmp_path / 'docker-compose.yml').exists()
+
+    @patch('src.helper.get_docker_versions')
+    def test_generate_without_apply_skips_check(self, mock_get_docker_versions, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)
+
+        CliRunner().invoke(cli, ['generate'])
+
+        mock_get_docker_versions.assert_not_called()
+
+
+class TestEnsureServicesHealthy:
+
+    @staticmethod
+    def _client(health, events=()):
+        client = MagicMock()
+        client.api.containers.return_value = [{'Names': [f'/{name}'], 'State': 'running', 'Health': {'Status': status}}
+                                              for name, status in health.items()]
+        client.events.return_value = MagicMock(__iter__=lambda self: iter(events))
+        return client
+
+    @staticmethod
+    def _event(name, action):
+        return {'Action': action, 'Actor': {'Attributes': {'name': name}}}
+
+    @patch('src.helper.get_docker_client')
+    def test_already_healthy(self, mock_get_docker_client):
+        mock_get_docker_client.return_value = self._client({'db': 'healthy', 'proxy': 'healthy'})
+
+        timings = ensure_services_healthy(['db', 'proxy'])
+
+        assert timings == {'db': 0.0, 'proxy': 0.0}
+        mock_get_docker_client.return_value.events.return_value.close.assert_called_once()
+
+    @patch('src.helper.get_docker_client')
+    def test_waits_for_events(self, mock_get_docker_client):
+        events = [self._event('db', 'health_status: starting'), self._event('other', 'health_status: healthy'),
+                  self._event('db', 'health_status: healthy'), self._event('proxy', 'health_status: healthy')]
+        mock_get_docker_client.return_value = self._client({'db': 'starting', 'proxy': 'starting'}, events)
+
+        timings = ensure_services_healthy(['db', 'proxy'])
+
+        assert set(timings) == {'db', 'proxy'}
+
+    @patch('src.helper.get_docker_client')
+    def test_unhealthy_event(self, mock_get_docker_client):
+        events = [self._event('db', 'health_status: unhealthy')]
+        mock_get_docker_client.return_value = self._client({'db': 'starting'}, events)
+
+        with pytest.raises(SystemExit) as cm:
+            ensure_services_healthy(['db'])
+        assert cm.value.code == 6
+
+    @patch('src.helper.get_docker_client')
+    def test_service_dies(self, mock_get_docker_client):
+        events = [self._event('db', 'die')]
+        mock_get_docker_client.return_value = self._client({'db': 'starting'}, events)
+
+        with pytest.raises(SystemExit) as cm:
+            ensure_services_healthy(['db'])
+        assert cm.value.code == 5
+
+    @patch('src.helper.get_docker_client')
+    def test_service_not_running(self, mock_get_docker_client):
+        mock_get_docker_client.return_value = self._client({})
+
+        with pytest.raises(SystemExit) as cm:
+            ensure_services_healthy(['db'])
+        assert cm.value.code == 5
+
+    @patch('src.helper.get_docker_client')
+    def test_timeout(self, mock_get_docker_client):
+        # The event stream ends at the deadline without the service becoming healthy
+        mock_get_docker_client.return_value = self._client({'db': 'starting'})
+
+        with pytest.raises(SystemExit) as cm:
+            ensure_services_healthy(['db'])
+        assert cm.value.code == 4
+
+
+class TestLazyImport:
+
+    def test_lazy_import_defers_execution(self, monkeypatch):
+        monkeypatch.delitem(sys.modules, 'colorsys', raising=False)
+
+        module = lazy_import('colorsys')
+
+        assert 'colorsys' not in sys.modules
+        assert module.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+        assert 'colorsys' in sys.modules
+
+    def test_lazy_import_from_threads(self, monkeypatch, tmp_path):
+        # A module that takes a while to execute, threads accessing it during that time must wait for it
+        (tmp_path / 'slow_module.py').write_text('import time\ntime.sleep(0.2)\nvalue = 42\n')
+        monkeypatch.syspath_prepend(str(tmp_path))
+        monkeypatch.delitem(sys.modules, 'slow_module', raising=False)
+        module = lazy_import('slow_module')
+        barrier = threading.Barrier(8)
+
+        def access():
+            barrier.wait()
+            return module.value
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            values = list(executor.map(lambda _: access(), range(8)))
+
+        assert values == [42] * 8
+
+    def test_lazy_import_returns_loaded_module(self):
+        assert lazy_import('socket') is socket
+
+    def test_lazy_import_missing_module(self):
+        with pytest.raises(ModuleNotFoundError):
+            lazy_import('module_that_does_not_exist')
+
+
+class TestDockerClient:
+
+    @patch('docker.from_env')
+    def test_client_is_shared(self, mock_from_env, monkeypatch):
+        monkeypatch.setattr(helper, '_docker_client', None)
+
+        assert get_docker_client() is get_docker_client()
+        mock_from_env.assert_called_once()
+
+    @patch('docker.from_env', side_effect=DockerException)
+    def test_failed_client_is_not_cached(self, mock_from_env, monkeypatch):
+        monkeypatch.setattr(helper, '_docker_client', None)
+
+        with pytest.raises(DockerException):
+            get_docker_client()
+        assert helper._docker_client is None
+
+
+class TestServicesState:
+
+    @patch('src.helper.get_docker_client')
+    def test_get_services_state(self, mock_get_docker_client):
+        mock_get_docker_client.return_value.api.containers.return_value = [
+            {'Names': ['/db'], 'State': 'running', 'Status': 'Up 3 minutes (healthy)'},
+            {'Names': ['/proxy'], 'State': 'running', 'Status': 'Up 5 seconds (health: starting)'},
+            {'Names': ['/live'], 'State': 'running', 'Status': 'Up 2 hours (unhealthy)'},
+            {'Names': ['/kwkhtmltopdf'], 'State': 'exited', 'Status': 'Exited (0) 2 hours ago'},
+            {'Names': ['/pre'], 'State': 'running', 'Status': 'Up 2 hours', 'Health': {'Status': 'healthy'}},
+        ]
+
+        states = get_services_state()
+
+        mock_get_docker_client.return_value.api.containers.assert_called_once_with(all=True)
+        assert states['db'] == ('running', 'healthy')
+        assert states['proxy'] == ('running', 'starting')
+        assert states['live'] == ('running', 'unhealthy')
+        assert states['kwkhtmltopdf'] == ('exited', None)
+        assert states['pre'] == ('running', 'healthy')
+
+    @patch('src.helper.get_docker_client')
+    def test_get_services_state_filtered(self, mock_get_docker_client):
+        mock_get_docker_client.return_value.api.containers.return_value = [
+            {'Names': ['/db'], 'State': 'running', 'Status': 'Up 3 minutes (healthy)'},
+            {'Names': ['/proxy'], 'State': 'running', 'Status': 'Up 3 minutes (healthy)'},
+        ]
+
+        assert get_services_state(['db', 'missing']) == {'db': ('running', 'healthy')}
+
+
+class TestRunProbes:
+
+    def test_run_probes(self):
+        results = run_probes({'first': lambda: 1, 'second': lambda: 'two'})
+
+        assert results['first'].value == 1
+        assert results['second'].value == 'two'
+        assert results['first'].error is None
+        assert results['first'].latency >= 0
+
+    def test_run_probes_concurrently(self):
+        start_time = time.monotonic()
+
+        results = run_probes({name: lambda: time.sleep(0.2) for name in ['first', 'second', 'third']})
+
+        assert time.monotonic() - start_time < 0.5
+        assert all(result.error is None for result in results.values())
+
+    def test_run_probes_timeout(self):
+        start_time = time.monotonic()
+
+        results = run_probes({'slow': lambda: time.sleep(2), 'fast': lambda: True}, timeout=0.1)
+
+        assert time.monotonic() - start_time < 1
+        assert results['slow'].value is None
+        assert results['slow'].error == 'timeout'
+        assert results['fast'].value is True
+
+    def test_run_probes_error(self):
+        def failing_probe():
+            raise socket.gaierror('Name or service not known')
+
+        results = run_probes({'dns': failing_probe})
+
+        assert results['dns'].value is None
+        assert results['dns'].error == 'Name or service not known'
@@ -0,0 +1,137 @@
+import io
+import tarfile
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from src.ComposeManager import ComposeManager
+from src.DockerBackend import configure_container_backend
+from src.EnvManager import EnvManager
+from src.commands.manage_dev_env_command import add_dev_envs, copy_sources
+
+
+@pytest.fixture
+def compose_manager(tmp_path):
+    compose_manager = ComposeManager(str(tmp_path / 'docker-compose.yml'))
+    compose_manager.save()
+    return compose_manager
+
+
+@pytest.fixture
+def env_manager(tmp_path):
+    env_manager = EnvManager(str(tmp_path / '.env'))
+    for key, value in [('DOMAIN', 'example.com'), ('VERSION', '17.0'), ('DEV', '0'), ('MODULE_MODE', 'included'),
+                       ('MASTER_DB_PASSWORD', 'secret')]:
+        env_manager.add_value(key, value)
+    env_manager.save()
+    return env_manager
+
+
+@patch('src.commands.manage_dev_env_command.copy_files_from_container')
+@patch('src.DatabaseManager.DatabaseManager.add_users')
+class TestAddDevEnvs:
+
+    def test_add_multiple(self, mock_add_users, mock_copy, compose_manager, env_manager, tmp_path):
+        with patch.object(compose_manager, 'save', wraps=compose_manager.save) as mock_compose_save, \
+                patch.object(env_manager, 'save', wraps=env_manager.save) as mock_env_save:
+            add_dev_envs(['12', '13', '12'], compose_manager, env_manager)
+
+        mock_compose_save.assert_called_once()
+        mock_env_save.assert_called_once()
+        mock_add_users.assert_called_once()
+        assert list(mock_add_users.call_args.args[0]) == ['odoo_dev_pr12', 'odoo_dev_pr13']
+        assert mock_copy.call_count == 2
+
+        services = ComposeManager(str(tmp_path / 'docker-compose.yml')).services
+        assert 'DB_PASSWORD=${ODOO_DEV_PR12_DB_PASSWORD}' in services['odoo_dev_pr12']['environment']
+        env_data = EnvManager(str(tmp_path / '.env')).env_data
+        assert env_data['ODOO_DEV_PR13_DB_PASSWORD'] == mock_add_users.call_args.args[0]['odoo_dev_pr13']
+
+    def test_existing_environment(self, mock_add_users, mock_copy, compose_manager, env_manager):
+        add_dev_envs(['12'], compose_manager, env_manager)
+        mock_add_users.reset_mock()
+
+        with pytest.raises(SystemExit) as exit_info:
+            add_dev_envs(['13', '12'], compose_manager, env_manager)
+
+        assert exit_info.value.code == 1
+        mock_add_users.assert_not_called()
+        assert 'odoo_dev_pr13' not in compose_manager.services
+
+    def test_failed_copy(self, mock_add_users, mock_copy, compose_manager, env_manager):
+        def copy(service, src, dest, **kwargs):
+            if 'pr13' in dest:
+                raise OSError('copy failed')
+
+        mock_copy.side_effect = copy
+
+        with pytest.raises(SystemExit) as exit_info:
+            add_dev_envs(['12', '13'], compose_manager, env_manager)
+
+        assert exit_info.value.code == 1
+        # The environments stay configured, only the sources are missing
+        assert 'ODOO_DEV_PR13_DB_PASSWORD' in env_manager.env_data
+
+    @patch('src.commands.manage_dev_env_command.SourceCache')
+    def test_overlay_mode(self, mock_source_cache, mock_add_users, mock_copy, compose_manager, env_manager, tmp_path):
+        source_cache = mock_source_cache.return_value
+        source_cache.ensure_base.return_value = 'volumes/source_cache/abc/src'
+        source_cache.configure_volume.side_effect = lambda manager, name, mode, base: manager.set_volume(
+            f'{name}_src', {'driver': 'local'})
+        env_manager.update_value('MODULE_MODE', 'mounted')
+
+        add_dev_envs(['12', '13'], compose_manager, env_manager, source_mode='overlay')
+
+        source_cache.ensure_base.assert_called_once()
+        assert source_cache.provision.call_count == 2
+        mock_copy.assert_not_called()
+        config = ComposeManager(str(tmp_path / 'docker-compose.yml')).config
+        assert 'odoo_dev_pr12_src:/odoo/src/' in config['services']['odoo_dev_pr12']['volumes']
+        assert 'odoo_dev_pr13_src' in config['volumes']
+
+
+class TestCopySources:
+
+    @patch('src.commands.manage_dev_env_command.copy_files_from_container')
+    def test_copy_limit(self, mock_copy):
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def copy(service, src, dest, **kwargs):
+            with lock:
+                running.append(dest)
+                peak.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.remove(dest)
+
+        mock_copy.side_effect = copy
+
+        assert copy_sources([f'odoo_dev_pr{number}' for number in range(8)], copy_limit=3) == []
+        assert mock_copy.call_count == 8
+        assert max(peak) <= 3
+
+    @patch('src.DockerBackend.get_docker_client')
+    def test_sdk_backend(self, mock_get_docker_client, monkeypatch, tmp_path):
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w') as tar:
+            info = tarfile.TarInfo('src/odoo-bin')
+            info.size = 4
+            tar.addfile(info, io.BytesIO(b'odoo'))
+        mock_get_docker_client.return_value.api.get_archive.side_effect = \
+            lambda *args, **kwargs: (iter([archive.getvalue()]), {})
+        monkeypatch.chdir(tmp_path)
+        configure_container_backend('sdk')
+        try:
+            service_names = [f'odoo_dev_pr{number}' for number in range(4)]
+            assert copy_sources(service_names) == []
+        finally:
+            configure_container_backend('cli')
+
+        # The client is created before the copies run
+        assert mock_get_docker_client.call_count == 5
+        for service_name in service_names:
+            assert (tmp_path / 'volumes' / service_name / 'src' / 'odoo-bin').read_bytes() == b'odoo'
@@ -0,0 +1,137 @@
+from unittest.mock import patch
+
+import pytest
+from docker.errors import DockerException
+
+from src.ComposeManager import ComposeManager
+from src.EnvManager import EnvManager
+from src.Services import OdooComposeService
+from src.pgbouncer import render_ini, render_userlist, get_pool_sizes, get_passwords, apply_db_host, write_config, \
+    update_config, reload, get_transaction_pooled_services
+from src.sizing import HostResources, size_services, get_max_connections, get_postgres_connections, \
+    POOLED_DB_MAXCONN, DB_CONNECTION_FRACTION
+
+
+@pytest.fixture
+def env_manager(tmp_path):
+    env_manager = EnvManager(str(tmp_path / '.env'))
+    for key, value in [('PGBOUNCER', '1'), ('SIZING', 'off'), ('LIVE_DB_PASSWORD', 'live_secret'),
+                       ('PRE_DB_PASSWORD', 'pre_secret'), ('ODOO_DEV_PR12_DB_PASSWORD', 'dev_secret')]:
+        env_manager.add_value(key, value)
+    return env_manager
+
+
+class TestConfig:
+
+    def test_pool_modes(self):
+        ini = render_ini(['live', 'pre', 'odoo_dev_pr12'])
+
+        assert 'live = host=db port=5432 dbname=live pool_mode=session pool_size=20' in ini
+        assert 'odoo_dev_pr12 = host=db port=5432 dbname=odoo_dev_pr12 pool_mode=transaction' in ini
+        assert 'auth_file = /etc/pgbouncer/userlist.txt' in ini
+
+    def test_pool_sizes_fit_into_postgres(self):
+        service_names = ['live', 'pre'] + [f'odoo_dev_pr{number}' for number in range(5)]
+        sizes = size_services(service_names, HostResources(8, 32 * 1024 ** 3))
+
+        pool_sizes = get_pool_sizes(service_names, sizes, max_connections=100)
+
+        assert pool_sizes['live'] == sizes['live'].processes * sizes['live'].db_maxconn
+        assert sum(pool_sizes.values()) <= 100
+
+    @pytest.mark.parametrize('dev_environments', [5, 50])
+    def test_pool_sizes_with_many_environments(self, dev_environments):
+        service_names = ['live', 'pre'] + [f'odoo_dev_pr{number}' for number in range(dev_environments)]
+
+        pool_sizes = get_pool_sizes(service_names, max_connections=100)
+
+        assert sum(pool_sizes.values()) <= 100
+        assert min(pool_sizes.values()) >= 1
+
+    def test_sizing_with_pooler(self):
+        service_names = ['live', 'pre'] + [f'odoo_dev_pr{number}' for number in range(20)]
+        pooled_services = get_transaction_pooled_services(service_names)
+        host = HostResources(16, 64 * 1024 ** 3)
+        direct = size_services(service_names, host)
+
+        sizes = size_services(service_names, host, pooled_services=pooled_services)
+        max_connections = get_max_connections(get_postgres_connections(sizes, pooled_services))
+        pool_sizes = get_pool_sizes(service_names, sizes, max_connections)
+
+        assert pooled_services == service_names[1:]
+        # The pooled services no longer take the workers of live for their connections
+        assert sizes['live'].workers > direct['live'].workers
+        assert max_connections == 100
+        assert sizes['pre'].db_maxconn == POOLED_DB_MAXCONN
+        assert sum(pool_sizes.values()) <= max_connections * DB_CONNECTION_FRACTION
+
+    def test_pool_sizes_do_not_fit(self):
+        with pytest.raises(ValueError):
+            get_pool_sizes(['live'] + [f'odoo_dev_pr{number}' for number in range(100)], max_connections=100)
+
+    def test_userlist(self, env_manager):
+        passwords = get_passwords(env_manager, ['live', 'pre', 'odoo_dev_pr12', 'odoo_dev_pr13'])
+
+        assert render_userlist(passwords).splitlines() == [
+            '"live" "live_secret"',
+            '"pre" "pre_secret"',
+            '"odoo_dev_pr12" "dev_secret"',
+        ]
+        assert render_userlist({'role': 'pass"word'}) == '"role" "pass""word"\n'
+
+    def test_write_config(self, env_manager, tmp_path):
+        path = str(tmp_path / 'pgbouncer')
+
+        assert write_config(env_manager, ['live'], path=path)
+        assert (tmp_path / 'pgbouncer' / 'userlist.txt').read_text() == '"live" "live_secret"\n'
+        # Unchanged files are not written again
+        assert not write_config(env_manager, ['live'], path=path)
+
+    @patch('src.pgbouncer.reload')
+    @patch('src.pgbouncer.write_config', return_value=True)
+    def test_update_config(self, mock_write_config, mock_reload, env_manager, tmp_path):
+        compose_manager = ComposeManager(str(tmp_path / 'docker-compose.yml'))
+        for name in ['live', 'odoo_dev_pr12']:
+            compose_manager.add_service(OdooComposeService(name, 'example.com', 'secret', 'admin', '17.0'))
+
+        assert update_config(compose_manager, env_manager)
+
+        assert mock_write_config.call_args.args[1] == ['live', 'odoo_dev_pr12']
+        mock_reload.assert_called_once()
+
+    @patch('src.pgbouncer.write_config')
+    def test_update_config_disabled(self, mock_write_config, env_manager, tmp_path):
+        env_manager.update_value('PGBOUNCER', '0')
+
+        assert not update_config(ComposeManager(str(tmp_path / 'docker-compose.yml')), env_manager)
+        mock_write_config.assert_not_called()
+
+
+class TestReload:
+
+    @patch('src.pgbouncer.get_container_backend')
+    def test_reload(self, mock_get_container_backend):
+        mock_get_container_backend.return_value.exec.return_value.returncode = 0
+
+        assert reload()
+        mock_get_container_backend.return_value.exec.assert_called_once_with('pgbouncer', ['kill', '-HUP', '1'])
+
+    @patch('src.pgbouncer.get_container_backend')
+    def test_docker_not_running(self, mock_get_container_backend):
+        mock_get_container_backend.return_value.exec.side_effect = DockerException('Connection refused')
+
+        assert not reload()
+
+
+class TestApplyDbHost:
+
+    def test_switch_host(self):
+        service = OdooComposeService('odoo_dev_pr12', 'example.com', 'secret', 'admin', '17.0').to_dict()
+
+        apply_db_host(service, 'pgbouncer')
+        assert 'DB_HOST=pgbouncer' in service['environment']
+        assert 'pgbouncer' in service['depends_on']
+
+        apply_db_host(service, 'db')
+        assert 'DB_HOST=db' in service['environment']
+        assert 'pgbouncer' not in service['depends_on']
@@ -1,5 +1,6 @@
 from src.Services import ComposeService, ProxyComposeService, PostgresComposeService, KwkhtmltopdfComposeService, \
-    IMAGE_KWKHTMLTOPDF, POSTGRES_DB, OdooComposeService
+    IMAGE_KWKHTMLTOPDF, POSTGRES_DB, OdooComposeService, PgBouncerComposeService
+from src.sizing import HostResources, size_services, tune_postgres
 
 
 class TestComposeService:
@@ -55,15 +56,46 @@ class TestOdooComposeService:
         assert odoo_service.to_dict()['image'] == 'registry.hav.media/aura_odoo/odoo:16.0'
         assert './volumes/odoo/src:/odoo/src/' in odoo_service.to_dict()['volumes']
 
+    def test_with_source_volume(self):
+        odoo_service = OdooComposeService('odoo', 'odoo.test.com', 'db_pass', 'admin_pass', '16.0',
+                                          module_mode='mounted', source_volume='odoo_src')
+        assert 'odoo_src:/odoo/src/' in odoo_service.to_dict()['volumes']
+        assert './volumes/odoo/src:/odoo/src/' not in odoo_service.to_dict()['volumes']
+
+    def test_with_sizing(self):
+        sizing = size_services(['odoo'], HostResources(4, 8 * 1024 ** 3))['odoo']
+        odoo_service = OdooComposeService('odoo', 'odoo.test.com', 'db_pass', 'admin_pass', '16.0', sizing=sizing)
+        assert f'WORKERS={sizing.workers}' in odoo_service.to_dict()['environment']
+        assert odoo_service.to_dict()['deploy'] == sizing.deploy()
+
+    def test_with_db_host(self):
+        odoo_service = OdooComposeService('odoo', 'odoo.test.com', 'db_pass', 'admin_pass', '16.0', db_host='pgbouncer')
+        assert 'DB_HOST=pgbouncer' in odoo_service.to_dict()['environment']
+        assert 'pgbouncer' in odoo_service.to_dict()['depends_on']
+
 class TestPostgresComposeService:
 
     def test_init(self):
         postgres_service = PostgresComposeService('postgres')
         assert f'POSTGRES_DB={POSTGRES_DB}' in postgres_service.to_dict()['environment']
 
+    def test_with_tuning(self):
+        tuning = tune_postgres(HostResources(4, 8 * 1024 ** 3))
+        postgres_service = PostgresComposeService('db', tuning=tuning)
+        assert postgres_service.to_dict()['command'] == tuning.command()
+        assert postgres_service.to_dict()['shm_size'] == f'{tuning.shm_size // (1024 * 1024)}m'
+
 
 class TestKwkhtmltopdfComposeService:
 
     def test_init(self):
         kwk_service = KwkhtmltopdfComposeService('kwk')
         assert kwk_service.to_dict()['image'] == IMAGE_KWKHTMLTOPDF
+
+
+class TestPgBouncerComposeService:
+
+    def test_init(self):
+        pgbouncer_service = PgBouncerComposeService('pgbouncer')
+        assert './volumes/pgbouncer:/etc/pgbouncer:ro' in pgbouncer_service.to_dict()['volumes']
+        assert pgbouncer_service.to_dict()['depends_on'] == ['db']
@@ -0,0 +1,162 @@
+from unittest.mock import patch
+
+import pytest
+
+from src.sizing import HostResources, size_services, get_shares, apply_sizing, render_sizing, get_host_resources, \
+    MAX_LIMIT_MEMORY, MIN_SHM_SIZE, RESERVED_MEMORY_FRACTION, DB_CONNECTION_FRACTION, tune_postgres, \
+    get_expected_connections
+
+GB = 1024 ** 3
+
+
+class TestShares:
+
+    def test_priorities(self):
+        shares = get_shares(['live', 'pre', 'odoo_dev_pr1', 'odoo_dev_pr2'])
+
+        assert shares['live'] == pytest.approx(0.5)
+        assert shares['pre'] == pytest.approx(0.2)
+        assert shares['odoo_dev_pr1'] == pytest.approx(0.15)
+        assert sum(shares.values()) == pytest.approx(1)
+
+    def test_without_dev_environments(self):
+        shares = get_shares(['live', 'pre'])
+
+        assert shares['live'] == pytest.approx(0.5 / 0.7)
+        assert sum(shares.values()) == pytest.approx(1)
+
+
+class TestSizeServices:
+
+    def test_large_host(self):
+        sizes = size_services(['live', 'pre', 'odoo_dev_pr1'], HostResources(16, 64 * GB))
+
+        assert sizes['live'].workers > sizes['pre'].workers >= sizes['odoo_dev_pr1'].workers
+        assert sizes['live'].limit_memory_hard <= MAX_LIMIT_MEMORY
+        assert sizes['live'].limit_memory_soft < sizes['live'].limit_memory_hard
+        # The limits of all processes fit into the share of the service
+        for sizing in sizes.values():
+            assert sizing.limit_memory_hard * sizing.processes <= sizing.memory
+
+    def test_small_host_keeps_one_worker(self):
+        sizes = size_services(['live', 'pre'] + [f'odoo_dev_pr{number}' for number in range(20)],
+                              HostResources(2, 4 * GB))
+
+        for sizing in sizes.values():
+            assert sizing.workers == 1
+            assert sizing.limit_memory_hard * sizing.processes <= sizing.memory
+
+    @pytest.mark.parametrize('host, dev_environments', [
+        (HostResources(16, 64 * GB), 20),
+        (HostResources(16, 64 * GB), 0),
+        (HostResources(4, 8 * GB), 5),
+    ])
+    def test_memory_fits_into_host(self, host, dev_environments):
+        sizes = size_services(['live', 'pre'] + [f'odoo_dev_pr{number}' for number in range(dev_environments)], host)
+
+        assert sum(sizing.memory for sizing in sizes.values()) <= host.memory * (1 - RESERVED_MEMORY_FRACTION)
+        for sizing in sizes.values():
+            assert sizing.limit_memory_hard * sizing.processes <= sizing.memory
+
+    def test_db_connections_fit_into_postgres(self):
+        sizes = size_services(['live', 'pre', 'odoo_dev_pr1'], HostResources(4, 16 * GB), max_connections=100)
+
+        assert sum(sizing.processes * sizing.db_maxconn for sizing in sizes.values()) <= 100
+
+    def test_workers_are_cut_for_db_connections(self):
+        service_names = ['live', 'pre'] + [f'odoo_dev_pr{number}' for number in range(5)]
+        uncut = size_services(service_names, HostResources(16, 64 * GB), max_connections=1000)
+
+        sizes = size_services(service_names, HostResources(16, 64 * GB), max_connections=100)
+
+        assert sum(sizing.processes * sizing.db_maxconn for sizing in sizes.values()) <= 100 * DB_CONNECTION_FRACTION
+        # The dev environments give up their workers before live
+        assert sizes['odoo_dev_pr0'].workers == 1
+        assert sizes['live'].workers > 1
+        assert sum(sizing.workers for sizing in sizes.values()) < sum(sizing.workers for sizing in uncut.values())
+
+
+class TestSizing:
+
+    def test_environment_and_deploy(self):
+        sizing = size_services(['live'], HostResources(4, 8 * GB))['live']
+
+        assert f'WORKERS={sizing.workers}' in sizing.environment()
+        assert f'LIMIT_MEMORY_HARD={sizing.limit_memory_hard}' in sizing.environment()
+        assert sizing.deploy()['resources']['limits']['memory'].endswith('M')
+
+    def test_apply_sizing_replaces_old_values(self):
+        service = {'environment': ['DB_NAME=odoo_dev_pr1', 'WORKERS=9']}
+        sizing = size_services(['odoo_dev_pr1'], HostResources(1, 2 * GB))['odoo_dev_pr1']
+
+        apply_sizing(service, sizing)
+
+        assert [variable for variable in service['environment'] if variable.startswith('WORKERS=')] == \
+               [f'WORKERS={sizing.workers}']
+        assert 'DB_NAME=odoo_dev_pr1' in service['environment']
+        assert service['deploy'] == sizing.deploy()
+
+    def test_render(self):
+        host = HostResources(4, 8 * GB)
+
+        output = render_sizing(size_services(['live', 'pre'], host), host)
+
+        assert output.splitlines()[0] == 'Sizing for 4 CPUs and 8.0 GB memory:'
+        assert 'live' in output.splitlines()[1]
+
+
+class TestHostResources:
+
+    @patch('src.sizing._read_cgroup_memory_limit', return_value=GB)
+    def test_cgroup_limit(self, mock_read_cgroup_memory_limit):
+        host = get_host_resources()
+
+        assert host.memory <= GB
+        assert host.cpus >= 1
+
+
+class TestTunePostgres:
+
+    def test_settings(self):
+        tuning = tune_postgres(HostResources(8, 32 * GB))
+
+        assert tuning.settings['shared_buffers'] == '2048MB'
+        assert tuning.settings['effective_cache_size'] == '6144MB'
+        assert tuning.settings['max_parallel_workers_per_gather'] == 4
+        assert tuning.shm_size >= 2 * GB
+        assert tuning.command()[:3] == ['postgres', '-c', 'max_connections=100']
+
+    def test_small_host_has_no_parallel_workers(self):
+        tuning = tune_postgres(HostResources(2, 2 * GB))
+
+        assert 'max_parallel_workers' not in tuning.settings
+        assert tuning.shm_size == MIN_SHM_SIZE
+
+    def test_profiles(self):
+        host = HostResources(8, 32 * GB)
+        oltp = tune_postgres(host, profile='oltp')
+        mixed = tune_postgres(host, profile='mixed')
+
+        assert int(oltp.settings['work_mem'][:-2]) == pytest.approx(2 * int(mixed.settings['work_mem'][:-2]), abs=1)
+        assert oltp.settings['max_wal_size'] == '8GB'
+
+        with pytest.raises(ValueError):
+            tune_postgres(host, profile='dw')
+
+    def test_expected_connections(self):
+        host = HostResources(8, 32 * GB)
+
+        assert tune_postgres(host, expected_connections=20).settings['work_mem'] != \
+               tune_postgres(host).settings['work_mem']
+
+    def test_max_connections_fit_expected_connections(self):
+        host = HostResources(16, 64 * GB)
+        sizes = size_services(['live', 'pre'] + [f'odoo_dev_pr{number}' for number in range(20)], host)
+        expected_connections = get_expected_connections(sizes)
+
+        tuning = tune_postgres(host, expected_connections=expected_connections)
+
+        assert expected_connections > 100
+        assert expected_connections <= tuning.settings['max_connections'] * DB_CONNECTION_FRACTION
+        # The additional connections take their memory from the buffers
+        assert int(tuning.settings['shared_buffers'][:-2]) < int(tune_postgres(host).settings['shared_buffers'][:-2])
@@ -0,0 +1,90 @@
+import os
+import stat
+from unittest.mock import patch
+
+import pytest
+
+from src.ComposeManager import ComposeManager
+from src.SourceCache import SourceCache, SOURCE_MODE_HARDLINK, SOURCE_MODE_OVERLAY, SOURCE_MODE_COPY, \
+    get_source_volume
+
+
+@pytest.fixture
+def image_id():
+    with patch('src.DockerBackend.get_container_backend') as mock_get_container_backend:
+        mock_get_container_backend.return_value.image_id.return_value = 'sha256:abc123'
+        yield mock_get_container_backend.return_value.image_id
+
+
+@pytest.fixture
+def mock_copy():
+    def copy(service, src, dest, **kwargs):
+        os.makedirs(os.path.join(dest, 'odoo'))
+        with open(os.path.join(dest, 'odoo', 'release.py'), 'w') as f:
+            f.write('version = 17')
+
+    with patch('src.SourceCache.copy_files_from_container', side_effect=copy) as mock_copy:
+        yield mock_copy
+
+
+@pytest.fixture
+def source_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return SourceCache()
+
+
+class TestSourceCache:
+
+    def test_base_is_extracted_once(self, source_cache, image_id, mock_copy):
+        base = source_cache.ensure_base()
+
+        assert base.startswith(os.path.join(source_cache.path, 'abc123'))
+        assert os.path.isfile(os.path.join(base, 'odoo', 'release.py'))
+        # Files of the shared base are read only
+        assert not os.stat(os.path.join(base, 'odoo', 'release.py')).st_mode & stat.S_IWUSR
+        assert source_cache.ensure_base() == base
+        mock_copy.assert_called_once()
+
+    def test_interrupted_extraction_is_repeated(self, source_cache, image_id, mock_copy):
+        copy = mock_copy.side_effect
+        mock_copy.side_effect = OSError('copy failed')
+        with pytest.raises(OSError):
+            source_cache.ensure_base()
+
+        mock_copy.side_effect = copy
+        assert os.path.isfile(os.path.join(source_cache.ensure_base(), 'odoo', 'release.py'))
+        assert mock_copy.call_count == 2
+
+    def test_new_image_gets_new_base(self, source_cache, image_id, mock_copy):
+        base = source_cache.ensure_base()
+        image_id.return_value = 'sha256:def456'
+
+        assert source_cache.ensure_base() != base
+        assert mock_copy.call_count == 2
+
+    def test_exclude_patterns_get_own_base(self, source_cache, image_id):
+        assert SourceCache(exclude=['tests']).base_path('sha256:abc') != source_cache.base_path('sha256:abc')
+
+    def test_provision_hardlink(self, source_cache, image_id, mock_copy):
+        base = source_cache.ensure_base()
+
+        source_cache.provision('odoo_dev_pr12', SOURCE_MODE_HARDLINK, base)
+
+        linked_file = os.path.join('volumes', 'odoo_dev_pr12', 'src', 'odoo', 'release.py')
+        assert os.path.samefile(linked_file, os.path.join(base, 'odoo', 'release.py'))
+
+    def test_provision_overlay(self, source_cache, image_id, mock_copy, tmp_path):
+        compose_manager = ComposeManager(str(tmp_path / 'docker-compose.yml'))
+        base = source_cache.ensure_base()
+
+        source_cache.provision('odoo_dev_pr12', SOURCE_MODE_OVERLAY, base)
+        source_cache.configure_volume(compose_manager, 'odoo_dev_pr12', SOURCE_MODE_OVERLAY, base)
+
+        assert os.path.isdir(os.path.join('volumes', 'odoo_dev_pr12', 'src_overlay', 'upper'))
+        assert get_source_volume(compose_manager, 'odoo_dev_pr12') == 'odoo_dev_pr12_src'
+        options = compose_manager.config['volumes']['odoo_dev_pr12_src']['driver_opts']['o']
+        assert f'lowerdir={os.path.abspath(base)}' in options
+
+        source_cache.configure_volume(compose_manager, 'odoo_dev_pr12', SOURCE_MODE_COPY)
+        assert get_source_volume(compose_manager, 'odoo_dev_pr12') is None
+        assert 'volumes' not in compose_manager.config
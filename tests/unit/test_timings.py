@@ -0,0 +1,104 @@
+import json
+import threading
+from unittest.mock import patch
+
+import pytest
+from click.testing import CliRunner
+
+from src import timings
+from src.main import cli
+
+
+@pytest.fixture(autouse=True)
+def reset_timings():
+    timings.reset()
+    yield
+    timings.reset()
+
+
+class TestSpans:
+
+    def test_nested_spans(self):
+        with timings.span('refresh') as refresh:
+            with timings.span('dump') as dump:
+                dump.bytes = 1024
+            with timings.span('restore'):
+                pass
+
+        root = timings.get_root()
+        assert root.children == [refresh]
+        assert [child.name for child in refresh.children] == ['dump', 'restore']
+        assert refresh.seconds >= dump.seconds
+
+    def test_span_is_closed_on_error(self):
+        with pytest.raises(ValueError):
+            with timings.span('failing') as failing:
+                raise ValueError
+
+        assert failing.end is not None
+        with timings.span('next'):
+            pass
+        assert [child.name for child in timings.get_root().children] == ['failing', 'next']
+
+    @patch('click.echo')
+    def test_step(self, mock_echo):
+        with timings.step('Stopping environment'):
+            pass
+
+        mock_echo.assert_called_once_with('* Stopping environment')
+        assert timings.get_root().children[0].name == 'Stopping environment'
+
+    def test_spans_of_other_threads_are_attached_to_root(self):
+        with timings.span('main'):
+            thread = threading.Thread(target=lambda: timings.span('worker').__enter__())
+            thread.start()
+            thread.join()
+
+        assert [child.name for child in timings.get_root().children] == ['main', 'worker']
+
+
+class TestRender:
+
+    def test_render_tree(self):
+        with timings.span('copy filestore') as current:
+            current.bytes = 2 * 1024 * 1024
+            with timings.span('sync'):
+                pass
+
+        lines = timings.render_tree().splitlines()
+
+        assert lines[0].startswith('total')
+        assert lines[1].startswith('  copy filestore')
+        assert lines[1].endswith('2.0 MB')
+        assert lines[2].startswith('    sync')
+
+    def test_render_json(self):
+        with timings.span('dump') as current:
+            current.bytes = 10
+
+        data = json.loads(timings.render_json())
+
+        assert data['name'] == 'total'
+        assert data['children'][0]['name'] == 'dump'
+        assert data['children'][0]['bytes'] == 10
+        assert 'children' not in data['children'][0]
+
+
+class TestCli:
+
+    # generate exits early without an initialized setup, the timings are reported anyway
+
+    def test_timings_json(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+
+        result = CliRunner().invoke(cli, ['--timings-json', 'timings.json', 'generate'])
+
+        assert result.exit_code == 1
+        assert json.loads((tmp_path / 'timings.json').read_text())['name'] == 'total'
+
+    def test_timings_tree(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+
+        result = CliRunner().invoke(cli, ['--timings', 'generate'])
+
+        assert 'total' in result.output
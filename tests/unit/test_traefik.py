@@ -0,0 +1,79 @@
+import base64
+import hashlib
+
+from src.ComposeManager import load_yaml
+from src.EnvManager import EnvManager
+from src.Services import OdooComposeService, ProxyComposeService
+from src.commands.generate_command import write_proxy_config
+from src.traefik import render_dynamic_config, write_dynamic_config, hash_password, ASSETS_CACHE_CONTROL
+
+
+def get_middlewares(services: list) -> set:
+    middlewares = set()
+    for service in services:
+        for label in service.to_dict().get('labels', []):
+            key, _, value = label.partition('=')
+            if key.endswith('.middlewares'):
+                middlewares.update(value.split(','))
+    return middlewares
+
+
+class TestDynamicConfig:
+
+    def test_defines_referenced_middlewares(self):
+        services = [ProxyComposeService('proxy', 'example.com', dashboard=True),
+                    OdooComposeService('live', 'example.com', 'secret', 'admin', '17.0', basic_auth=False),
+                    OdooComposeService('pre', 'pre.example.com', 'secret', 'admin', '17.0')]
+        defined = render_dynamic_config({'admin': 'secret'})['http']['middlewares']
+
+        assert {middleware.removesuffix('@file') for middleware in get_middlewares(services)} <= set(defined)
+
+    def test_middlewares(self):
+        middlewares = render_dynamic_config({'admin': 'secret'}, https=False)['http']['middlewares']
+
+        assert middlewares['gzip']['compress']['minResponseBodyBytes'] > 0
+        assert 'image/png' in middlewares['gzip']['compress']['excludedContentTypes']
+        assert middlewares['assetsCache']['headers']['customResponseHeaders']['Cache-Control'] == ASSETS_CACHE_CONTROL
+        assert middlewares['websocketHeader']['headers']['customRequestHeaders']['X-Forwarded-Proto'] == 'http'
+        assert middlewares['basic_auth']['basicAuth']['users'] == [f'admin:{hash_password("secret")}']
+
+    def test_hash_password(self):
+        assert hash_password('secret') == '{SHA}' + base64.b64encode(hashlib.sha1(b'secret').digest()).decode()
+
+    def test_write_only_changes(self, tmp_path):
+        config = render_dynamic_config({'admin': 'secret'})
+
+        assert write_dynamic_config(config, str(tmp_path))
+        assert load_yaml((tmp_path / 'dynamic.yml').read_text()) == config
+        assert not write_dynamic_config(config, str(tmp_path))
+
+
+class TestStaticRouters:
+
+    def test_labels(self):
+        labels = OdooComposeService('pre', 'pre.example.com', 'secret', 'admin', '17.0').to_dict()['labels']
+
+        assert 'traefik.http.routers.pre-assets.rule=PathPrefix(`/web/assets/`) && ' \
+               '!PathPrefix(`/web/assets/debug/`) && Host(`pre.example.com`)' in labels
+        assert 'traefik.http.routers.pre-assets.priority=10' in labels
+        assert 'traefik.http.routers.pre-assets.middlewares=basic_auth@file,assetsCache@file,gzip@file' in labels
+        assert 'traefik.http.routers.pre-static.rule=PathPrefix(`/{module:[^/]+}/static/`) && ' \
+               'Host(`pre.example.com`)' in labels
+        assert 'traefik.http.routers.pre-static.service=pre' in labels
+        assert 'traefik.http.routers.pre-static.middlewares=basic_auth@file,staticCache@file,gzip@file' in labels
+        assert 'traefik.http.routers.pre-static.tls.certresolver=main_resolver' in labels
+
+
+class TestWriteProxyConfig:
+
+    def test_password_is_kept(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        env_manager = EnvManager(str(tmp_path / '.env'))
+
+        write_proxy_config(env_manager)
+        password = EnvManager(str(tmp_path / '.env')).env_data['BASIC_AUTH_PASSWORD']
+        write_proxy_config(EnvManager(str(tmp_path / '.env')))
+
+        assert EnvManager(str(tmp_path / '.env')).env_data['BASIC_AUTH_PASSWORD'] == password
+        config = load_yaml((tmp_path / 'volumes' / 'proxy' / 'config' / 'dynamic.yml').read_text())
+        assert config['http']['middlewares']['basic_auth']['basicAuth']['users'] == [f'admin:{hash_password(password)}']